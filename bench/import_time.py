@@ -0,0 +1,65 @@
+"""
+Measures, in fresh interpreters, how long ``import kvcache`` and building
+a cache for each scheme take, and which third-party driver modules that
+drags in. Only the driver of the scheme being built should show up.
+
+    python bench/import_time.py [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DRIVERS = ['MySQLdb', 'django', 'storages', 'boto', 'redis', 'memcache',
+           'pylibmc', 'pymongo', 'bson', 'leveldb', 'dbm', 'lz4', 'msgpack']
+
+URIS = [None, 'locmem://', 'dummy://', 'sqlite:///tmp/kvcache-import-time.db',
+        'shm://kvcache-import-time', 'redis://127.0.0.1:6379',
+        'mysql://127.0.0.1/test', 'memcached://127.0.0.1:11211']
+
+PROBE = r'''
+import json, sys, time
+sys.path.insert(0, %(root)r)
+start = time.time()
+import kvcache
+imported = time.time()
+error = None
+if %(uri)r:
+    try:
+        kvcache.get_cache(%(uri)r)
+    except Exception, e:
+        error = '%%s: %%s' %% (type(e).__name__, e)
+built = time.time()
+print json.dumps({
+    'import': imported - start,
+    'get_cache': built - imported,
+    'drivers': sorted(m for m in %(drivers)r if m in sys.modules),
+    'error': error,
+})
+'''
+
+
+def probe(uri):
+    code = PROBE % {'root': ROOT, 'uri': uri, 'drivers': DRIVERS}
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(out)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print '%-40s %10s %10s  %s' % ('uri', 'import ms', 'build ms', 'drivers loaded')
+    for uri in URIS:
+        results = [probe(uri) for i in range(runs)]
+        best_import = min(r['import'] for r in results) * 1000
+        best_build = min(r['get_cache'] for r in results) * 1000
+        last = results[-1]
+        note = ', '.join(last['drivers']) or '-'
+        if last['error']:
+            note += '  (%s)' % last['error']
+        print '%-40s %10.2f %10.2f  %s' % (uri or '(import only)', best_import, best_build, note)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark of the key pipeline: make_key() plus validate_key() as
+every cache operation runs them, compared with the previous per-call
+formatting and per-character validation.
+
+    python bench/keys.py [iterations]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time
+
+from kvcache import get_cache
+from kvcache.backends.base import default_key_func, MEMCACHE_MAX_KEY_LENGTH
+
+KEYS = {
+    'short': 'user:42',
+    'medium': 'fragment:/products/list?page=3&sort=price:desc',
+    'long': 'x' * 300,
+}
+
+
+def legacy(cache, key):
+    key = default_key_func(key, cache.key_prefix, cache.version)
+    if len(key) > MEMCACHE_MAX_KEY_LENGTH:
+        pass
+    for char in key:
+        if ord(char) < 33 or ord(char) == 127:
+            pass
+    return key
+
+
+def current(cache, key):
+    key = cache.make_key(key)
+    cache.validate_key(key)
+    return key
+
+
+def timeit(func, cache, key, iterations):
+    start = time.time()
+    for i in xrange(iterations):
+        func(cache, key)
+    return (time.time() - start) / iterations * 1e6
+
+
+def main():
+    import warnings
+    warnings.simplefilter('ignore')
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    plain = get_cache('locmem://bench-keys')
+    hashed = get_cache('locmem://bench-keys?hash_long_keys=1')
+    print '%8s %10s %10s %10s' % ('key', 'legacy us', 'new us', 'hashed us')
+    for name, key in sorted(KEYS.items()):
+        print '%8s %10.3f %10.3f %10.3f' % (
+            name, timeit(legacy, plain, key, iterations),
+            timeit(current, plain, key, iterations),
+            timeit(current, hashed, key, iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares LocMemCache get throughput with and without the reader lock as the
+number of threads grows.
+
+    python bench/locmem_reads.py [seconds-per-run]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import threading
+import time
+
+from kvcache import get_cache
+
+KEYS = ['key%d' % i for i in range(1000)]
+THREADS = [1, 2, 4, 8, 16, 32]
+
+
+def worker(cache, deadline, counts):
+    n = 0
+    get = cache.get
+    keys = KEYS
+    while time.time() < deadline:
+        for k in keys:
+            get(k)
+        n += len(keys)
+    counts.append(n)
+
+
+def run(uri, threads, seconds):
+    cache = get_cache(uri)
+    for k in KEYS:
+        cache.set(k, k)
+    counts = []
+    deadline = time.time() + seconds
+    workers = [threading.Thread(target=worker, args=(cache, deadline, counts))
+               for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts) / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print '%8s %14s %16s' % ('threads', 'rwlock gets/s', 'lock-free gets/s')
+    for threads in THREADS:
+        locked = run('locmem://bench-locked', threads, seconds)
+        lock_free = run('locmem://bench-lockfree?lock_free_reads=1', threads, seconds)
+        print '%8d %14d %16d' % (threads, locked, lock_free)
+
+
+if __name__ == '__main__':
+    main()
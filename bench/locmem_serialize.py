@@ -0,0 +1,54 @@
+"""
+Compares LocMemCache set/get cost with pickling against storing references,
+with each copy-on-read policy, across value sizes.
+
+    python bench/locmem_serialize.py [iterations]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time
+
+from kvcache import get_cache
+
+MODES = [
+    ('pickle', 'locmem://bench-pickle'),
+    ('reference', 'locmem://bench-ref?serialize=0'),
+    ('shallow', 'locmem://bench-shallow?serialize=0&copy_on_read=shallow'),
+    ('deep', 'locmem://bench-deep?serialize=0&copy_on_read=deep'),
+]
+
+SIZES = [1, 10, 100, 1000, 10000]
+
+
+def make_value(n):
+    return dict(('field%d' % i, {'id': i, 'tags': ['a', 'b'], 'name': 'x' * 20})
+                for i in range(n))
+
+
+def run(uri, value, iterations):
+    cache = get_cache(uri)
+    start = time.time()
+    for i in xrange(iterations):
+        cache.set('key', value)
+    set_time = time.time() - start
+    start = time.time()
+    for i in xrange(iterations):
+        cache.get('key')
+    get_time = time.time() - start
+    return set_time / iterations * 1e6, get_time / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print '%8s %10s %12s %12s' % ('items', 'mode', 'set us/op', 'get us/op')
+    for size in SIZES:
+        value = make_value(size)
+        n = max(iterations * 10 // size, 5)
+        for name, uri in MODES:
+            set_us, get_us = run(uri, value, n)
+            print '%8d %10s %12.1f %12.1f' % (size, name, set_us, get_us)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares the encoded size and encode/decode time of every serializer
+available to BaseCache.encode/decode on a few typical cache values.
+
+    python bench/serializers.py [iterations]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time
+
+from kvcache.utils.serializers import SERIALIZERS, PickleSerializer
+
+VALUES = {
+    'int': 123456,
+    'short str': 'hello world',
+    'list': range(100),
+    'row': {'id': 1, 'name': 'alice', 'email': 'alice@example.com',
+            'score': 12.5, 'tags': ['a', 'b', 'c'], 'active': True},
+    'rows': [{'id': i, 'name': 'user%d' % i, 'score': i * 1.5, 'tags': ['x', 'y']}
+             for i in range(200)],
+}
+
+
+def serializers():
+    result = [('pickle-0', PickleSerializer(0))]
+    for name, cls in sorted(SERIALIZERS.items()):
+        try:
+            result.append((name, cls()))
+        except ImportError:
+            print '%s: not installed, skipped' % name
+    return result
+
+
+def timeit(func, arg, iterations):
+    start = time.time()
+    for i in xrange(iterations):
+        func(arg)
+    return (time.time() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    available = serializers()
+    print '%10s %10s %8s %12s %12s' % ('value', 'serializer', 'bytes', 'dumps us', 'loads us')
+    for value_name, value in sorted(VALUES.items()):
+        for name, serializer in available:
+            try:
+                data = serializer.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            dumps = timeit(serializer.dumps, value, iterations)
+            loads = timeit(serializer.loads, data, iterations)
+            print '%10s %10s %8d %12.2f %12.2f' % (value_name, name, len(data), dumps, loads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Measures what recording operation statistics costs per call on the
+cheapest backend, where it matters most.
+
+    python bench/stats_overhead.py [seconds-per-run]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time
+
+from kvcache import get_cache
+
+KEYS = ['key%d' % i for i in range(1000)]
+
+
+def run(uri, seconds):
+    cache = get_cache(uri)
+    for k in KEYS[::2]:
+        cache.set(k, k)
+    n = 0
+    get = cache.get
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for k in KEYS:
+            get(k)
+        n += len(KEYS)
+    return cache, n / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print '%8s %12s %12s' % ('stats', 'gets/s', 'us/get')
+    for flag in ('0', '1'):
+        cache, rate = run('locmem://bench-stats-%s?stats=%s' % (flag, flag), seconds)
+        print '%8s %12d %12.2f' % (flag, rate, 1e6 / rate)
+    get = cache.stats()['operations']['get']
+    print 'p50 %.2fus p99 %.2fus p999 %.2fus' % (
+        get['p50'] * 1e6, get['p99'] * 1e6, get['p999'] * 1e6)
+
+
+if __name__ == '__main__':
+    main()
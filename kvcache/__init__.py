@@ -1,10 +1,13 @@
+import os
+import threading
 import urlparse
 from .backends.base import (
-    InvalidCacheBackendError, CacheKeyWarning, BaseCache)
+    InvalidCacheBackendError, CacheKeyWarning, BaseCache, parse_bool)
+from .backends.asyncbase import AsyncBaseCache, DEFAULT_MAX_WORKERS
 from .utils import importlib
 
 __all__ = [
-    'get_cache'
+    'get_cache', 'close_all', 'AsyncBaseCache'
 ]
 
 # Name for use in settings file --> name of module in "backends" directory.
@@ -21,7 +24,13 @@ BACKENDS = {
     'mongodb': 'mongodb',
     's3': 's3',
     'leveldb': 'ldb',
-    'bdm': 'bdb'
+    'bdm': 'bdb',
+    'shm': 'shm',
+    'near': 'near',
+    'sharded': 'sharded',
+    'replicated': 'replicated',
+    'tagged': 'tagged',
+    'bloom': 'bloom',
 }
 
 for scheme in BACKENDS.keys():
@@ -45,6 +54,83 @@ def parse_backend_uri(backend_uri):
     return url.scheme, url, params
 
 
+# Live cache instances by normalized URI and params, so code calling
+# get_cache() per request reuses connections instead of opening new ones.
+_instances = {}
+# Reentrant: building a composite cache calls get_cache() for its parts.
+_instances_lock = threading.RLock()
+_instances_pid = os.getpid()
+
+def _freeze(value):
+    "Hashable stand-in for a params value."
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return ('id', id(value))
+    return value
+
+# Schemes whose netloc names servers: host names are case-insensitive there,
+# while the netloc of the other schemes is a name, path or bucket.
+NETWORK_SCHEMES = ('memcached', 'redis', 'mysql', 'mongodb')
+
+def _instance_key(scheme, location, params):
+    scheme = scheme.lower()
+    netloc = location.netloc
+    if scheme in NETWORK_SCHEMES:
+        # Leave the credentials alone.
+        credentials, at, hosts = netloc.rpartition('@')
+        netloc = credentials + at + hosts.lower()
+    return (scheme, netloc, location.path, _freeze(params))
+
+def _register(key, cache):
+    """
+    Adds ``cache`` to the registry, making its close() take it out again
+    so get_cache() never hands out a closed instance.
+    """
+    _instances[key] = cache
+    close = getattr(cache, 'close', None)
+    if close is None:
+        return
+
+    def deregistering_close(*args, **kwargs):
+        with _instances_lock:
+            if _instances.get(key) is cache:
+                del _instances[key]
+        return close(*args, **kwargs)
+    cache.close = deregistering_close
+
+def reset_after_fork():
+    """
+    Forgets the instances created by the parent process without closing
+    them: their connections are shared with the parent, which still uses
+    them. get_cache() calls this by itself in a new process.
+    """
+    global _instances_pid
+    with _instances_lock:
+        _instances.clear()
+        _instances_pid = os.getpid()
+
+def close_all(**kwargs):
+    """
+    Closes every cache instance get_cache() has handed out and empties the
+    registry; later get_cache() calls build new instances.
+    """
+    with _instances_lock:
+        caches = _instances.values()
+        _instances.clear()
+    for cache in caches:
+        close = getattr(cache, 'close', None)
+        if close is not None:
+            try:
+                close(**kwargs)
+            except Exception:
+                import logging
+                logging.error('close fail', exc_info=True)
+
 def get_cache(backend, **kwargs):
     """
     Function to load a cache backend dynamically. This is flexible by design
@@ -65,13 +151,42 @@ def get_cache(backend, **kwargs):
             'LOCATION': '127.0.0.1:11211', 'TIMEOUT': 30,
         })
 
+    To load the asynchronous variant of a backend, whose methods return
+    futures to await, running blocking calls on at most ``async_workers``
+    threads::
+
+        cache = get_cache('sqlite:///tmp/cache.db', asynchronous=True)
+
+    The same URI and options return the same instance, shared by every
+    thread, until it is closed or close_all() is called; ``reuse=False``
+    builds a private instance instead. Backends whose connections cannot be shared between
+    threads (the database ones) open one per thread.
+
     """
+    backend, location, params = parse_backend_uri(backend)
+    params.update(kwargs)
+    reuse = parse_bool(params.pop('reuse', True))
+    if not reuse:
+        return _build_cache(backend, location, params)
+
+    key = _instance_key(backend, location, params)
+    if _instances_pid != os.getpid():
+        reset_after_fork()
+    cache = _instances.get(key)
+    if cache is None:
+        with _instances_lock:
+            cache = _instances.get(key)
+            if cache is None:
+                cache = _build_cache(backend, location, params)
+                _register(key, cache)
+    return cache
+
+
+def _build_cache(backend, location, params):
     try:
         # for backwards compatibility
-        backend, location, params = parse_backend_uri(backend)
         if backend in BACKENDS:
             backend = 'kvcache.backends.%s' % BACKENDS[backend]
-        params.update(kwargs)
         mod = importlib.import_module(backend)
         backend_cls = mod.CacheClass
     
@@ -79,6 +194,14 @@ def get_cache(backend, **kwargs):
         raise InvalidCacheBackendError(
             "Could not find backend '%s': %s" % (backend, e))
     cache = backend_cls(location, params)
+    if parse_bool(params.get('asynchronous', False)):
+        # Backends can provide their own non-blocking implementation.
+        async_cls = getattr(mod, 'AsyncCacheClass', AsyncBaseCache)
+        try:
+            max_workers = int(params.get('async_workers', DEFAULT_MAX_WORKERS))
+        except (ValueError, TypeError):
+            max_workers = DEFAULT_MAX_WORKERS
+        cache = async_cls(cache, max_workers=max_workers)
     # Some caches -- python-memcached in particular -- need to do a cleanup at the
     # end of a request cycle. If the cache provides a close() method, wire it up
     # here.
@@ -0,0 +1,106 @@
+"Asynchronous wrapper around the cache backends."
+
+import functools
+
+from .base import InvalidCacheBackendError
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def import_asyncio():
+    """
+    Returns the asyncio module, or its Python 2 backport trollius. Raises
+    InvalidCacheBackendError when neither is installed.
+    """
+    try:
+        import asyncio
+    except ImportError:
+        try:
+            import trollius as asyncio
+        except ImportError:
+            raise InvalidCacheBackendError(
+                "The asynchronous cache API requires asyncio or 'trollius'")
+    return asyncio
+
+
+class AsyncBaseCache(object):
+    """
+    Asynchronous front of a cache backend. Every method returns an asyncio
+    future to await (``yield From(...)`` with trollius) instead of a
+    result; the underlying blocking call runs on a thread pool of at most
+    ``max_workers`` threads, so a slow backend cannot use up more threads
+    than that however many calls are waiting.
+
+    Every backend, Redis and memcached included, goes through the thread
+    pool for now: no non-blocking client is wired in. Backends with one
+    can provide an ``AsyncCacheClass`` subclassing this that overrides
+    the methods concerned.
+
+    asyncio (or trollius) is only needed to find the current event loop;
+    a ``loop`` given explicitly is used as it is.
+    """
+    def __init__(self, cache, max_workers=DEFAULT_MAX_WORKERS, loop=None, executor=None):
+        self._asyncio = import_asyncio() if loop is None else None
+        self.cache = cache
+        self._loop = loop
+        self._own_executor = executor is None
+        if executor is None:
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+            except ImportError:
+                raise InvalidCacheBackendError(
+                    "The asynchronous cache API requires the 'futures' library")
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._executor = executor
+
+    @property
+    def default_timeout(self):
+        return self.cache.default_timeout
+
+    def make_key(self, key, version=None):
+        return self.cache.make_key(key, version=version)
+
+    def _run(self, func, *args, **kwargs):
+        loop = self._loop or self._asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def add(self, key, value, timeout=None, version=None):
+        return self._run(self.cache.add, key, value, timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        return self._run(self.cache.get, key, default, version=version)
+
+    def set(self, key, value, timeout=None, version=None):
+        return self._run(self.cache.set, key, value, timeout, version=version)
+
+    def delete(self, key, version=None):
+        return self._run(self.cache.delete, key, version=version)
+
+    def get_many(self, keys, version=None):
+        return self._run(self.cache.get_many, keys, version=version)
+
+    def set_many(self, data, timeout=None, version=None):
+        return self._run(self.cache.set_many, data, timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._run(self.cache.delete_many, keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._run(self.cache.has_key, key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._run(self.cache.incr, key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._run(self.cache.decr, key, delta, version=version)
+
+    def clear(self):
+        return self._run(self.cache.clear)
+
+    def close(self, **kwargs):
+        "Closes the backend and stops the thread pool if this cache created it."
+        close = getattr(self.cache, 'close', None)
+        if close is not None:
+            close(**kwargs)
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
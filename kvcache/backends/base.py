@@ -1,16 +1,23 @@
 "Base Cache class."
 from __future__ import unicode_literals
 
+import hashlib
+import math
+import random
+import re
+import time
 import warnings
 
 from ..utils.importlib import import_module
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+from ..utils.encoding import smart_str
+from ..utils.serializers import get_serializer
+from ..utils.compression import Compressor, is_compressed, decompress
+from ..utils.synch import SingleFlight
+from ..utils.batch import get_executor
+from ..utils.stats import CacheStats, DEFAULT_SAMPLE, instrument
 
 
-class CacheKeyWarning(Exception):
+class CacheKeyWarning(RuntimeWarning):
     pass
 
 class InvalidCacheBackendError(Exception):
@@ -19,6 +26,9 @@ class InvalidCacheBackendError(Exception):
 # Memcached does not accept keys longer than this.
 MEMCACHE_MAX_KEY_LENGTH = 250
 
+# Control characters, space and DEL are not allowed in memcached keys.
+_invalid_key_chars = re.compile('[\x00-\x20\x7f]')
+
 def default_key_func(key, key_prefix, version):
     """
     Default function to generate keys.
@@ -44,9 +54,38 @@ def get_key_func(key_func):
             return getattr(key_func_module, key_func_name)
     return default_key_func
 
+def parse_bool(value):
+    """
+    Params parsed from a URI query string are strings, so accept the usual
+    spellings of true as well as real booleans.
+    """
+    if isinstance(value, basestring):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
 class PickleException(Exception):
     pass
 
+def unwrap_xfetch(meta):
+    """
+    Returns (delta, expiry) from the companion key of a value stored by
+    get_or_set(beta=...), or (None, None) if there is none.
+    """
+    if isinstance(meta, (tuple, list)) and len(meta) == 2:
+        return meta[0], meta[1]
+    return None, None
+
+def xfetch_due(delta, expiry, beta, now=None):
+    """
+    The XFetch test: recompute when now - delta * beta * log(rand) reaches
+    the expiry. -log(rand) is exponentially distributed, so the chance
+    rises smoothly as the remaining time shrinks relative to the time
+    recomputing takes.
+    """
+    if now is None:
+        now = time.time()
+    return now - delta * beta * math.log(1.0 - random.random()) >= expiry
+
 class BaseCache(object):
     def __init__(self, params):
         self.params = params
@@ -70,22 +109,110 @@ class BaseCache(object):
         except (ValueError, TypeError):
             self._cull_frequency = 3
 
+        serializer = params.get('serializer', options.get('SERIALIZER', 'pickle'))
+        try:
+            self.serializer = get_serializer(serializer)
+        except (ValueError, ImportError), e:
+            raise InvalidCacheBackendError(e)
+
+        # Compression of encoded values is off unless a codec is named.
+        self.compressor = None
+        compress = params.get('compress', options.get('COMPRESS', None))
+        if compress:
+            threshold = params.get('compress_threshold', options.get('COMPRESS_THRESHOLD', 1024))
+            level = params.get('compress_level', options.get('COMPRESS_LEVEL', None))
+            try:
+                self.compressor = Compressor(
+                    compress, int(threshold), None if level is None else int(level))
+            except (ValueError, TypeError, ImportError), e:
+                raise InvalidCacheBackendError(e)
+
         self.key_prefix = params.get('KEY_PREFIX', '')
         self.version = params.get('VERSION', 1)
         self.key_func = get_key_func(params.get('KEY_FUNCTION', None))
+        # Keys for the default version only need one substitution.
+        self._key_template = '%s:%s:%%s' % (
+            self.key_prefix.replace('%', '%%'), str(self.version).replace('%', '%%'))
+
+        self._hash_long_keys = parse_bool(
+            params.get('hash_long_keys', options.get('HASH_LONG_KEYS', False)))
+
+        # Used by backends that opt into ParallelBatchMixin.
+        batch_workers = params.get('batch_workers', options.get('BATCH_WORKERS', 8))
+        try:
+            self._batch_workers = max(int(batch_workers), 1)
+        except (ValueError, TypeError):
+            self._batch_workers = 8
+        batch_deadline = params.get('batch_deadline', options.get('BATCH_DEADLINE', None))
+        try:
+            self._batch_deadline = None if batch_deadline is None else float(batch_deadline)
+        except (ValueError, TypeError):
+            self._batch_deadline = None
+
+        # Deduplicates get_or_set() producers within this process.
+        self._single_flight = SingleFlight()
+
+        # Operation statistics are off unless asked for: recording them
+        # wraps every call. Every call is counted and one in
+        # ``stats_sample`` (16 by default, 0 for none) is timed. Measured
+        # with bench/stats_overhead.py, a locmem get() costs about 1.5us
+        # (11-18%) more with stats=1, against 3.7us (33%) when every call
+        # was timed.
+        self._stats = None
+        if parse_bool(params.get('stats', options.get('STATS', False))):
+            sample = params.get('stats_sample', options.get('STATS_SAMPLE', DEFAULT_SAMPLE))
+            try:
+                sample = max(int(sample), 0)
+            except (ValueError, TypeError):
+                sample = DEFAULT_SAMPLE
+            self._stats = CacheStats(sample)
+            instrument(self, self._stats)
 
     def decode(self, value, default=None):
         try:
-            value = smart_str(value)
-            return pickle.loads(value)
+            if not isinstance(value, str):
+                # Buffers and blobs from database drivers.
+                value = smart_str(value)
+            if is_compressed(value):
+                value = decompress(value)
+            return self.serializer.loads(value)
         except Exception, e:
             return default
 
     def encode(self, value):
         try:
-            return pickle.dumps(value)
+            value = self.serializer.dumps(value)
         except Exception, e:
             raise PickleException(e)
+        if self.compressor is not None:
+            value = self.compressor.compress(value)
+        return value
+
+    @property
+    def compression_ratio(self):
+        """
+        Original size divided by stored size for the values this cache
+        compressed, or 1.0 when compression is off.
+        """
+        if self.compressor is None:
+            return 1.0
+        return self.compressor.ratio
+
+    def stats(self):
+        """
+        Returns a snapshot of the operation statistics: per operation
+        calls, hits, misses, errors, and the number of ``timed`` calls
+        with their mean and latency percentiles in seconds, plus totals
+        and bytes read and written. Empty unless the cache was
+        created with ``stats=1``.
+        """
+        if self._stats is None:
+            return {}
+        return self._stats.snapshot()
+
+    def reset_stats(self):
+        if self._stats is not None:
+            self._stats.reset()
 
     def make_key(self, key, version=None):
         """Constructs the key used by all other methods. By default it
@@ -95,11 +222,34 @@ class BaseCache(object):
         alternatively, you can subclass the cache backend to provide
         custom key making behavior.
         """
+        if self.key_func is default_key_func and (version is None or version == self.version):
+            new_key = self._key_template % (key,)
+        else:
+            if version is None:
+                version = self.version
+            new_key = self.key_func(key, self.key_prefix, version)
+        if self._hash_long_keys and len(new_key) > MEMCACHE_MAX_KEY_LENGTH:
+            new_key = self.hash_key(new_key)
+        return new_key
+
+    def companion_version(self, version, namespace):
+        """
+        The version that internal keys of ``namespace`` (tag generations,
+        leases) are stored under for values of ``version``. make_key() only
+        gives a user key this version if it is passed explicitly, so
+        internal keys never collide with user keys of the same name.
+        """
         if version is None:
             version = self.version
+        return '%s~%s' % (version, namespace)
 
-        new_key = self.key_func(key, self.key_prefix, version)
-        return new_key
+    def hash_key(self, key):
+        """
+        Shortens a key to MEMCACHE_MAX_KEY_LENGTH by replacing its tail with
+        the md5 of the whole key. Used by make_key() with hash_long_keys.
+        """
+        digest = hashlib.md5(smart_str(key)).hexdigest()
+        return '%s:%s' % (key[:MEMCACHE_MAX_KEY_LENGTH - len(digest) - 1], digest)
 
     def add(self, key, value, timeout=None, version=None):
         """
@@ -161,6 +311,107 @@ class BaseCache(object):
         """
         return self.get(key, version=version) is not None
 
+    def get_or_set(self, key, producer, timeout=None, version=None,
+                   lease_timeout=30, stale_timeout=0, poll_interval=0.05,
+                   beta=None):
+        """
+        Fetch a given key from the cache. If it is missing, call
+        ``producer()``, store its result and return it.
+
+        Only one caller recomputes a missing key. Threads of this process
+        asking for the same key on this cache instance wait for the first
+        one. Other processes (or instances) are kept out by a lease taken
+        with ``add()`` for ``lease_timeout`` seconds, under the key itself
+        in the reserved version companion_version(version, 'lease'). They poll every
+        ``poll_interval`` seconds for the value and recompute it
+        themselves only if the lease runs out first. A ``lease_timeout`` of
+        0 disables the lease.
+
+        With ``stale_timeout`` a copy of the value is kept that long past
+        its expiry, in the reserved version companion_version(version,
+        'stale'). While a recomputation is running, other callers get
+        that copy instead of waiting.
+
+        With ``beta``, how long ``producer()`` took and when the value
+        expires are stored next to it (under the key itself in the reserved
+        version companion_version(version, 'xfetch'), read right after the
+        value), and every read may decide
+        to recompute it early with a probability that grows as the expiry
+        gets closer and the recomputation gets more expensive (XFetch).
+        Larger values of ``beta`` favour earlier recomputation; 1.0 is the
+        usual choice. While one caller refreshes early, the others keep
+        getting the current value. The value itself is stored as it is,
+        so get(), get_many() and incr() see it unchanged.
+        """
+        # Leases and stale copies live under versions of their own, where
+        # no user key can be mistaken for them.
+        stale_version = self.companion_version(version, 'stale')
+        lease_version = self.companion_version(version, 'lease')
+        xfetch_version = self.companion_version(version, 'xfetch')
+
+        def read():
+            "Returns (value, delta, expiry) of the key."
+            if beta is None:
+                return self.get(key, version=version), None, None
+            value = self.get(key, version=version)
+            if value is None:
+                return None, None, None
+            delta, expiry = unwrap_xfetch(self.get(key, version=xfetch_version))
+            return value, delta, expiry
+
+        current, delta, expiry = read()
+        if current is not None:
+            if beta is None or delta is None or not xfetch_due(delta, expiry, beta):
+                return current
+
+        def stale():
+            if current is not None:
+                return current
+            if stale_timeout:
+                return self.get(key, version=stale_version)
+
+        def wait_for_lease_holder():
+            value = stale()
+            deadline = time.time() + lease_timeout
+            while value is None and time.time() < deadline:
+                time.sleep(poll_interval)
+                value = self.get(key, version=version)
+                if value is None and not self.has_key(key, version=lease_version):
+                    break
+            return value
+
+        def produce():
+            # Someone may have stored it (or refreshed it) while we were
+            # queueing.
+            fresh, _, fresh_expiry = read()
+            if fresh is not None and (current is None or fresh_expiry != expiry):
+                return fresh
+            leased = False
+            if lease_timeout:
+                leased = self.add(key, 1, lease_timeout, version=lease_version)
+                if not leased:
+                    value = wait_for_lease_holder()
+                    if value is not None:
+                        return value
+            try:
+                start = time.time()
+                value = producer()
+                delta = time.time() - start
+                fresh_for = self.default_timeout if timeout is None else timeout
+                self.set(key, value, timeout, version=version)
+                if beta is not None:
+                    self.set(key, (delta, time.time() + fresh_for), timeout,
+                             version=xfetch_version)
+                if stale_timeout:
+                    self.set(key, value, fresh_for + stale_timeout, version=stale_version)
+            finally:
+                if leased:
+                    self.delete(key, version=lease_version)
+            return value
+
+        return self._single_flight.do(self.make_key(key, version=version), produce,
+                                      fallback=stale)
+
     def incr(self, key, delta=1, version=None):
         """
         Add delta to value in the cache. If the key does not exist, raise a
@@ -201,6 +452,15 @@ class BaseCache(object):
         for key, value in data.items():
             self.set(key, value, timeout=timeout, version=version)
 
+    def add_many(self, data, timeout=None, version=None):
+        """
+        add() for every key/value pair of a dict. Returns the list of keys
+        that were not stored, usually because they already existed.
+        Backends with a batch API store them in one round trip.
+        """
+        return [key for key, value in data.items()
+                if not self.add(key, value, timeout, version=version)]
+
     def delete_many(self, keys, version=None):
         """
         Set a bunch of values in the cache at once.  For certain backends
@@ -225,11 +485,10 @@ class BaseCache(object):
             warnings.warn('Cache key will cause errors if used with memcached: '
                     '%s (longer than %s)' % (key, MEMCACHE_MAX_KEY_LENGTH),
                     CacheKeyWarning)
-        for char in key:
-            if ord(char) < 33 or ord(char) == 127:
-                warnings.warn('Cache key contains characters that will cause '
-                        'errors if used with memcached: %r' % key,
-                              CacheKeyWarning)
+        if _invalid_key_chars.search(key) is not None:
+            warnings.warn('Cache key contains characters that will cause '
+                    'errors if used with memcached: %r' % key,
+                          CacheKeyWarning)
 
     def incr_version(self, key, delta=1, version=None):
         """Adds delta to the cache version for the supplied key. Returns the
@@ -251,3 +510,27 @@ class BaseCache(object):
         the new version.
         """
         return self.incr_version(key, -delta, version)
+
+
+class ParallelBatchMixin(object):
+    """
+    get_many/set_many/delete_many for backends without a batch API whose
+    per-key calls wait on I/O and are thread-safe: the calls run
+    concurrently on ``batch_workers`` threads. With ``batch_deadline`` a
+    batch waits at most that many seconds; keys not fetched by then are
+    missing from get_many's result.
+    """
+    def _batch_map(self, func, items):
+        return get_executor(self._batch_workers).map(func, items, self._batch_deadline)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self._batch_map(lambda key: self.get(key, version=version), keys)
+        return dict((key, value) for key, value in zip(keys, values) if value is not None)
+
+    def set_many(self, data, timeout=None, version=None):
+        self._batch_map(lambda item: self.set(item[0], item[1], timeout, version=version),
+                        data.items())
+
+    def delete_many(self, keys, version=None):
+        self._batch_map(lambda key: self.delete(key, version=version), keys)
@@ -6,7 +6,6 @@ from threading import local
 from .base import BaseCache, InvalidCacheBackendError
 
 from ..utils.encoding import force_str
-import dbm
 import os.path as osp
 
 
@@ -15,14 +14,14 @@ class BDBCache(BaseCache):
     def __init__(self, url, params):
         super(BDBCache, self).__init__(params)
         self._path = url.path
-        print self._path
 
     @property
     def _cache(self):
         """
         Implements transparent thread-safe access to a memcached client.
         """
-        if not getattr(self, '_client', None):
+        if getattr(self, '_client', None) is None:
+            import dbm
             self._client = dbm.open(self._path, 'c')
         return self._client
 
@@ -33,8 +32,8 @@ class BDBCache(BaseCache):
     def add(self, key, value, timeout=0, version=None):
         key = self.make_key(key, version=version)
         timeout = timeout and now + timeout or 0
-        data = self.encode(timeout, value)
-        return self._cache.Set(key, self.encode(data))
+        data = self.encode((timeout, value))
+        return self._cache.Set(key, data)
 
     def get(self, key, default=None, version=None):
         key = self.make_key(key, version=version)
@@ -0,0 +1,176 @@
+"""
+Bloom filter guard: answers misses for keys never written without asking
+the backend.
+"""
+
+from .base import BaseCache, InvalidCacheBackendError, parse_bool
+from ..utils.bloom import BloomFilter
+
+_MISSING = object()
+
+
+class BloomCache(BaseCache):
+    """
+    Keeps an in-process Bloom filter of the keys written through it in
+    front of a slow backend (``s3://``, ``mysql://``). A key the
+    filter has never seen is a definite miss and is answered at once; any
+    other read goes to the backend. The filter is sized by ``capacity``
+    (expected keys) and ``error_rate`` (false positive rate at that many
+    keys); ``stats()['bloom']`` reports both with the filter's size and its
+    current expected rate.
+
+    The backend may already hold keys when the cache is created, and other
+    processes may write to it, so the filter is only trusted once it is
+    *warm*: after clear(), after rebuild() with the keys the backend holds,
+    or from the start with ``warm=1`` when this process does all the
+    writes to a backend that starts empty. Until then every read goes to
+    the backend, and the keys found there are added to the filter. With
+    the default ``warm=0`` the guard therefore answers nothing by itself
+    until clear() or rebuild() is called.
+
+    Deleted and expired keys stay in the filter until the next rebuild(),
+    which only costs a lookup: a Bloom filter cannot forget a key. A key
+    written by another process is reported missing, which is only a cache
+    miss. ``stats()['bloom']['backend_misses']`` counts the reads the
+    filter let through and the backend missed: false positives as well as
+    deleted and expired keys.
+
+    ``get_cache('bloom://', cache='s3://bucket', capacity=1000000, error_rate=0.001)``
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+
+        cache = params.get('cache', options.get('CACHE'))
+        if cache is None or cache == '':
+            raise InvalidCacheBackendError("The bloom cache needs a 'cache' to guard")
+        # Built from a URI, the backend is ours to close; an instance is
+        # left to its owner.
+        self._own_cache = isinstance(cache, basestring)
+        if self._own_cache:
+            from .. import get_cache
+            cache = get_cache(cache, reuse=False)
+        self.cache = cache
+
+        capacity = params.get('capacity', options.get('CAPACITY', 100000))
+        error_rate = params.get('error_rate', options.get('ERROR_RATE', 0.01))
+        try:
+            self.filter = BloomFilter(int(capacity), float(error_rate))
+        except (ValueError, TypeError), e:
+            raise InvalidCacheBackendError("Invalid bloom filter settings: %s" % e)
+        self.warm = parse_bool(params.get('warm', options.get('WARM', False)))
+        self.skipped = 0
+        self.passed = 0
+        self.backend_misses = 0
+
+    def _maybe(self, key, version):
+        "False when ``key`` is certainly not in the backend."
+        if not self.warm or self.make_key(key, version=version) in self.filter:
+            self.passed += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def _found(self, key, version, found):
+        if found:
+            if not self.warm:
+                self.filter.add(self.make_key(key, version=version))
+        elif self.warm:
+            self.backend_misses += 1
+
+    def rebuild(self, keys, version=None):
+        """
+        Refills the filter with ``keys``, the keys the backend holds now,
+        dropping expired and foreign ones, and trusts it from then on.
+        """
+        self.filter.clear()
+        for key in keys:
+            self.filter.add(self.make_key(key, version=version))
+        self.warm = True
+
+    def add(self, key, value, timeout=None, version=None):
+        # Into the filter before the backend, so no read in between is
+        # answered from a filter that does not know the key yet.
+        self.filter.add(self.make_key(key, version=version))
+        return self.cache.add(key, value, timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        if not self._maybe(key, version):
+            return default
+        value = self.cache.get(key, _MISSING, version=version)
+        self._found(key, version, value is not _MISSING)
+        if value is _MISSING:
+            return default
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        self.filter.add(self.make_key(key, version=version))
+        self.cache.set(key, value, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.cache.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if not self._maybe(key, version):
+            return False
+        found = self.cache.has_key(key, version=version)
+        self._found(key, version, found)
+        return found
+
+    def get_many(self, keys, version=None):
+        keys = [key for key in keys if self._maybe(key, version)]
+        if not keys:
+            return {}
+        found = self.cache.get_many(keys, version=version)
+        for key in keys:
+            self._found(key, version, key in found)
+        return found
+
+    def set_many(self, data, timeout=None, version=None):
+        for key in data:
+            self.filter.add(self.make_key(key, version=version))
+        self.cache.set_many(data, timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.cache.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        if not self._maybe(key, version):
+            raise ValueError("Key '%s' not found" % key)
+        return self.cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        if not self._maybe(key, version):
+            raise ValueError("Key '%s' not found" % key)
+        return self.cache.decr(key, delta, version=version)
+
+    def clear(self):
+        self.cache.clear()
+        self.filter.clear()
+        self.warm = True
+
+    def stats(self):
+        "Adds the filter's settings and how many reads it answered."
+        stats = super(BloomCache, self).stats()
+        bloom = self.filter.stats()
+        bloom.update({
+            'warm': self.warm,
+            'skipped': self.skipped,
+            'passed': self.passed,
+            'backend_misses': self.backend_misses,
+        })
+        stats['bloom'] = bloom
+        return stats
+
+    def reset_stats(self):
+        super(BloomCache, self).reset_stats()
+        self.skipped = self.passed = self.backend_misses = 0
+
+    def close(self, **kwargs):
+        close = getattr(self.cache, 'close', None)
+        if self._own_cache and close is not None:
+            close(**kwargs)
+
+# For backwards compatibility
+class CacheClass(BloomCache):
+    pass
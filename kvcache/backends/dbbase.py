@@ -2,15 +2,40 @@
 import base64
 import time
 import logging
+import threading
 from .base import BaseCache, MEMCACHE_MAX_KEY_LENGTH
 
 
 class BaseDatabaseCache(BaseCache):
     place_hold = '?'
+    # Most parameters one statement may bind: sqlite's default limit.
+    max_query_params = 999
+    # The table is created by the first operation, not by the constructor,
+    # so building a cache does not touch the database.
+    _created = False
 
+    def __init__(self, params):
+        BaseCache.__init__(self, params)
+        # DB-API connections cannot be shared between threads, and one
+        # cache instance is (see get_cache): every thread connects on its own.
+        self._local = threading.local()
+        self._create_lock = threading.Lock()
+
+    def _get_conn(self):
+        return getattr(self._local, 'conn', None)
+
+    def _set_conn(self, conn):
+        self._local.conn = conn
+
+    _conn = property(_get_conn, _set_conn)
 
     def cursor(self):
         self._reconn()
+        if not self._created:
+            with self._create_lock:
+                if not self._created:
+                    self.create()
+                    self._created = True
         return self._conn.cursor()
 
     def create(self):
@@ -18,7 +43,8 @@ class BaseDatabaseCache(BaseCache):
 
     def _create(self, sql_create_table, name):
         ''' create collection by name '''
-        cursor = self.cursor()
+        self._reconn()
+        cursor = self._conn.cursor()
         cursor.execute(sql_create_table % name)
         self._conn.commit()
 
@@ -32,6 +58,12 @@ class BaseDatabaseCache(BaseCache):
     def sql_params(self):
         return {'table': self._table, 'place_hold': self.place_hold}
 
+    def _chunks(self, keys):
+        "Splits ``keys`` into lists short enough for one IN (...) each."
+        size = self.max_query_params
+        for i in xrange(0, len(keys), size):
+            yield keys[i:i + size]
+
 
 class DatabaseCache(BaseDatabaseCache):
 
@@ -59,10 +91,39 @@ class DatabaseCache(BaseDatabaseCache):
         if row[2] < now:
             cursor.execute("DELETE FROM %(table)s "
                            "WHERE cache_key = %(place_hold)s" % self.sql_params, [key])
+            self._conn.commit()
             return default
         value = row[1]
         return self.decode(value)
 
+    def get_many(self, keys, version=None):
+        """
+        Fetches the keys with one query per max_query_params keys instead
+        of one per key.
+        """
+        made = {}
+        for key in keys:
+            new_key = self.make_key(key, version=version)
+            self.validate_key(new_key)
+            made[new_key] = key
+        if not made:
+            return {}
+        cursor = self.cursor()
+        result = {}
+        now = time.time()
+        for chunk in self._chunks(list(made)):
+            place_holds = ', '.join([self.place_hold] * len(chunk))
+            cursor.execute("SELECT cache_key, value, expires FROM %(table)s "
+                           "WHERE cache_key IN (%%s)" % self.sql_params % place_holds,
+                           chunk)
+            for cache_key, value, expires in cursor.fetchall():
+                if expires < now:
+                    continue
+                value = self.decode(value)
+                if value is not None:
+                    result[made[cache_key]] = value
+        return result
+
     def set(self, key, value, timeout=None, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
@@ -100,6 +161,8 @@ class DatabaseCache(BaseDatabaseCache):
             self._conn.commit()
         except:
             logging.error('set fail', exc_info=True)
+            # Do not keep the table locked for this thread's next calls.
+            self._conn.rollback()
             # To be threadsafe, updates/inserts are allowed to fail silently
             return False
         else:
@@ -112,6 +175,20 @@ class DatabaseCache(BaseDatabaseCache):
         cursor = self.cursor()
 
         cursor.execute("DELETE FROM %(table)s WHERE cache_key = %(place_hold)s" % self.sql_params, [key])
+        self._conn.commit()
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        if not keys:
+            return
+        cursor = self.cursor()
+        for chunk in self._chunks(keys):
+            place_holds = ', '.join([self.place_hold] * len(chunk))
+            cursor.execute("DELETE FROM %(table)s WHERE cache_key IN (%%s)" % self.sql_params
+                           % place_holds, chunk)
+        self._conn.commit()
 
     def has_key(self, key, version=None):
         key = self.make_key(key, version=version)
@@ -148,3 +225,4 @@ class DatabaseCache(BaseDatabaseCache):
     def clear(self):
         cursor = self.cursor()
         cursor.execute('DELETE FROM %(table)s' % self.sql_params)
+        self._conn.commit()
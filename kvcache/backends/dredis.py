@@ -3,13 +3,15 @@ from ..utils import importlib
 from ..utils.encoding import smart_str, smart_unicode
 
 
-try:
-    import redis
-except ImportError:
-    raise InvalidCacheBackendError(
-        "Redis cache backend requires the 'redis-py' library")
-from redis.connection import UnixDomainSocketConnection, Connection
-from redis.connection import DefaultParser
+def import_redis():
+    "Imports redis-py when a redis cache is first built."
+    try:
+        import redis
+        import redis.connection
+    except ImportError:
+        raise InvalidCacheBackendError(
+            "Redis cache backend requires the 'redis-py' library")
+    return redis
 
 
 class CacheKey(object):
@@ -45,8 +47,10 @@ class CacheConnectionPool(object):
         unix_socket_path=None):
         connection_identifier = (host, port, db, parser_class, unix_socket_path)
         if not self._connection_pools.get(connection_identifier):
+            redis = import_redis()
             connection_class = (
-                unix_socket_path and UnixDomainSocketConnection or Connection
+                unix_socket_path and redis.connection.UnixDomainSocketConnection or
+                redis.connection.Connection
             )
             kwargs = {
                 'db': db,
@@ -74,6 +78,7 @@ class CacheClass(BaseCache):
         self._init(server, params)
 
     def _init(self, server, params):
+        self._redis = import_redis()
         super(CacheClass, self).__init__(params)
         self._server = server
         self._params = params
@@ -96,7 +101,8 @@ class CacheClass(BaseCache):
             parser_class=self.parser_class,
             **kwargs
         )
-        self._client = redis.Redis(
+        # No connection is made until the first command.
+        self._client = self._redis.Redis(
             connection_pool=connection_pool,
             **kwargs
         )
@@ -126,7 +132,7 @@ class CacheClass(BaseCache):
     def parser_class(self):
         cls = self.options.get('PARSER_CLASS', None)
         if cls is None:
-            return DefaultParser
+            return self._redis.connection.DefaultParser
         mod_path, cls_name = cls.rsplit('.', 1)
         try:
             mod = importlib.import_module(mod_path)
@@ -156,7 +162,28 @@ class CacheClass(BaseCache):
 
         Returns ``True`` if the object was added, ``False`` if not.
         """
-        return self.set(key, value, timeout, _add_only=True)
+        return self.set(key, value, timeout, version=version, _add_only=True)
+
+    def add_many(self, data, timeout=None, version=None):
+        """
+        Adds a bunch of keys with one ``SET NX`` each, sent in one pipeline.
+        Returns the keys that were not stored.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+        timeout = int(timeout)
+        if timeout < 0:
+            return list(data)
+        keys = list(data)
+        pipeline = self._client.pipeline()
+        for key in keys:
+            made = self.make_key(key, version=version)
+            value = self.encode(data[key])
+            if timeout:
+                pipeline.set(made, value, ex=timeout, nx=True)
+            else:
+                pipeline.setnx(made, value)
+        return [key for key, added in zip(keys, pipeline.execute()) if not added]
 
     def get(self, key, default=None, version=None):
         """
@@ -264,7 +291,7 @@ class CacheClass(BaseCache):
             raise ValueError("Key '%s' not found" % key)
         try:
             value = self._client.incr(key, delta)
-        except redis.ResponseError:
+        except self._redis.ResponseError:
             value = self.get(key) + 1
             self.set(key, value)
         return value
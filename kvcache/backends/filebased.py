@@ -1,17 +1,19 @@
 "File-based cache backend"
 
+import errno
 import hashlib
 import os
 import shutil
 import time
 
-from .base import BaseCache
-from ..utils.encoding import force_bytes
+from .base import BaseCache, ParallelBatchMixin
+from ..utils.encoding import smart_str
 
-class FileBasedCache(BaseCache):
+class FileBasedCache(ParallelBatchMixin, BaseCache):
     def __init__(self, dir, params):
         BaseCache.__init__(self, params)
-        self._dir = dir
+        # get_cache() hands over the parsed URI: file:///var/tmp/cache
+        self._dir = getattr(dir, 'path', dir)
         if not os.path.exists(self._dir):
             self._createdir()
 
@@ -30,12 +32,13 @@ class FileBasedCache(BaseCache):
         try:
             with open(fname, 'rb') as f:
                 pickled = f.read()
-            exp, value = self.decode(pickled)
-            now = time.time()
-            if exp < now:
+            data = self.decode(pickled)
+            if data is not None:
+                exp, value = data
+                if exp >= time.time():
+                    return value
                 self._delete(fname)
-            return value
-        except (IOError, OSError, EOFError, pickle.PickleError):
+        except (IOError, OSError, EOFError):
             pass
         return default
 
@@ -53,7 +56,12 @@ class FileBasedCache(BaseCache):
 
         try:
             if not os.path.exists(dirname):
-                os.makedirs(dirname)
+                try:
+                    os.makedirs(dirname)
+                except OSError, e:
+                    # Created meanwhile by a concurrent set().
+                    if e.errno != errno.EEXIST:
+                        raise
 
             with open(fname, 'wb') as f:
                 now = time.time()
@@ -86,18 +94,19 @@ class FileBasedCache(BaseCache):
         fname = self._key_to_file(key)
         try:
             with open(fname, 'rb') as f:
-                exp = pickle.load(f)
-            now = time.time()
-            if exp < now:
+                data = self.decode(f.read())
+            if data is None:
+                return False
+            if data[0] < time.time():
                 self._delete(fname)
                 return False
             else:
                 return True
-        except (IOError, OSError, EOFError, pickle.PickleError):
+        except (IOError, OSError, EOFError):
             return False
 
     def _cull(self):
-        if self._max_entries and  int(self._num_entries) < self._max_entries:
+        if not self._max_entries or int(self._num_entries) < self._max_entries:
             return
 
         try:
@@ -133,7 +142,7 @@ class FileBasedCache(BaseCache):
         Thus, a cache key of "foo" gets turnned into a file named
         ``{cache-dir}ac/bd/18db4cc2f85cedef654fccc4a4d8``.
         """
-        path = hashlib.md5(force_bytes(key)).hexdigest()
+        path = hashlib.md5(smart_str(key)).hexdigest()
         path = os.path.join(path[:2], path[2:4], path[4:])
         return os.path.join(self._dir, path)
 
@@ -1,17 +1,30 @@
-"Memcached cache backend"
+"LevelDB cache backend"
 
 import time
-from threading import local
+from threading import local, Lock
 
 from .base import BaseCache, InvalidCacheBackendError
 
 from ..utils.encoding import force_str
-import leveldb
+import os
 import os.path as osp
 
+_open_lock = Lock()
+
 
 class LevelDBCache(BaseCache):
-    def __init__(self, url, params, library, value_not_found_exception):
+    """
+    Stores values in a LevelDB database in this process with py-leveldb.
+    Calls are local, so get_many() just loops; set_many() and
+    delete_many() write one WriteBatch.
+    """
+    def __init__(self, url, params):
+        try:
+            import leveldb
+        except ImportError:
+            raise InvalidCacheBackendError(
+                "LevelDB cache backend requires the 'leveldb' library")
+        self._leveldb = leveldb
         super(LevelDBCache, self).__init__(params)
         self._path = url.path.lstrip('/')
         lock_path = osp.join(self._path, 'LOCK')
@@ -22,26 +35,36 @@ class LevelDBCache(BaseCache):
     @property
     def _cache(self):
         """
-        Implements transparent thread-safe access to a memcached client.
+        Opens the database on first use.
         """
         if not getattr(self, '_client', None):
-            self._client = leveldb.LevelDB(self._path)
+            # The instance is shared by every thread (see get_cache).
+            with _open_lock:
+                if not getattr(self, '_client', None):
+                    self._client = self._leveldb.LevelDB(self._path)
         return self._client
 
     def make_key(self, key, version=None):
         # Python 2 memcache requires the key to be a byte string.
         return force_str(super(LevelDBCache, self).make_key(key, version))
 
-    def add(self, key, value, timeout=0, version=None):
-        key = self.make_key(key, version=version)
+    def _pack(self, value, timeout):
         now = int(time.time())
         timeout = timeout and now + timeout or 0
-        data = self.encode(timeout, value)
-        return self._cache.Set(key, self.encode(data))
+        return self.encode((timeout, value))
+
+    def add(self, key, value, timeout=0, version=None):
+        if self.has_key(key, version=version):
+            return False
+        self._cache.Put(self.make_key(key, version=version), self._pack(value, timeout))
+        return True
 
     def get(self, key, default=None, version=None):
         key = self.make_key(key, version=version)
-        data = self._cache.Get(key)
+        try:
+            data = self._cache.Get(key)
+        except KeyError:
+            return default
         exp, val = self.decode(data)
         now = int(time.time())
         if exp > 0 and now > exp:
@@ -50,32 +73,30 @@ class LevelDBCache(BaseCache):
         return val
 
     def set(self, key, value, timeout=0, version=None):
-        key = self.make_key(key, version=version)
-        now = int(time.time())
-        timeout = timeout and now + timeout or 0
-        data = self.encode(timeout, value)
-        self._cache.set(key, data)
+        self._cache.Put(self.make_key(key, version=version), self._pack(value, timeout))
 
     def delete(self, key, version=None):
-        key = self.make_key(key, version=version)
-        self._cache.delete(key)
-
-    def get_many(self, keys, version=None):
-        ret = {}
-        for key in keys:
-            ret[key] = self.get(key)
-        return ret
-
-    def close(self, **kwargs):
-        self._cache.Close()
+        self._cache.Delete(self.make_key(key, version=version))
 
     def set_many(self, data, timeout=0, version=None):
+        batch = self._leveldb.WriteBatch()
         for key, value in data.items():
-            self.set(key, value, timeout, version)
+            batch.Put(self.make_key(key, version=version), self._pack(value, timeout))
+        self._cache.Write(batch)
 
     def delete_many(self, keys, version=None):
-        for k in keys:
-            self.delete(k)
+        batch = self._leveldb.WriteBatch()
+        for key in keys:
+            batch.Delete(self.make_key(key, version=version))
+        self._cache.Write(batch)
+
+    def close(self, **kwargs):
+        # py-leveldb closes the database when the handle is freed; the next
+        # call opens it again.
+        client, self._client = getattr(self, '_client', None), None
+        close = getattr(client, 'Close', None)
+        if close is not None:
+            close()
 
 
 class CacheClass(LevelDBCache):
@@ -1,133 +1,678 @@
 "Thread-safe in-memory cache backend."
 
+import copy
+import sys
 import time
+import threading
 
-from .base import BaseCache, PickleException
+from .base import BaseCache, PickleException, InvalidCacheBackendError, parse_bool
 from ..utils.synch import RWLock
+from ..utils.eviction import get_policy_class, DICT_SLOT_SIZE
+from ..utils.timerwheel import TimerWheel
 
 # Global in-memory store of cache data. Keyed by name, to provide
-# multiple named local memory caches.
-_caches = {}
-_expire_info = {}
-_locks = {}
+# multiple named local memory caches. Each name maps to a list of
+# independently locked segments; keys are spread over them by hash.
+_segments = {}
+_sweepers = {}
 
-class LocMemCache(BaseCache):
-    def __init__(self, name, params):
-        BaseCache.__init__(self, params)
-        global _caches, _expire_info, _locks
-        self._cache = _caches.setdefault(name, {})
-        self._expire_info = _expire_info.setdefault(name, {})
-        self._lock = _locks.setdefault(name, RWLock())
+# Returned by CacheSegment lookups for missing or expired keys, so that
+# stored values can be anything.
+_MISSING = object()
 
-    def add(self, key, value, timeout=None, version=None):
-        key = self.make_key(key, version=version)
-        self.validate_key(key)
-        with self._lock.writer():
+# Eviction policies size their bookkeeping from the entry limit; this is
+# used when the cache is only bounded by bytes.
+DEFAULT_POLICY_CAPACITY = 4096
+
+
+# Integers are stored as they are, even when values are pickled, so that
+# counters can be read and incremented without a pickle round-trip.
+_COUNTER_TYPES = (int, long)
+
+# Copy-on-read policies for caches created with serialize=False.
+COPY_ON_READ = {
+    'none': None,
+    'shallow': copy.copy,
+    'deep': copy.deepcopy,
+}
+
+
+def _sizeof(key, value):
+    """
+    Bytes charged for an entry against max_bytes: the length of the key
+    plus the length of the encoded value. Values stored by reference are
+    charged their shallow size only.
+    """
+    if isinstance(value, str):
+        return len(key) + len(value)
+    return len(key) + sys.getsizeof(value)
+
+
+def _entry_overhead(policy):
+    """
+    Approximate bytes used per entry beyond what _sizeof() charges: the
+    string headers of key and value, the float expiry, the stored size and
+    one slot in each of the three dicts, plus the eviction policy's own
+    bookkeeping.
+    """
+    overhead = (2 * sys.getsizeof('') + sys.getsizeof(0.0) + sys.getsizeof(0) +
+                3 * DICT_SLOT_SIZE)
+    if policy is not None:
+        overhead += policy.entry_overhead
+    return overhead
+
+
+def _share(total, parts, index):
+    "Part ``index`` of ``total`` split into ``parts`` parts that add up to it."
+    return total // parts + (1 if index < total % parts else 0)
+
+
+class CacheSegment(object):
+    """
+    One slice of a local memory cache, with its own lock, its own
+    ``_cache``/``_expire_info`` dicts and its own eviction policy. Values
+    are stored as given; encoding is left to the caller so it happens
+    outside the lock.
+
+    With ``lock_free_reads`` lookups skip the reader lock and rely on single
+    dict operations being atomic. Writers store the value before its expiry
+    and deletes drop the expiry first, so a reader that sees a live expiry
+    finds a value that was current at some point during the call (or none,
+    which is treated as a miss). Only removing an expired key takes the
+    writer lock.
+
+    Expiry times are also filed in a timer wheel so expired keys can be
+    reclaimed without being read: every write removes up to
+    ``sweep_batch`` of them, and ``sweep()`` can be called from a
+    background thread. Without either the wheel is not kept.
+
+    The size of every entry is tracked in ``_sizes`` and their total in
+    ``bytes_used``; with ``max_bytes`` keys are evicted until a new entry
+    fits in the budget.
+    """
+    def __init__(self, max_entries=0, max_bytes=0, policy_class=None,
+                 cull_frequency=3, lock_free_reads=False, sweep_batch=0,
+                 sweep=False):
+        self._cache = {}
+        self._expire_info = {}
+        self._sizes = {}
+        self.bytes_used = 0
+        self._lock = RWLock()
+        self._lock_free_reads = lock_free_reads
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._policy = None
+        if max_entries or max_bytes:
+            self._policy = policy_class(max_entries or DEFAULT_POLICY_CAPACITY,
+                                        cull_frequency)
+        self.entry_overhead = _entry_overhead(self._policy)
+        self._sweep_batch = sweep_batch
+        self._wheel = None
+        if sweep_batch or sweep:
+            self._wheel = TimerWheel()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        policy = self._policy
+        if self._lock_free_reads:
             exp = self._expire_info.get(key)
-            if exp is None or exp <= time.time():
-                try:
-                    pickled = self.encode(value)
-                    self._set(key, pickled, timeout)
-                    return True
-                except PickleException:
-                    pass
+            if exp is None:
+                if policy is not None and policy.record_misses:
+                    policy.touch(key)
+                return _MISSING
+            elif exp > time.time():
+                if policy is not None:
+                    policy.touch(key)
+                return self._cache.get(key, _MISSING)
+            self._delete_expired(key)
+            return _MISSING
+
+        with self._lock.reader():
+            exp = self._expire_info.get(key)
+            if exp is None:
+                if policy is not None and policy.record_misses:
+                    policy.touch(key)
+                return _MISSING
+            elif exp > time.time():
+                if policy is not None:
+                    policy.touch(key)
+                return self._cache[key]
+        self._delete_expired(key)
+        return _MISSING
+
+    def get_many(self, keys):
+        """
+        Returns a dict of the stored values of the live keys among ``keys``,
+        taking the reader lock once. Expired keys found on the way are
+        removed together under a single writer lock.
+        """
+        policy = self._policy
+        found = {}
+        expired = []
+        now = time.time()
+        expire_info = self._expire_info
+        cache = self._cache
+        if self._lock_free_reads:
+            for key in keys:
+                exp = expire_info.get(key)
+                if exp is None:
+                    continue
+                elif exp > now:
+                    value = cache.get(key, _MISSING)
+                    if value is not _MISSING:
+                        found[key] = value
+                else:
+                    expired.append(key)
+        else:
+            with self._lock.reader():
+                for key in keys:
+                    exp = expire_info.get(key)
+                    if exp is None:
+                        continue
+                    elif exp > now:
+                        found[key] = cache[key]
+                    else:
+                        expired.append(key)
+        if policy is not None:
+            touched = keys if policy.record_misses else found
+            for key in touched:
+                policy.touch(key)
+        if expired:
+            with self._lock.writer():
+                now = time.time()
+                for key in expired:
+                    exp = expire_info.get(key)
+                    if exp is not None and exp <= now:
+                        self._delete(key)
+        return found
+
+    def has_key(self, key):
+        if self._lock_free_reads:
+            exp = self._expire_info.get(key)
+            if exp is None:
+                return False
+            elif exp > time.time():
+                return True
+            self._delete_expired(key)
             return False
 
-    def get(self, key, default=None, version=None):
-        key = self.make_key(key, version=version)
-        self.validate_key(key)
         with self._lock.reader():
             exp = self._expire_info.get(key)
             if exp is None:
-                return default
+                return False
             elif exp > time.time():
-                pickled = self._cache[key]
-                return self.decode(pickled, default)
+                return True
+        self._delete_expired(key)
+        return False
+
+    def _delete_expired(self, key):
+        with self._lock.writer():
+            # The key may have been set again since the caller looked.
+            exp = self._expire_info.get(key)
+            if exp is not None and exp <= time.time():
+                self._delete(key)
+
+    def set(self, key, value, exp):
+        with self._lock.writer():
+            return self._set(key, value, exp)
+
+    def set_many(self, items, exp):
+        """
+        Stores a list of ``(key, value)`` pairs under one writer lock,
+        reclaiming expired keys once for the whole batch.
+        """
+        with self._lock.writer():
+            if self._sweep_batch:
+                self._sweep(self._sweep_batch * len(items))
+            for key, value in items:
+                self._set(key, value, exp, sweep=False)
+
+    def add(self, key, value, exp):
+        with self._lock.writer():
+            old_exp = self._expire_info.get(key)
+            if old_exp is None or old_exp <= time.time():
+                return self._set(key, value, exp)
+            return False
+
+    def add_many(self, items, exp):
+        """
+        add() for a list of ``(key, value)`` pairs under one writer lock.
+        Returns the keys that were not stored.
+        """
+        now = time.time()
+        refused = []
+        with self._lock.writer():
+            if self._sweep_batch:
+                self._sweep(self._sweep_batch * len(items))
+            for key, value in items:
+                old_exp = self._expire_info.get(key)
+                if (old_exp is not None and old_exp > now or
+                        not self._set(key, value, exp, sweep=False)):
+                    refused.append(key)
+        return refused
+
+    def update(self, key, func):
+        """
+        Replaces the value of a live key by ``func(value)`` under a single
+        writer lock, keeping its expiry. Returns the new value, or _MISSING
+        if the key is missing or expired.
+        """
+        with self._lock.writer():
+            exp = self._expire_info.get(key)
+            if exp is None or exp <= time.time():
+                return _MISSING
+            value = func(self._cache[key])
+            self._cache[key] = value
+            size = _sizeof(key, value)
+            self.bytes_used += size - self._sizes[key]
+            self._sizes[key] = size
+            return value
+
+    def delete(self, key):
         with self._lock.writer():
+            self._delete(key)
+
+    def delete_many(self, keys):
+        with self._lock.writer():
+            for key in keys:
+                self._delete(key)
+
+    def sweep(self, limit=None):
+        """
+        Removes up to ``limit`` expired keys, taking the writer lock once
+        per batch. Returns the number of keys removed.
+        """
+        if self._wheel is None:
+            return 0
+        batch = self._sweep_batch or 128
+        removed = 0
+        while limit is None or removed < limit:
+            if limit is not None:
+                batch = min(batch, limit - removed)
+            with self._lock.writer():
+                n = self._sweep(batch)
+            removed += n
+            if n < batch:
+                break
+        return removed
+
+    def clear(self):
+        with self._lock.writer():
+            self._cache.clear()
+            self._expire_info.clear()
+            self._sizes.clear()
+            self.bytes_used = 0
+            if self._policy is not None:
+                self._policy.clear()
+            if self._wheel is not None:
+                self._wheel.clear()
+
+    def _sweep(self, limit):
+        expire_info = self._expire_info
+        expired = self._wheel.expired(limit=limit)
+        for key, exp in expired:
+            # Stale entries for keys that were set again are skipped.
+            if expire_info.get(key) == exp:
+                self._delete(key)
+        return len(expired)
+
+    def _set(self, key, value, exp, sweep=True):
+        """
+        Stores the value, evicting other keys first if the segment is full.
+        Returns False if the value does not fit or the eviction policy
+        refused to admit it; an older value of the key is dropped then, as
+        it is no longer current.
+        """
+        # Reclaim expired keys first so they make room before live ones
+        # are evicted.
+        if sweep and self._sweep_batch:
+            self._sweep(self._sweep_batch)
+        size = _sizeof(key, value)
+        policy = self._policy
+        if policy is not None:
+            if not self._make_room(key, size):
+                if key in self._cache:
+                    self._delete(key)
+                return False
+            policy.insert(key)
+        wheel = self._wheel
+        if wheel is not None:
+            old_exp = self._expire_info.get(key)
+            if old_exp is not None:
+                wheel.cancel(key, old_exp)
+            wheel.schedule(key, exp)
+        self._cache[key] = value
+        self._expire_info[key] = exp
+        self.bytes_used += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        return True
+
+    def _make_room(self, key, size):
+        policy = self._policy
+        if (self._max_entries and key not in self._cache and
+                len(self._cache) >= self._max_entries):
+            doomed = policy.evict(key)
+            if doomed is None:
+                return False
+            for k in doomed:
+                self._delete(k)
+        if self._max_bytes:
+            if size > self._max_bytes:
+                return False
+            while self.bytes_used - self._sizes.get(key, 0) + size > self._max_bytes:
+                doomed = policy.evict(key)
+                if doomed is None:
+                    return False
+                if not doomed:
+                    break
+                for k in doomed:
+                    self._delete(k)
+        return True
+
+    def _delete(self, key):
+        # Expiry first: lock-free readers treat a key without one as missing.
+        exp = self._expire_info.pop(key, None)
+        if exp is not None and self._wheel is not None:
+            self._wheel.cancel(key, exp)
+        self._cache.pop(key, None)
+        self.bytes_used -= self._sizes.pop(key, 0)
+        if self._policy is not None:
+            self._policy.remove(key)
+
+
+class Sweeper(threading.Thread):
+    "Background thread that reclaims expired keys from a set of segments."
+    def __init__(self, segments, interval):
+        super(Sweeper, self).__init__(name='kvcache-locmem-sweeper')
+        self.daemon = True
+        self.segments = segments
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            for segment in self.segments:
+                segment.sweep()
+
+
+class LocMemCache(BaseCache):
+    """
+    In-process cache. Values are pickled by default so callers always get
+    a private copy back; with ``serialize=False`` the objects themselves
+    are stored and returned, optionally copied on every read according to
+    ``copy_on_read`` ('none', 'shallow' or 'deep'). Without a copy, callers
+    must not mutate what they get back or what they have stored.
+
+    Caches of the same name share their data; a cache built with a name
+    of None has data of its own that is freed with it.
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        global _segments
+        options = params.get('OPTIONS', {})
+
+        self._serialize = parse_bool(
+            params.get('serialize', options.get('SERIALIZE', True)))
+        copy_on_read = params.get('copy_on_read', options.get('COPY_ON_READ', 'none'))
+        try:
+            self._copy = COPY_ON_READ[copy_on_read.lower()]
+        except (KeyError, AttributeError):
+            raise InvalidCacheBackendError(
+                "Unknown copy_on_read policy '%s'" % copy_on_read)
+
+        segments = params.get('segments', options.get('SEGMENTS', 1))
+        try:
+            segments = max(int(segments), 1)
+        except (ValueError, TypeError):
+            segments = 1
+
+        lock_free_reads = parse_bool(
+            params.get('lock_free_reads', options.get('LOCK_FREE_READS', False)))
+
+        sweep_batch = params.get('sweep_batch', options.get('SWEEP_BATCH', 16))
+        try:
+            sweep_batch = max(int(sweep_batch), 0)
+        except (ValueError, TypeError):
+            sweep_batch = 16
+
+        sweep_interval = params.get('sweep_interval', options.get('SWEEP_INTERVAL', 0))
+        try:
+            sweep_interval = float(sweep_interval)
+        except (ValueError, TypeError):
+            sweep_interval = 0
+
+        max_bytes = params.get('max_bytes', options.get('MAX_BYTES', 0))
+        try:
+            max_bytes = max(int(max_bytes), 0)
+        except (ValueError, TypeError):
+            max_bytes = 0
+
+        # Eviction bookkeeping is only needed when the cache is bounded.
+        policy_class = None
+        if self._max_entries or max_bytes:
+            policy = params.get('policy', options.get('POLICY', 'lru'))
             try:
-                del self._cache[key]
-                del self._expire_info[key]
-            except KeyError:
-                pass
-            return default
+                policy_class = get_policy_class(policy)
+            except ValueError, e:
+                raise InvalidCacheBackendError(e)
 
-    def _set(self, key, value, timeout=None):
-        if self._max_entries and len(self._cache) >= self._max_entries:
-            self._cull()
+        # A segment with a limit of 0 would be unbounded.
+        if self._max_entries and segments > self._max_entries:
+            raise InvalidCacheBackendError(
+                "max_entries (%d) must be at least the number of segments (%d)"
+                % (self._max_entries, segments))
+        if max_bytes and segments > max_bytes:
+            raise InvalidCacheBackendError(
+                "max_bytes (%d) must be at least the number of segments (%d)"
+                % (max_bytes, segments))
+
+        # A private cache (no name) shares its segments with no one and
+        # is freed with the instance, so it gets no sweeper thread either.
+        private = name is None
+        if private:
+            sweep_interval = 0
+        new_segments = lambda: [
+            CacheSegment(max_entries=_share(self._max_entries, segments, i),
+                         max_bytes=_share(max_bytes, segments, i),
+                         policy_class=policy_class,
+                         cull_frequency=self._cull_frequency,
+                         lock_free_reads=lock_free_reads,
+                         sweep_batch=sweep_batch,
+                         sweep=sweep_interval > 0)
+            for i in range(segments)]
+
+        if private:
+            self._segments = new_segments()
+            return
+        self._segments = _segments.get(name)
+        if self._segments is None:
+            # The limits are shared out so the segments' add up to them.
+            self._segments = _segments.setdefault(name, new_segments())
+            if sweep_interval > 0 and _sweepers.get(name) is None:
+                sweeper = _sweepers.setdefault(name, Sweeper(self._segments, sweep_interval))
+                if not sweeper.is_alive():
+                    sweeper.start()
+
+    def _segment(self, key):
+        segments = self._segments
+        if len(segments) == 1:
+            return segments[0]
+        return segments[hash(key) % len(segments)]
+
+    def _group(self, items, pairs=False):
+        """
+        Splits a list of keys, or of ``(key, value)`` pairs, into a list of
+        ``(segment, items)`` so each segment can be handled in one call.
+        """
+        segments = self._segments
+        if len(segments) == 1:
+            return [(segments[0], items)]
+        n = len(segments)
+        groups = {}
+        for item in items:
+            key = item[0] if pairs else item
+            groups.setdefault(hash(key) % n, []).append(item)
+        return [(segments[i], group) for i, group in groups.items()]
+
+    def _make_keys(self, keys, version=None):
+        "Returns a dict mapping made keys to the caller's keys."
+        made = {}
+        for key in keys:
+            new_key = self.make_key(key, version=version)
+            self.validate_key(new_key)
+            made[new_key] = key
+        return made
+
+    def _get_expiry(self, timeout):
         if timeout is None:
             timeout = self.default_timeout
-        self._cache[key] = value
-        self._expire_info[key] = time.time() + timeout
+        return time.time() + timeout
+
+    def _store(self, value):
+        if self._serialize and type(value) not in _COUNTER_TYPES:
+            return self.encode(value)
+        return value
+
+    def _load(self, stored, default=None):
+        if self._serialize:
+            if type(stored) in _COUNTER_TYPES:
+                return stored
+            return self.decode(stored, default)
+        if self._copy is not None:
+            return self._copy(stored)
+        return stored
+
+    def add(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            stored = self._store(value)
+        except PickleException:
+            return False
+        return self._segment(key).add(key, stored, self._get_expiry(timeout))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        stored = self._segment(key).get(key)
+        if stored is _MISSING:
+            return default
+        return self._load(stored, default)
 
     def set(self, key, value, timeout=None, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        with self._lock.writer():
-            try:
-                pickled = self.encode(value)
-                self._set(key, pickled, timeout)
-            except PickleException:
-                pass
+        try:
+            stored = self._store(value)
+        except PickleException:
+            return
+        self._segment(key).set(key, stored, self._get_expiry(timeout))
 
     def incr(self, key, delta=1, version=None):
-        value = self.get(key, version=version)
-        if value is None:
+        """
+        Adds delta to the value in place under one lock acquisition, keeping
+        the key's expiry. Concurrent increments are never lost.
+        """
+        made_key = self.make_key(key, version=version)
+        self.validate_key(made_key)
+        result = []
+
+        def add_delta(stored):
+            value = self._load(stored)
+            if value is None:
+                raise ValueError("Key '%s' not found" % key)
+            result.append(value + delta)
+            return self._store(result[0])
+
+        if self._segment(made_key).update(made_key, add_delta) is _MISSING:
             raise ValueError("Key '%s' not found" % key)
-        new_value = value + delta
-        key = self.make_key(key, version=version)
-        with self._lock.writer():
+        return result[0]
+
+    def get_many(self, keys, version=None):
+        made = self._make_keys(keys, version)
+        result = {}
+        for segment, group in self._group(list(made)):
+            for key, stored in segment.get_many(group).items():
+                value = self._load(stored)
+                if value is not None:
+                    result[made[key]] = value
+        return result
+
+    def set_many(self, data, timeout=None, version=None):
+        exp = self._get_expiry(timeout)
+        items = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
             try:
-                pickled = self.encode(new_value)
-                self._cache[key] = pickled
+                items.append((key, self._store(value)))
             except PickleException:
                 pass
-        return new_value
-
-    def has_key(self, key, version=None):
-        key = self.make_key(key, version=version)
-        self.validate_key(key)
-        with self._lock.reader():
-            exp = self._expire_info.get(key)
-            if exp is None:
-                return False
-            elif exp > time.time():
-                return True
+        for segment, group in self._group(items, pairs=True):
+            segment.set_many(group, exp)
 
-        with self._lock.writer():
+    def add_many(self, data, timeout=None, version=None):
+        exp = self._get_expiry(timeout)
+        made = {}
+        items = []
+        refused = []
+        for key, value in data.items():
+            new_key = self.make_key(key, version=version)
+            self.validate_key(new_key)
             try:
-                del self._cache[key]
-                del self._expire_info[key]
-            except KeyError:
-                pass
-            return False
+                items.append((new_key, self._store(value)))
+            except PickleException:
+                refused.append(key)
+                continue
+            made[new_key] = key
+        for segment, group in self._group(items, pairs=True):
+            refused.extend(made[key] for key in segment.add_many(group, exp))
+        return refused
 
-    def _cull(self):
-        if self._cull_frequency == 0:
-            self.clear()
-        else:
-            doomed = [k for (i, k) in enumerate(self._cache) if i % self._cull_frequency == 0]
-            for k in doomed:
-                self._delete(k)
+    def delete_many(self, keys, version=None):
+        made = self._make_keys(keys, version)
+        for segment, group in self._group(list(made)):
+            segment.delete_many(group)
 
-    def _delete(self, key):
-        try:
-            del self._cache[key]
-        except KeyError:
-            pass
-        try:
-            del self._expire_info[key]
-        except KeyError:
-            pass
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._segment(key).has_key(key)
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        with self._lock.writer():
-            self._delete(key)
+        self._segment(key).delete(key)
+
+    @property
+    def bytes_used(self):
+        """
+        Bytes charged for the stored entries: key lengths plus encoded
+        value lengths. Add ``len(self) * self.entry_overhead`` for an
+        estimate of the memory held by the cache.
+        """
+        return sum(segment.bytes_used for segment in self._segments)
+
+    @property
+    def entry_overhead(self):
+        "Approximate bookkeeping bytes per entry not counted in bytes_used."
+        return self._segments[0].entry_overhead
+
+    def __len__(self):
+        return sum(len(segment) for segment in self._segments)
+
+    def sweep(self, limit=None):
+        """
+        Removes expired keys that nobody has read since they expired.
+        Returns the number of keys removed.
+        """
+        return sum(segment.sweep(limit) for segment in self._segments)
 
     def clear(self):
-        self._cache.clear()
-        self._expire_info.clear()
+        for segment in self._segments:
+            segment.clear()
 
 # For backwards compatibility
 class CacheClass(LocMemCache):
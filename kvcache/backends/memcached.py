@@ -15,7 +15,6 @@ class BaseMemcachedCache(BaseCache):
             self._servers = server.split(';')
         else:
             self._servers = server
-        print self._servers
 
         # The exception type to catch from the underlying library for a key
         # that was not found. This is a ValueError for python-memcache,
@@ -26,6 +25,27 @@ class BaseMemcachedCache(BaseCache):
         self._lib = library
         self._options = params
 
+        # Values are serialized and compressed by the memcached client, not
+        # by encode(); hand it the configured threshold instead. The client
+        # only knows zlib at its own level, so other codecs are refused
+        # rather than quietly ignored.
+        self._min_compress_len = 0
+        if self.compressor is not None:
+            options = params.get('OPTIONS', {})
+            compress = params.get('compress', options.get('COMPRESS'))
+            if compress not in ('zlib', 'auto'):
+                raise InvalidCacheBackendError(
+                    "The memcached client only compresses with zlib, not '%s'" % compress)
+            self._min_compress_len = self.compressor.threshold
+
+    @property
+    def compression_ratio(self):
+        """
+        Always None: the memcached client compresses values itself and does
+        not report the sizes it stored.
+        """
+        return None
+
     @property
     def _cache(self):
         """
@@ -58,7 +78,8 @@ class BaseMemcachedCache(BaseCache):
 
     def add(self, key, value, timeout=0, version=None):
         key = self.make_key(key, version=version)
-        return self._cache.add(key, value, self._get_memcache_timeout(timeout))
+        return self._cache.add(key, value, self._get_memcache_timeout(timeout),
+                               min_compress_len=self._min_compress_len)
 
     def get(self, key, default=None, version=None):
         key = self.make_key(key, version=version)
@@ -69,7 +90,8 @@ class BaseMemcachedCache(BaseCache):
 
     def set(self, key, value, timeout=0, version=None):
         key = self.make_key(key, version=version)
-        self._cache.set(key, value, self._get_memcache_timeout(timeout))
+        self._cache.set(key, value, self._get_memcache_timeout(timeout),
+                        min_compress_len=self._min_compress_len)
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
@@ -130,7 +152,22 @@ class BaseMemcachedCache(BaseCache):
         for key, value in data.items():
             key = self.make_key(key, version=version)
             safe_data[key] = value
-        self._cache.set_multi(safe_data, self._get_memcache_timeout(timeout))
+        self._cache.set_multi(safe_data, self._get_memcache_timeout(timeout),
+                              min_compress_len=self._min_compress_len)
+
+    def add_many(self, data, timeout=0, version=None):
+        """
+        One ``add_multi`` call where the client has it (pylibmc);
+        python-memcached has none and adds the keys one by one.
+        """
+        add_multi = getattr(self._cache, 'add_multi', None)
+        if add_multi is None:
+            return super(BaseMemcachedCache, self).add_many(data, timeout, version=version)
+        made = dict((self.make_key(key, version=version), key) for key in data)
+        failed = add_multi(dict((key, data[made[key]]) for key in made),
+                           self._get_memcache_timeout(timeout),
+                           min_compress_len=self._min_compress_len)
+        return [made[key] for key in failed]
 
     def delete_many(self, keys, version=None):
         l = lambda x: self.make_key(x, version=version)
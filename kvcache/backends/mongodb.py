@@ -1,8 +1,5 @@
 import time
-from .db import BaseDatabaseCache
-from django.db import connections, router
-import pymongo
-import bson
+from .dbbase import BaseDatabaseCache
 
 
 class MongoDBCache(BaseDatabaseCache):
@@ -63,6 +60,7 @@ class MongoDBCache(BaseDatabaseCache):
         expires = now + (timeout or self.default_timeout)
         new_document = {'_id': key, 'v': value, 'e': expires}
 
+        import bson
         try:
             collection.save(new_document)
         except bson.errors.InvalidDocument:
@@ -77,6 +75,7 @@ class MongoDBCache(BaseDatabaseCache):
         return True
 
     def incr(self, key, delta=1, version=None):
+        import pymongo
         key = self.make_key(key, version=version)
         collection = self._collection_for_write()
         update_args = [{'_id': key}, {'$inc': {'v': delta}}]
@@ -106,6 +105,7 @@ class MongoDBCache(BaseDatabaseCache):
         self._collection_for_write().drop()
 
     def _cull(self, collection):
+        import pymongo
         if self._cull_frequency == 0:
             self.clear()
             return
@@ -121,9 +121,11 @@ class MongoDBCache(BaseDatabaseCache):
             collection.remove({'e': {'$lt': cut['e']}}, safe=True)
 
     def _collection_for_read(self):
+        from django.db import connections, router
         db = router.db_for_read(self.cache_model_class)
         return connections[db].database[self._table]
 
     def _collection_for_write(self):
+        from django.db import connections, router
         db = router.db_for_write(self.cache_model_class)
         return connections[db].database[self._table]
@@ -5,23 +5,27 @@ import base64
 import time
 import logging
 from datetime import datetime
-from .dbbase import DatabaseCache, BaseCache
-from .base import MEMCACHE_MAX_KEY_LENGTH
-import MySQLdb
+from .dbbase import DatabaseCache
+from .base import MEMCACHE_MAX_KEY_LENGTH, InvalidCacheBackendError
 
 
 class MySQLDatabaseCache(DatabaseCache):
     place_hold = '%s'
 
     def __init__(self, url, params):
-        BaseCache.__init__(self, params)
+        try:
+            import MySQLdb
+        except ImportError:
+            raise InvalidCacheBackendError(
+                "MySQL cache backend requires the 'MySQLdb' library")
+        self._driver = MySQLdb
+        DatabaseCache.__init__(self, params)
         self._url = url
         self.db = url.path
         if self.db.find('.') != -1:
             self.db, self._table = self.db.rsplit('.', 1)
         else:
             self._table = params.get('table', 'kvcache')
-        self.create()
 
     def create(self):
         ''' create collection '''
@@ -51,14 +55,13 @@ class MySQLDatabaseCache(DatabaseCache):
 
     def conn(self):
         url = self._url
-        print url.hostname, url.port, url.username, url.password, self.db
         try:
-            self._conn = MySQLdb.connect(
+            self._conn = self._driver.connect(
                 host=url.hostname, port=url.port or 3306,
                 user=url.username, passwd=url.password,
                 db=self.db.lstrip('/'))
             return True
-        except MySQLdb.OperationalError, err:
+        except self._driver.OperationalError, err:
             pass
         return False
 
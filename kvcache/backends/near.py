@@ -0,0 +1,300 @@
+"""
+Two-level cache: a small in-process cache in front of a remote backend.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+from .base import BaseCache, InvalidCacheBackendError, parse_bool
+from .locmem import LocMemCache
+from ..utils.encoding import smart_str
+
+INVALIDATION_MODES = ('none', 'pubsub', 'version')
+
+_MISSING = object()
+
+
+def _raw_key(key, key_prefix, version):
+    "L1 keys are already made by the near cache."
+    return key
+
+
+class TierStats(object):
+    """
+    Hit and miss counters of one tier. Updates are not locked and may miss
+    a few increments under heavy concurrency.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hit_ratio}
+
+
+class Subscriber(threading.Thread):
+    "Drops L1 entries named on a Redis pub/sub channel by other nodes."
+    def __init__(self, cache, client, channel):
+        super(Subscriber, self).__init__(name='kvcache-near-subscriber')
+        self.daemon = True
+        self._cache = cache
+        self._pubsub = client.pubsub()
+        self._pubsub.subscribe(channel)
+
+    def run(self):
+        try:
+            for message in self._pubsub.listen():
+                if message.get('type') == 'message':
+                    self._cache._invalidated(message['data'])
+        except Exception:
+            # The connection was closed by stop(), or lost: L1 entries
+            # still expire after l1_timeout.
+            pass
+
+    def stop(self):
+        try:
+            self._pubsub.unsubscribe()
+            self._pubsub.close()
+        except Exception:
+            pass
+
+
+class NearCache(BaseCache):
+    """
+    Reads go to a bounded in-process L1 first and to the remote backend
+    (L2) on a miss; values read from L2 are kept in L1 for ``l1_timeout``
+    seconds. Writes go to L2 and then to L1, so a node reads its own
+    writes.
+
+    Other nodes' writes are only seen once the L1 copy expires, unless
+    ``invalidation`` is set:
+
+    * ``pubsub``: every write publishes the key on a Redis channel and
+      every node drops it from its L1. Needs a ``redis://`` backend.
+    * ``version``: every write bumps a stamp key in L2. Each node reads the
+      stamp at most every ``stamp_interval`` seconds and empties its L1
+      when another node changed it. Works with any backend.
+
+    The remote backend is given by URI or as a cache instance:
+    ``get_cache('near://', remote='redis://127.0.0.1:6379', l1_timeout=5)``.
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+
+        remote = params.get('remote', options.get('REMOTE'))
+        if remote is None or remote == '':
+            raise InvalidCacheBackendError("The near cache needs a 'remote' backend")
+        # Built from a URI, the backend is ours to close; an instance is
+        # left to its owner.
+        self._own_cache = isinstance(remote, basestring)
+        if self._own_cache:
+            from .. import get_cache
+            remote = get_cache(remote, reuse=False)
+        self.l2 = remote
+
+        l1_timeout = params.get('l1_timeout', options.get('L1_TIMEOUT', 5))
+        l1_max_entries = params.get('l1_max_entries', options.get('L1_MAX_ENTRIES', 1000))
+        try:
+            self.l1_timeout = float(l1_timeout)
+            l1_max_entries = int(l1_max_entries)
+        except (ValueError, TypeError), e:
+            raise InvalidCacheBackendError("Invalid near cache L1 settings: %s" % e)
+        # Private: the L1 is not kept in the global locmem table and goes
+        # away with this cache.
+        self.l1 = LocMemCache(None, {
+            'max_entries': l1_max_entries,
+            'policy': params.get('l1_policy', options.get('L1_POLICY', 'lru')),
+            'serialize': parse_bool(params.get('l1_serialize', options.get('L1_SERIALIZE', True))),
+            'KEY_FUNCTION': _raw_key,
+        })
+        self.l1_stats = TierStats()
+        self.l2_stats = TierStats()
+
+        self._node = '%s-%d' % (uuid.uuid4().hex, os.getpid())
+        channel = params.get('channel', options.get('CHANNEL', 'kvcache:near'))
+        self._channel = smart_str(channel)
+        self._stamp_key = '%s:stamp' % channel
+        self._stamp = None
+        self._stamp_checked = 0
+        stamp_interval = params.get('stamp_interval', options.get('STAMP_INTERVAL', 1))
+        try:
+            self._stamp_interval = float(stamp_interval)
+        except (ValueError, TypeError):
+            self._stamp_interval = 1.0
+
+        self.invalidation = params.get('invalidation', options.get('INVALIDATION', 'none'))
+        if self.invalidation not in INVALIDATION_MODES:
+            raise InvalidCacheBackendError(
+                "Unknown near cache invalidation '%s'" % self.invalidation)
+        self._subscriber = None
+        if self.invalidation == 'pubsub':
+            client = getattr(self.l2, '_client', None)
+            if client is None or not hasattr(client, 'pubsub'):
+                raise InvalidCacheBackendError(
+                    "pubsub invalidation needs a redis backend")
+            self._subscriber = Subscriber(self, client, self._channel)
+            self._subscriber.start()
+
+    def _l1_expiry(self, timeout):
+        if timeout is None:
+            timeout = self.l2.default_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _check_stamp(self):
+        now = time.time()
+        if now - self._stamp_checked < self._stamp_interval:
+            return
+        self._stamp_checked = now
+        stamp = self.l2.get(self._stamp_key)
+        if stamp != self._stamp:
+            if self._stamp is not None:
+                self.l1.clear()
+            self._stamp = stamp
+
+    def _written(self, *keys):
+        "Tells the other nodes that ``keys`` (made keys) changed."
+        if self.invalidation == 'pubsub':
+            client = self.l2._client
+            for key in keys:
+                client.publish(self._channel, '%s %s' % (self._node, smart_str(key)))
+        elif self.invalidation == 'version':
+            try:
+                stamp = self.l2.incr(self._stamp_key)
+            except ValueError:
+                self.l2.add(self._stamp_key, 0, 86400 * 30)
+                stamp = self.l2.incr(self._stamp_key)
+            # Our own bump needs no flush; anyone else's in between does.
+            if self._stamp is not None and stamp != self._stamp + 1:
+                self.l1.clear()
+            self._stamp = stamp
+
+    def _invalidated(self, message):
+        node, key = message.split(' ', 1)
+        if node != self._node:
+            self.l1.delete(key)
+
+    def add(self, key, value, timeout=None, version=None):
+        made = self.make_key(key, version=version)
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self._written(made)
+            self.l1.set(made, value, self._l1_expiry(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        made = self.make_key(key, version=version)
+        if self.invalidation == 'version':
+            self._check_stamp()
+        value = self.l1.get(made, _MISSING)
+        if value is not _MISSING:
+            self.l1_stats.hits += 1
+            return value
+        self.l1_stats.misses += 1
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self.l2_stats.misses += 1
+            return default
+        self.l2_stats.hits += 1
+        self.l1.set(made, value, self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        made = self.make_key(key, version=version)
+        self.l2.set(key, value, timeout, version=version)
+        self._written(made)
+        self.l1.set(made, value, self._l1_expiry(timeout))
+
+    def delete(self, key, version=None):
+        made = self.make_key(key, version=version)
+        self.l2.delete(key, version=version)
+        self.l1.delete(made)
+        self._written(made)
+
+    def get_many(self, keys, version=None):
+        if self.invalidation == 'version':
+            self._check_stamp()
+        made = dict((self.make_key(key, version=version), key) for key in keys)
+        result = {}
+        for made_key, value in self.l1.get_many(made).items():
+            result[made[made_key]] = value
+        self.l1_stats.hits += len(result)
+        missing = [key for key in keys if key not in result]
+        self.l1_stats.misses += len(missing)
+        if missing:
+            fetched = self.l2.get_many(missing, version=version)
+            self.l2_stats.hits += len(fetched)
+            self.l2_stats.misses += len(missing) - len(fetched)
+            if fetched:
+                self.l1.set_many(
+                    dict((self.make_key(key, version=version), value)
+                         for key, value in fetched.items()),
+                    self.l1_timeout)
+                result.update(fetched)
+        return result
+
+    def set_many(self, data, timeout=None, version=None):
+        self.l2.set_many(data, timeout, version=version)
+        made = dict((self.make_key(key, version=version), value)
+                    for key, value in data.items())
+        self._written(*made)
+        self.l1.set_many(made, self._l1_expiry(timeout))
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version=version)
+        made = [self.make_key(key, version=version) for key in keys]
+        self.l1.delete_many(made)
+        self._written(*made)
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_key(key, version=version)
+        value = self.l2.incr(key, delta, version=version)
+        self.l1.delete(made)
+        self._written(made)
+        return value
+
+    def has_key(self, key, version=None):
+        made = self.make_key(key, version=version)
+        if self.invalidation == 'version':
+            self._check_stamp()
+        return self.l1.has_key(made) or self.l2.has_key(key, version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self.l1.clear()
+        self._stamp = None
+
+    def stats(self):
+        "Adds the hit ratios of each tier; L2 only sees the L1 misses."
+        stats = super(NearCache, self).stats()
+        stats.update({'l1': self.l1_stats.stats(), 'l2': self.l2_stats.stats()})
+        return stats
+
+    def reset_stats(self):
+        super(NearCache, self).reset_stats()
+        self.l1_stats.reset()
+        self.l2_stats.reset()
+
+    def close(self, **kwargs):
+        if self._subscriber is not None:
+            self._subscriber.stop()
+            self._subscriber = None
+        close = getattr(self.l2, 'close', None)
+        if self._own_cache and close is not None:
+            close(**kwargs)
+
+# For backwards compatibility
+class CacheClass(NearCache):
+    pass
@@ -0,0 +1,356 @@
+"""
+Replicated cache: every write goes to all replicas, every read to the
+fastest healthy one.
+"""
+
+import sys
+import threading
+import time
+
+from .base import BaseCache, InvalidCacheBackendError
+from .sharded import parse_shards
+from ..utils.batch import BatchExecutor
+from ..utils.stats import Histogram
+
+# Weight of the newest call in a replica's moving average latency.
+EWMA_WEIGHT = 0.2
+# Read latencies kept per replica for the hedging percentile; the window
+# slides by half this many calls at a time.
+WINDOW = 1000
+# Calls needed before a replica's percentile is trusted.
+MIN_SAMPLES = 20
+MIN_HEDGE_DELAY = 0.001
+# Keys written while a replica was down that are remembered to be dropped
+# from it when it comes back; past that, it is cleared instead.
+MAX_MISSED = 10000
+
+_TIMED_OUT = object()
+
+
+class Failed(object):
+    "A replica call that raised."
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+    def reraise(self):
+        raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+
+class Refused(Failed):
+    "A replica call that raised ValueError: an answer (incr() of a missing key)."
+
+
+class Replica(object):
+    "One replica with its latency and health."
+    def __init__(self, name, cache):
+        self.name = name
+        self.cache = cache
+        self.latency = 0.0
+        self.recent = Histogram()
+        self.previous = Histogram()
+        self.calls = 0
+        self.errors = 0
+        self.down_until = 0
+        self.downs = 0
+        # (key, version) pairs written while down, or None once too many.
+        self.missed = set()
+        self.lock = threading.Lock()
+
+    def up(self, now):
+        return self.down_until <= now
+
+    def observe(self, seconds):
+        self.latency += EWMA_WEIGHT * (seconds - self.latency)
+
+    def record(self, seconds):
+        self.calls += 1
+        self.observe(seconds)
+        self.recent.record(seconds)
+        if self.recent.count >= WINDOW // 2:
+            self.previous, self.recent = self.recent, Histogram()
+
+    def percentile(self, q):
+        window = Histogram()
+        window.merge(self.previous)
+        window.merge(self.recent)
+        if window.count < MIN_SAMPLES:
+            return None
+        return window.percentile(q)
+
+    def mark_down(self, retry_interval):
+        with self.lock:
+            if self.up(time.time()):
+                self.downs += 1
+            self.down_until = time.time() + retry_interval
+
+    def miss(self, keys):
+        with self.lock:
+            if self.missed is not None:
+                self.missed.update(keys)
+                if len(self.missed) > MAX_MISSED:
+                    self.missed = None
+
+    def miss_all(self):
+        "The replica must be cleared before it serves reads again."
+        with self.lock:
+            self.missed = None
+
+    def catch_up(self):
+        "Drops what changed while the replica was down. Returns False on failure."
+        with self.lock:
+            missed, self.missed = self.missed, set()
+        try:
+            if missed is None:
+                self.cache.clear()
+            else:
+                by_version = {}
+                for key, version in missed:
+                    by_version.setdefault(version, []).append(key)
+                for version, keys in by_version.items():
+                    self.cache.delete_many(keys, version=version)
+        except Exception:
+            if missed is None:
+                with self.lock:
+                    self.missed = None
+            else:
+                self.miss(missed)
+            return False
+        return True
+
+    def stats(self, now):
+        return {
+            'up': self.up(now),
+            'calls': self.calls,
+            'errors': self.errors,
+            'downs': self.downs,
+            'latency': self.latency,
+            'p50': self.percentile(0.5) or 0.0,
+            'p99': self.percentile(0.99) or 0.0,
+        }
+
+
+class ReplicatedCache(BaseCache):
+    """
+    Keeps the same data on every replica. Writes go to all replicas in
+    parallel and wait for them at most ``slow_timeout`` seconds. Reads go
+    to the healthy replica with the lowest moving average latency; if it
+    fails, or has not answered after ``slow_timeout`` seconds, the next one
+    is asked, so a stalled node costs a read at most that long.
+
+    With ``hedge`` set to a percentile (``hedge=0.95``), a second read is
+    sent to the next replica as soon as the first one is slower than that
+    percentile of its recent reads, and the first answer is used.
+
+    A replica that fails, or takes longer than ``slow_timeout``, is marked
+    down for ``retry_interval`` seconds and skipped meanwhile. Keys written
+    while it was down are deleted from it before it serves reads again.
+
+    ``get_cache('replicated://', replicas=['memcached://10.0.0.1:11211', 'memcached://10.0.0.2:11211'])``
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+
+        replicas = parse_shards(params.get('replicas', options.get('REPLICAS')))
+        if not replicas:
+            raise InvalidCacheBackendError("The replicated cache needs a list of 'replicas'")
+        hedge = params.get('hedge', options.get('HEDGE', 0))
+        slow_timeout = params.get('slow_timeout', options.get('SLOW_TIMEOUT', 0.5))
+        retry_interval = params.get('retry_interval', options.get('RETRY_INTERVAL', 5))
+        workers = params.get('workers', options.get('WORKERS', 16))
+        try:
+            self.hedge = float(hedge)
+            self.slow_timeout = float(slow_timeout)
+            self.retry_interval = float(retry_interval)
+            workers = int(workers)
+        except (ValueError, TypeError), e:
+            raise InvalidCacheBackendError("Invalid replicated cache settings: %s" % e)
+        if not 0 <= self.hedge < 1:
+            raise InvalidCacheBackendError("hedge must be a percentile between 0 and 1")
+
+        from .. import get_cache
+        self.replicas = []
+        # Replicas built from URIs are ours to close; instances are left to
+        # their owners.
+        self._owned = []
+        for index, replica in enumerate(replicas):
+            if isinstance(replica, basestring):
+                name, replica = replica, get_cache(replica, reuse=False)
+                self._owned.append(replica)
+            else:
+                name = 'replica-%d' % index
+            self.replicas.append(Replica(name, replica))
+        # Calls left running on a stalled replica must not hold up the
+        # batches of other caches: they get threads of their own, stopped
+        # by close().
+        self._executor = BatchExecutor(workers)
+
+    def _healthy(self):
+        "Replicas to read from, fastest first; all of them if none is up."
+        now = time.time()
+        up = []
+        for replica in self.replicas:
+            if replica.up(now):
+                if replica.missed or replica.missed is None:
+                    if not replica.catch_up():
+                        replica.mark_down(self.retry_interval)
+                        continue
+                up.append(replica)
+        if not up:
+            up = list(self.replicas)
+        up.sort(key=lambda replica: replica.latency)
+        return up
+
+    def _call(self, replica, func):
+        "Runs ``func(cache)`` on a replica, keeping track of its health."
+        start = time.time()
+        try:
+            result = func(replica.cache)
+        except ValueError:
+            # An answer (incr() of a missing key), not a failure.
+            raise
+        except Exception:
+            replica.errors += 1
+            replica.mark_down(self.retry_interval)
+            raise
+        elapsed = time.time() - start
+        replica.record(elapsed)
+        if elapsed > self.slow_timeout:
+            replica.mark_down(self.retry_interval)
+        return result
+
+    def _delay(self, replica):
+        if self.hedge:
+            delay = replica.percentile(self.hedge)
+            if delay is not None:
+                return min(max(delay, MIN_HEDGE_DELAY), self.slow_timeout)
+        return self.slow_timeout
+
+    def _read(self, func):
+        replicas = self._healthy()
+        start = time.time()
+        index, result = self._executor.first(
+            lambda replica: self._call(replica, func), replicas, self._delay(replicas[0]))
+        elapsed = time.time() - start
+        for replica in replicas[:index]:
+            # Lost the race: at least this slow, if not failed already.
+            replica.observe(elapsed)
+            if elapsed >= self.slow_timeout:
+                replica.mark_down(self.retry_interval)
+        return result
+
+    def _write(self, func, keys=(), version=None, clear=False):
+        """
+        Runs ``func(cache)`` on every healthy replica and returns the
+        result of the fastest one. Replicas that are down or fail miss the
+        write and remember ``keys`` to drop them later, or with ``clear``
+        to be cleared. A ValueError is an answer, raised again when no
+        replica succeeded.
+        """
+        def missed(replica):
+            if clear:
+                replica.miss_all()
+            else:
+                replica.miss((key, version) for key in keys)
+
+        now = time.time()
+        up, down = [], []
+        for replica in self.replicas:
+            (up if replica.up(now) else down).append(replica)
+        if not up:
+            up, down = list(self.replicas), []
+        for replica in down:
+            missed(replica)
+
+        def attempt(replica):
+            try:
+                return self._call(replica, func)
+            except ValueError:
+                return Refused(sys.exc_info())
+            except Exception:
+                return Failed(sys.exc_info())
+        results = self._executor.map(
+            attempt, up, self.slow_timeout, _TIMED_OUT)
+        answers = []
+        refused = []
+        failure = None
+        for replica, result in zip(up, results):
+            if result is _TIMED_OUT:
+                replica.mark_down(self.retry_interval)
+                missed(replica)
+            elif isinstance(result, Refused):
+                refused.append(replica)
+                failure = result
+            elif isinstance(result, Failed):
+                missed(replica)
+                failure = failure or result
+            else:
+                answers.append((replica.latency, result))
+        if not answers:
+            if failure is not None:
+                failure.reraise()
+            raise InvalidCacheBackendError("No replica answered in time")
+        # Refused where others succeeded: that replica is out of step.
+        for replica in refused:
+            missed(replica)
+        return min(answers)[1]
+
+    def add(self, key, value, timeout=None, version=None):
+        return self._write(lambda cache: cache.add(key, value, timeout, version=version),
+                           [key], version)
+
+    def get(self, key, default=None, version=None):
+        return self._read(lambda cache: cache.get(key, default, version=version))
+
+    def set(self, key, value, timeout=None, version=None):
+        self._write(lambda cache: cache.set(key, value, timeout, version=version),
+                    [key], version)
+
+    def delete(self, key, version=None):
+        self._write(lambda cache: cache.delete(key, version=version), [key], version)
+
+    def has_key(self, key, version=None):
+        return self._read(lambda cache: cache.has_key(key, version=version))
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        return self._read(lambda cache: cache.get_many(keys, version=version))
+
+    def set_many(self, data, timeout=None, version=None):
+        self._write(lambda cache: cache.set_many(data, timeout, version=version),
+                    list(data), version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._write(lambda cache: cache.delete_many(keys, version=version), keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._write(lambda cache: cache.incr(key, delta, version=version),
+                           [key], version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._write(lambda cache: cache.decr(key, delta, version=version),
+                           [key], version)
+
+    def clear(self):
+        # Replicas that do not acknowledge it are cleared when they are back.
+        self._write(lambda cache: cache.clear(), clear=True)
+
+    def stats(self):
+        "Adds the latency and health of every replica."
+        stats = super(ReplicatedCache, self).stats()
+        now = time.time()
+        stats['replicas'] = dict((replica.name, replica.stats(now))
+                                 for replica in self.replicas)
+        return stats
+
+    def close(self, **kwargs):
+        self._executor.shutdown()
+        for replica in self._owned:
+            close = getattr(replica, 'close', None)
+            if close is not None:
+                close(**kwargs)
+
+# For backwards compatibility
+class CacheClass(ReplicatedCache):
+    pass
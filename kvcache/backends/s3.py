@@ -8,18 +8,22 @@
 import time
 import hashlib
 
-from storages.backends import s3boto
-from django.core.files.base import ContentFile
-from .base import BaseCache, PickleException
+from .base import BaseCache, ParallelBatchMixin, PickleException, InvalidCacheBackendError
 
 
-class AmazonS3Cache(BaseCache):
+class AmazonS3Cache(ParallelBatchMixin, BaseCache):
 
     def __init__(self, location, params):
         """
             location is not used but otherwise Django crashes.
         """
 
+        try:
+            from storages.backends import s3boto
+        except ImportError:
+            raise InvalidCacheBackendError(
+                "S3 cache backend requires the 'django-storages' and 'boto' libraries")
+
         BaseCache.__init__(self, params)
 
         # Amazon and boto has a maximum limit of 1000 for get_all_keys(). See:
@@ -111,6 +115,7 @@ class AmazonS3Cache(BaseCache):
 
         self._cull()
 
+        from django.core.files.base import ContentFile
         try:
             now = time.time()
             content = self.encode((now + timeout, value))
@@ -0,0 +1,140 @@
+"""
+Sharded cache: spreads keys over several backends with a consistent hash ring.
+"""
+
+from .base import BaseCache, InvalidCacheBackendError
+from ..utils.batch import get_executor
+from ..utils.hashring import HashRing
+
+
+def parse_shards(shards):
+    "A list of URIs or cache instances, or URIs separated by ','."
+    if isinstance(shards, basestring):
+        shards = shards.split(',')
+    return [shard.strip() if isinstance(shard, basestring) else shard
+            for shard in shards or () if shard is not None and shard != '']
+
+
+class ShardedCache(BaseCache):
+    """
+    Every key lives on exactly one shard, picked on a consistent hash ring
+    with ``vnodes`` points per shard (default 160). Adding a shard to N
+    others only moves about 1/(N+1) of the keys, and removing one only
+    moves its own.
+
+    Shards are named on the ring by their URI, so a key stays on the same
+    shard whatever the order of the list; cache instances are named by
+    their position. get_many, set_many and delete_many make one batched
+    call per shard involved, all shards in parallel.
+
+    ``get_cache('sharded://', shards=['redis://10.0.0.1:6379', 'redis://10.0.0.2:6379'])``
+    or in a URI: ``sharded://?shards=redis://10.0.0.1:6379,redis://10.0.0.2:6379``.
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+
+        shards = parse_shards(params.get('shards', options.get('SHARDS')))
+        if not shards:
+            raise InvalidCacheBackendError("The sharded cache needs a list of 'shards'")
+        vnodes = params.get('vnodes', options.get('VNODES', 160))
+        try:
+            vnodes = int(vnodes)
+        except (ValueError, TypeError), e:
+            raise InvalidCacheBackendError("Invalid sharded cache vnodes: %s" % e)
+
+        from .. import get_cache
+        self.shards = {}
+        # Shards built from URIs are ours to close; instances are left to
+        # their owners.
+        self._owned = []
+        names = []
+        for index, shard in enumerate(shards):
+            if isinstance(shard, basestring):
+                name, shard = shard, get_cache(shard, reuse=False)
+                self._owned.append(shard)
+            else:
+                name = 'shard-%d' % index
+            if name in self.shards:
+                raise InvalidCacheBackendError("Shard '%s' is listed twice" % name)
+            self.shards[name] = shard
+            names.append(name)
+        self.ring = HashRing(names, vnodes)
+
+    def get_shard(self, key, version=None):
+        "Returns the cache holding ``key``."
+        return self.shards[self.ring.get_node(self.make_key(key, version=version))]
+
+    def _group(self, keys, version):
+        "Maps each shard name to the keys it holds, in their original order."
+        groups = {}
+        for key in keys:
+            node = self.ring.get_node(self.make_key(key, version=version))
+            groups.setdefault(node, []).append(key)
+        return groups
+
+    def _map_shards(self, func, groups):
+        "Runs ``func(shard, keys)`` for every group, shards in parallel."
+        shards = self.shards
+        return get_executor(self._batch_workers).map(
+            lambda item: func(shards[item[0]], item[1]), groups.items(),
+            self._batch_deadline)
+
+    def add(self, key, value, timeout=None, version=None):
+        return self.get_shard(key, version).add(key, value, timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        return self.get_shard(key, version).get(key, default, version=version)
+
+    def set(self, key, value, timeout=None, version=None):
+        self.get_shard(key, version).set(key, value, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.get_shard(key, version).delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get_shard(key, version).has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.get_shard(key, version).incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.get_shard(key, version).decr(key, delta, version=version)
+
+    def get_many(self, keys, version=None):
+        """
+        Shards that do not answer within ``batch_deadline`` are left out of
+        the result, like misses.
+        """
+        groups = self._group(keys, version)
+        result = {}
+        for values in self._map_shards(
+                lambda shard, keys: shard.get_many(keys, version=version), groups):
+            if values:
+                result.update(values)
+        return result
+
+    def set_many(self, data, timeout=None, version=None):
+        groups = self._group(data, version)
+        self._map_shards(
+            lambda shard, keys: shard.set_many(dict((key, data[key]) for key in keys),
+                                               timeout, version=version),
+            groups)
+
+    def delete_many(self, keys, version=None):
+        self._map_shards(lambda shard, keys: shard.delete_many(keys, version=version),
+                         self._group(keys, version))
+
+    def clear(self):
+        self._map_shards(lambda shard, keys: shard.clear(),
+                         dict((name, None) for name in self.shards))
+
+    def close(self, **kwargs):
+        for shard in self._owned:
+            close = getattr(shard, 'close', None)
+            if close is not None:
+                close(**kwargs)
+
+# For backwards compatibility
+class CacheClass(ShardedCache):
+    pass
@@ -0,0 +1,333 @@
+"Shared-memory cache backend for processes on the same host."
+
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from .base import BaseCache, PickleException, InvalidCacheBackendError
+from ..utils.encoding import smart_str
+
+MAGIC = b'KVSHM001'
+# magic, number of buckets, slots per bucket, slot size
+HEADER = struct.Struct('<8sIII')
+# key hash (0 for an empty slot), expiry, last access, key length,
+# value length; followed by the key and value bytes.
+SLOT = struct.Struct('<QddHI')
+EXPIRES_OFFSET = 8
+ACCESSED_OFFSET = 16
+
+SIZE_UNITS = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+# Tables opened by this process, keyed by path, so every cache instance on
+# the same file shares one mapping and one set of thread locks.
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+class ItemTooLarge(Exception):
+    "A new value does not fit in a slot."
+
+
+def parse_size(value):
+    """Parses sizes such as ``512M``, ``64k`` or ``1048576`` into bytes."""
+    if isinstance(value, basestring):
+        value = value.strip().lower().rstrip('b')
+        if value and value[-1] in SIZE_UNITS:
+            return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+class SharedTable(object):
+    """
+    Fixed-capacity hash table in a memory mapped file.
+
+    The table is split in buckets of ``ways`` fixed-size slots; a key
+    lives in the bucket picked by its hash and replaces an empty, expired
+    or least recently read slot of that bucket. Every bucket has its own
+    lock: a POSIX record lock on the bucket's bytes in the file excludes
+    other processes, and one of a set of striped thread locks excludes
+    other threads of this process (record locks are held per process).
+    """
+    LOCK_STRIPES = 64
+
+    def __init__(self, path, size, ways=8, slot_size=1024):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+        self._data_offset = mmap.PAGESIZE
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._data_offset, 0)
+        try:
+            header = self._read_header()
+            if header is None:
+                buckets = max((size - self._data_offset) // (ways * slot_size), 1)
+                header = (buckets, ways, slot_size)
+                os.ftruncate(self._fd, self._data_offset + buckets * ways * slot_size)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, HEADER.pack(MAGIC, *header))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self._data_offset, 0)
+        # The first process to create the file decides its geometry.
+        self.buckets, self.ways, self.slot_size = header
+        self.bucket_size = self.ways * self.slot_size
+        self.max_item_size = self.slot_size - SLOT.size
+        self._mm = mmap.mmap(self._fd, self._data_offset + self.buckets * self.bucket_size)
+        self._init_locks()
+
+    def _read_header(self):
+        if os.fstat(self._fd).st_size < self._data_offset:
+            return None
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        magic, buckets, ways, slot_size = HEADER.unpack(os.read(self._fd, HEADER.size))
+        if magic != MAGIC:
+            return None
+        return buckets, ways, slot_size
+
+    def _init_locks(self):
+        self._pid = os.getpid()
+        self._thread_locks = [threading.Lock() for i in xrange(self.LOCK_STRIPES)]
+
+    @contextlib.contextmanager
+    def locked(self, bucket):
+        if self._pid != os.getpid():
+            # Forked: locks held by other threads of the parent are gone.
+            self._init_locks()
+        offset = self._data_offset + bucket * self.bucket_size
+        with self._thread_locks[bucket % self.LOCK_STRIPES]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.bucket_size, offset)
+            try:
+                yield offset
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.bucket_size, offset)
+
+    def locate(self, key):
+        "Returns the (hash, bucket) pair for a byte string key."
+        h = struct.unpack_from('<Q', hashlib.md5(key).digest())[0] or 1
+        return h, h % self.buckets
+
+    def _find(self, base, h, key):
+        mm = self._mm
+        for off in xrange(base, base + self.bucket_size, self.slot_size):
+            slot_hash, exp, accessed, key_len, value_len = SLOT.unpack_from(mm, off)
+            if slot_hash == h and key_len == len(key):
+                start = off + SLOT.size
+                if mm[start:start + key_len] == key:
+                    return off, exp, value_len
+        return None, None, None
+
+    def _victim(self, base, now):
+        "Picks the slot to overwrite: empty, else expired, else least recently read."
+        mm = self._mm
+        best, best_accessed = base, None
+        for off in xrange(base, base + self.bucket_size, self.slot_size):
+            slot_hash, exp, accessed, key_len, value_len = SLOT.unpack_from(mm, off)
+            if slot_hash == 0 or exp <= now:
+                return off
+            if best_accessed is None or accessed < best_accessed:
+                best, best_accessed = off, accessed
+        return best
+
+    def _read(self, off, key, value_len):
+        start = off + SLOT.size + len(key)
+        return self._mm[start:start + value_len]
+
+    def _write(self, off, h, key, value, exp, now):
+        mm = self._mm
+        start = off + SLOT.size
+        mm[start:start + len(key)] = key
+        mm[start + len(key):start + len(key) + len(value)] = value
+        SLOT.pack_into(mm, off, h, exp, now, len(key), len(value))
+
+    def _clear_slot(self, off):
+        struct.pack_into('<Q', self._mm, off, 0)
+
+    def get(self, key):
+        h, bucket = self.locate(key)
+        with self.locked(bucket) as base:
+            off, exp, value_len = self._find(base, h, key)
+            if off is None:
+                return None
+            now = time.time()
+            if exp <= now:
+                self._clear_slot(off)
+                return None
+            struct.pack_into('<d', self._mm, off + ACCESSED_OFFSET, now)
+            return self._read(off, key, value_len)
+
+    def has_key(self, key):
+        h, bucket = self.locate(key)
+        with self.locked(bucket) as base:
+            off, exp, value_len = self._find(base, h, key)
+            return off is not None and exp > time.time()
+
+    def set(self, key, value, exp, add=False):
+        """
+        Stores ``value`` for ``key``. Returns False if the item is too big
+        for a slot, or if ``add`` is set and the key holds a live value. An
+        item too big replaces the key's old value by nothing, like
+        memcached, so readers do not keep getting it.
+        """
+        too_big = len(key) + len(value) > self.max_item_size
+        h, bucket = self.locate(key)
+        with self.locked(bucket) as base:
+            now = time.time()
+            off, old_exp, value_len = self._find(base, h, key)
+            if too_big:
+                if off is not None and not (add and old_exp > now):
+                    self._clear_slot(off)
+                return False
+            if off is None:
+                off = self._victim(base, now)
+            elif add and old_exp > now:
+                return False
+            self._write(off, h, key, value, exp, now)
+            return True
+
+    def update(self, key, func):
+        """
+        Replaces the value of a live key by ``func(value)`` under the bucket
+        lock, keeping its expiry. Returns the new value, or None if the key
+        is missing. Raises ItemTooLarge, leaving the old value, if the new
+        one does not fit.
+        """
+        h, bucket = self.locate(key)
+        with self.locked(bucket) as base:
+            off, exp, value_len = self._find(base, h, key)
+            now = time.time()
+            if off is None or exp <= now:
+                return None
+            value = func(self._read(off, key, value_len))
+            if len(key) + len(value) > self.max_item_size:
+                raise ItemTooLarge("The new value of '%s' does not fit in a slot" % key)
+            self._write(off, h, key, value, exp, now)
+            return value
+
+    def delete(self, key):
+        h, bucket = self.locate(key)
+        with self.locked(bucket) as base:
+            off, exp, value_len = self._find(base, h, key)
+            if off is not None:
+                self._clear_slot(off)
+
+    def clear(self):
+        for bucket in xrange(self.buckets):
+            with self.locked(bucket) as base:
+                for off in xrange(base, base + self.bucket_size, self.slot_size):
+                    self._clear_slot(off)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+def get_table(path, size, ways, slot_size):
+    with _tables_lock:
+        table = _tables.get(path)
+        if table is None:
+            table = _tables[path] = SharedTable(path, size, ways, slot_size)
+        return table
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Cache shared by every process on the host that opens the same name,
+    e.g. all workers of a pre-fork server: ``shm://name?size=512M``.
+
+    Capacity is fixed when the first process creates the backing file.
+    Items larger than ``slot_size`` (minus a small header and the key) are
+    not stored, and a full bucket replaces its least recently read slot.
+    """
+    def __init__(self, url, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+        name = url.netloc or url.path.strip('/') or 'default'
+        path = params.get('path', options.get('PATH'))
+        if not path:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            path = os.path.join(directory, 'kvcache-%s' % name)
+        try:
+            size = parse_size(params.get('size', options.get('SIZE', '64M')))
+            ways = int(params.get('ways', options.get('WAYS', 8)))
+            slot_size = parse_size(params.get('slot_size', options.get('SLOT_SIZE', '1k')))
+        except (ValueError, TypeError), e:
+            raise InvalidCacheBackendError("Invalid shm cache geometry: %s" % e)
+        try:
+            self._table = get_table(path, size, ways, slot_size)
+        except (IOError, OSError), e:
+            raise InvalidCacheBackendError("Could not open shm cache '%s': %s" % (path, e))
+
+    def make_key(self, key, version=None):
+        return smart_str(super(SharedMemoryCache, self).make_key(key, version))
+
+    def _get_expiry(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.time() + timeout
+
+    def add(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            pickled = self.encode(value)
+        except PickleException:
+            return False
+        return self._table.set(key, pickled, self._get_expiry(timeout), add=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = self._table.get(key)
+        if pickled is None:
+            return default
+        return self.decode(pickled, default)
+
+    def set(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            pickled = self.encode(value)
+        except PickleException:
+            return False
+        return self._table.set(key, pickled, self._get_expiry(timeout))
+
+    def incr(self, key, delta=1, version=None):
+        """
+        Adds delta to the value in place, atomically across processes and
+        keeping the key's expiry. Raises ItemTooLarge if the result no
+        longer fits in a slot.
+        """
+        made_key = self.make_key(key, version=version)
+        self.validate_key(made_key)
+        result = []
+
+        def add_delta(pickled):
+            value = self.decode(pickled)
+            if value is None:
+                raise ValueError("Key '%s' not found" % key)
+            result.append(value + delta)
+            return self.encode(result[0])
+
+        if self._table.update(made_key, add_delta) is None:
+            raise ValueError("Key '%s' not found" % key)
+        return result[0]
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._table.has_key(key)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._table.delete(key)
+
+    def clear(self):
+        self._table.clear()
+
+# For backwards compatibility
+class CacheClass(SharedMemoryCache):
+    pass
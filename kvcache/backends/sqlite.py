@@ -3,21 +3,19 @@ import base64
 import time
 import logging
 from datetime import datetime
-from .dbbase import DatabaseCache, BaseCache
-import MySQLdb
+from .dbbase import DatabaseCache
 import sqlite3
 
 
 class SqliteDatabaseCache(DatabaseCache):
     def __init__(self, url, params):
-        BaseCache.__init__(self, params)
+        DatabaseCache.__init__(self, params)
         self._url = url
         self.path = self._url.path
         if self.path.find('.') != -1:
             self.path, self._table = self.path.rsplit('.', 1)
         else:
             self._table = params.get('table', 'kvcache')
-        self.create()
 
     def create(self):
         self._reconn()
@@ -26,7 +24,8 @@ class SqliteDatabaseCache(DatabaseCache):
         self._create(SQL_CREATE_TABLE, self._table)
 
     def _reconn(self, num=28800, stime=3):
-        self.conn()
+        if self._conn is None:
+            self.conn()
 
     def conn(self):
         try:
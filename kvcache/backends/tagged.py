@@ -0,0 +1,184 @@
+"""
+Tagged cache: invalidates groups of keys by bumping a generation counter.
+"""
+
+import time
+
+from .base import BaseCache, InvalidCacheBackendError
+
+# Marks values stored with tags as (tag, value, ((tag name, generation), ...)).
+# A plain tuple rather than a class so every serializer can store it.
+TAGGED_TAG = '__tagged__'
+
+_MISSING = object()
+
+
+def unwrap_tagged(stored):
+    "Returns (value, generations) for a stored value; generations is () when untagged."
+    if (isinstance(stored, (tuple, list)) and len(stored) == 3 and
+            stored[0] == TAGGED_TAG):
+        return stored[1], stored[2]
+    return stored, ()
+
+
+class TaggedCache(BaseCache):
+    """
+    ``set(key, value, tags=['user:42', 'page:home'])`` stores the value
+    along with the current generation of each tag, and
+    ``invalidate_tag('user:42')`` increments that tag's generation, which
+    is one ``incr`` whatever the number of keys tagged. A read returns a
+    tagged value only if none of its tags moved on since it was stored;
+    the generations of every tag a get or get_many needs are fetched in a
+    single get_many.
+
+    Generations live in the wrapped cache as ``tag:<name>`` keys under a
+    version of their own (see companion_version()), so no user key can
+    overwrite them, and are kept for ``tag_timeout`` seconds. A generation that is evicted invalidates its
+    tag. Untagged values are stored as they are, so incr and decr only
+    work on them.
+
+    ``get_cache('tagged://', cache='redis://127.0.0.1:6379')``
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+
+        cache = params.get('cache', options.get('CACHE'))
+        if cache is None or cache == '':
+            raise InvalidCacheBackendError("The tagged cache needs a 'cache' to wrap")
+        # Built from a URI, the backend is ours to close; an instance is
+        # left to its owner.
+        self._own_cache = isinstance(cache, basestring)
+        if self._own_cache:
+            from .. import get_cache
+            cache = get_cache(cache, reuse=False)
+        self.cache = cache
+
+        tag_timeout = params.get('tag_timeout', options.get('TAG_TIMEOUT', 86400 * 30))
+        try:
+            self.tag_timeout = int(tag_timeout)
+        except (ValueError, TypeError), e:
+            raise InvalidCacheBackendError("Invalid tag_timeout: %s" % e)
+
+    def tag_key(self, tag):
+        return 'tag:%s' % (tag,)
+
+    def tag_version(self, version=None):
+        "The version tag generations of values of ``version`` are stored under."
+        return self.companion_version(version, 'tag')
+
+    def _generations(self, tags, version=None, create=False):
+        """
+        Returns the current generation of every tag in one get_many. With
+        ``create``, tags without one are given a new generation in one
+        add_many, and the generations other writers got in first are read
+        back in one more get_many.
+        """
+        tags = set(tags)
+        if not tags:
+            return {}
+        version = self.tag_version(version)
+        keys = dict((self.tag_key(tag), tag) for tag in tags)
+        found = self.cache.get_many(keys.keys(), version=version)
+        generations = dict((keys[key], value) for key, value in found.items())
+        if create and len(generations) < len(keys):
+            # Start from the clock, so a tag whose generation was evicted
+            # never gets back to an old value.
+            initial = int(time.time() * 1000000)
+            new = dict((key, initial) for key, tag in keys.items()
+                       if tag not in generations)
+            taken = self.cache.add_many(new, self.tag_timeout, version=version)
+            for key in set(new) - set(taken):
+                generations[keys[key]] = initial
+            if taken:
+                found = self.cache.get_many(taken, version=version)
+                for key in taken:
+                    # Gone again already: no generation matches None.
+                    generations[keys[key]] = found.get(key)
+        return generations
+
+    def _wrap(self, data, tags, version):
+        "Returns ``data`` (a dict) with every value tagged by the current generations."
+        if not tags:
+            return data
+        generations = tuple(sorted(self._generations(tags, version, create=True).items()))
+        return dict((key, (TAGGED_TAG, value, generations)) for key, value in data.items())
+
+    def _valid(self, stored, current):
+        for tag, generation in stored:
+            if current.get(tag, _MISSING) != generation:
+                return False
+        return True
+
+    def invalidate_tag(self, tag, version=None):
+        "Makes every value stored with ``tag`` a miss."
+        try:
+            self.cache.incr(self.tag_key(tag), version=self.tag_version(version))
+        except ValueError:
+            # No generation: nothing stored with the tag is valid anyway.
+            pass
+
+    def invalidate_tags(self, tags, version=None):
+        for tag in tags:
+            self.invalidate_tag(tag, version=version)
+
+    def add(self, key, value, timeout=None, version=None, tags=None):
+        return self.cache.add(key, self._wrap({key: value}, tags, version)[key], timeout,
+                              version=version)
+
+    def get(self, key, default=None, version=None):
+        stored = self.cache.get(key, _MISSING, version=version)
+        if stored is _MISSING:
+            return default
+        value, generations = unwrap_tagged(stored)
+        if generations and not self._valid(
+                generations,
+                self._generations([tag for tag, generation in generations], version)):
+            return default
+        return value
+
+    def set(self, key, value, timeout=None, version=None, tags=None):
+        self.cache.set(key, self._wrap({key: value}, tags, version)[key], timeout,
+                       version=version)
+
+    def delete(self, key, version=None):
+        self.cache.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def get_many(self, keys, version=None):
+        found = self.cache.get_many(keys, version=version)
+        unwrapped = {}
+        tags = set()
+        for key, stored in found.items():
+            value, generations = unwrap_tagged(stored)
+            unwrapped[key] = value, generations
+            tags.update(tag for tag, generation in generations)
+        current = self._generations(tags, version)
+        return dict((key, value) for key, (value, generations) in unwrapped.items()
+                    if not generations or self._valid(generations, current))
+
+    def set_many(self, data, timeout=None, version=None, tags=None):
+        self.cache.set_many(self._wrap(data, tags, version), timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.cache.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.cache.decr(key, delta, version=version)
+
+    def clear(self):
+        self.cache.clear()
+
+    def close(self, **kwargs):
+        close = getattr(self.cache, 'close', None)
+        if self._own_cache and close is not None:
+            close(**kwargs)
+
+# For backwards compatibility
+class CacheClass(TaggedCache):
+    pass
@@ -0,0 +1,261 @@
+"""
+Benchmark runner: drives any ``get_cache`` URI through a configurable
+workload and prints ops/s and latency percentiles as JSON.
+
+    python -m kvcache.bench locmem:// --threads 1,8 --read-ratio 0.9
+    python -m kvcache.bench redis://127.0.0.1:6379 --stand-in --rtt 0.2
+
+Key popularity follows a Zipf distribution over ``--keys`` keys
+(``--zipf 0`` makes it uniform). Each operation is a read with
+probability ``--read-ratio``, otherwise a write, and touches ``--batch``
+keys (get/set, or get_many/set_many for batches above one). Value sizes
+are fixed (``--value-size 100``) or uniform over a range (``100-4096``).
+Every comma-separated value of ``--threads``, ``--batch`` and
+``--read-ratio`` is run in turn. Runs are reproducible for a given
+``--seed`` and thread count.
+
+With ``--stand-in``, backends that need a server run against a local
+substitute with similar behaviour instead (see ``STAND_INS``), optionally
+adding ``--rtt`` milliseconds per call to model the network round trip.
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urlparse
+
+from . import get_cache
+from .utils.stats import Histogram
+
+# Backends that need a server -> URI template of a local substitute.
+STAND_INS = {
+    'redis': 'locmem://bench-redis',
+    'memcached': 'locmem://bench-memcached',
+    'mysql': 'sqlite://%(tmp)s/bench.db',
+    'mongodb': 'sqlite://%(tmp)s/bench-mongo.db',
+    's3': 'file://%(tmp)s/s3',
+}
+
+
+class ZipfKeys(object):
+    "Draws key indexes in [0, n) with probability proportional to 1/(rank+1)**s."
+    def __init__(self, n, s=1.0):
+        total = 0.0
+        self.cdf = []
+        for rank in xrange(n):
+            total += 1.0 / (rank + 1) ** s
+            self.cdf.append(total)
+        self.total = total
+
+    def draw(self, rnd):
+        return bisect.bisect_left(self.cdf, rnd.random() * self.total)
+
+
+def parse_sizes(spec):
+    "'100' -> (100, 100); '100-4096' -> (100, 4096)."
+    low, sep, high = spec.partition('-')
+    low = int(low)
+    return low, int(high) if sep else low
+
+
+def parse_list(spec, type):
+    return [type(item) for item in spec.split(',') if item]
+
+
+class Delayed(object):
+    "Adds a fixed delay to every call, standing in for a network round trip."
+    def __init__(self, cache, rtt):
+        self._cache = cache
+        self._rtt = rtt
+
+    def __getattr__(self, name):
+        method = getattr(self._cache, name)
+        rtt = self._rtt
+
+        def call(*args, **kwargs):
+            time.sleep(rtt)
+            return method(*args, **kwargs)
+        return call
+
+
+def open_cache(uri, stand_in=False, rtt=0, tmp=None):
+    """
+    Returns ``(cache, uri actually used)``. With ``stand_in``, server
+    backends are replaced by their local substitute.
+    """
+    scheme = urlparse.urlparse(uri).scheme
+    if stand_in and scheme in STAND_INS:
+        uri = STAND_INS[scheme] % {'tmp': tmp or tempfile.gettempdir()}
+        if uri.startswith('file://'):
+            path = uri[len('file://'):]
+            if not os.path.isdir(path):
+                os.makedirs(path)
+    cache = get_cache(uri)
+    if rtt:
+        cache = Delayed(cache, rtt / 1000.0)
+    return cache, uri
+
+
+class Worker(threading.Thread):
+    def __init__(self, cache, config, keys, values, seed, deadline):
+        super(Worker, self).__init__(name='kvcache-bench')
+        self.daemon = True
+        self.cache = cache
+        self.config = config
+        self.keys = keys
+        self.values = values
+        self.rnd = random.Random(seed)
+        self.deadline = deadline
+        self.latency = {}
+        self.ops = self.hits = self.misses = self.errors = 0
+
+    def record(self, name, seconds):
+        histogram = self.latency.get(name)
+        if histogram is None:
+            histogram = self.latency[name] = Histogram()
+        histogram.record(seconds)
+
+    def run(self):
+        cache, config, rnd = self.cache, self.config, self.rnd
+        keys, values, names = self.keys, self.values, self.config['key_names']
+        batch, read_ratio, max_ops = config['batch'], config['read_ratio'], config['ops']
+        now = time.time
+        while now() < self.deadline and (not max_ops or self.ops < max_ops):
+            batch_keys = [names[keys.draw(rnd)] for i in xrange(batch)]
+            start = now()
+            try:
+                if rnd.random() < read_ratio:
+                    if batch == 1:
+                        name, lookups = 'get', 1
+                        hits = int(cache.get(batch_keys[0]) is not None)
+                    else:
+                        name, lookups = 'get_many', len(set(batch_keys))
+                        hits = len(cache.get_many(batch_keys))
+                    self.hits += hits
+                    self.misses += lookups - hits
+                else:
+                    if batch == 1:
+                        name = 'set'
+                        cache.set(batch_keys[0], rnd.choice(values))
+                    else:
+                        name = 'set_many'
+                        cache.set_many(dict((k, rnd.choice(values)) for k in batch_keys))
+            except Exception:
+                self.errors += 1
+                continue
+            self.record(name, now() - start)
+            self.ops += 1
+
+
+def make_values(sizes, rnd, count=64):
+    low, high = sizes
+    return ['x' * rnd.randint(low, high) for i in xrange(count)]
+
+
+def run(cache, threads=1, batch=1, read_ratio=0.9, keys=10000, zipf=1.0,
+        value_size=(100, 100), duration=5.0, ops=0, seed=0, preload=True):
+    """
+    Runs one workload against ``cache`` and returns its results as a dict.
+    ``ops`` caps the operations per thread (0 for no cap).
+    """
+    rnd = random.Random(seed)
+    key_names = ['bench:%d' % i for i in xrange(keys)]
+    values = make_values(value_size, rnd)
+    if preload:
+        for start in xrange(0, keys, 500):
+            cache.set_many(dict((k, rnd.choice(values)) for k in key_names[start:start + 500]))
+    config = {'batch': batch, 'read_ratio': read_ratio, 'ops': ops, 'key_names': key_names}
+    distribution = ZipfKeys(keys, zipf)
+    started = time.time()
+    workers = [Worker(cache, config, distribution, values, seed + i + 1, started + duration)
+               for i in xrange(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    latency = {}
+    for worker in workers:
+        for name, histogram in worker.latency.items():
+            latency.setdefault(name, Histogram()).merge(histogram)
+    total = sum(worker.ops for worker in workers)
+    hits = sum(worker.hits for worker in workers)
+    misses = sum(worker.misses for worker in workers)
+    return {
+        'threads': threads,
+        'batch': batch,
+        'read_ratio': read_ratio,
+        'keys': keys,
+        'zipf': zipf,
+        'value_size': list(value_size),
+        'seed': seed,
+        'duration': elapsed,
+        'ops': total,
+        'ops_per_sec': total / elapsed if elapsed else 0.0,
+        'errors': sum(worker.errors for worker in workers),
+        'hit_ratio': float(hits) / (hits + misses) if hits + misses else 0.0,
+        'latency': dict((name, {
+            'count': histogram.count,
+            'mean': histogram.mean,
+            'p50': histogram.percentile(0.5),
+            'p99': histogram.percentile(0.99),
+            'p999': histogram.percentile(0.999),
+        }) for name, histogram in latency.items()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m kvcache.bench',
+        description='Benchmark a kvcache backend.')
+    parser.add_argument('uri', help='get_cache() URI of the backend')
+    parser.add_argument('--threads', default='1', help='thread counts, e.g. 1,4,16')
+    parser.add_argument('--batch', default='1', help='keys per operation, e.g. 1,10')
+    parser.add_argument('--read-ratio', default='0.9', help='fraction of reads, e.g. 0.5,0.9')
+    parser.add_argument('--keys', type=int, default=10000, help='size of the key space')
+    parser.add_argument('--zipf', type=float, default=1.0, help='Zipf exponent, 0 for uniform')
+    parser.add_argument('--value-size', default='100', help='bytes, or a range like 100-4096')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--ops', type=int, default=0, help='operations per thread (0: no cap)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-preload', action='store_true', help='start with an empty cache')
+    parser.add_argument('--stand-in', action='store_true',
+                        help='use a local substitute for backends that need a server')
+    parser.add_argument('--rtt', type=float, default=0,
+                        help='milliseconds added to every call')
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix='kvcache-bench-')
+    try:
+        cache, uri = open_cache(args.uri, args.stand_in, args.rtt, tmp)
+        runs = []
+        for threads in parse_list(args.threads, int):
+            for batch in parse_list(args.batch, int):
+                for read_ratio in parse_list(args.read_ratio, float):
+                    cache.clear()
+                    runs.append(run(cache, threads=threads, batch=batch,
+                                    read_ratio=read_ratio, keys=args.keys,
+                                    zipf=args.zipf,
+                                    value_size=parse_sizes(args.value_size),
+                                    duration=args.duration, ops=args.ops,
+                                    seed=args.seed, preload=not args.no_preload))
+        close = getattr(cache, 'close', None)
+        if close is not None:
+            close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    json.dump({'uri': args.uri, 'backend': uri, 'runs': runs},
+              sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
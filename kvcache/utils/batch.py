@@ -0,0 +1,211 @@
+"""
+Parallel execution of per-key calls for backends without a batch API.
+
+``BatchExecutor.map`` runs a function over a batch of items on a fixed set
+of worker threads and waits for all of them, or until a deadline, so the
+batch takes about as long as its slowest item instead of the sum of all
+of them. Executors are shared by every cache asking for the same number
+of workers.
+
+``BatchExecutor.first`` runs the same function over alternatives one after
+the other, starting the next one when the previous fails or is still
+running after a delay, and returns the first answer.
+"""
+
+import os
+import sys
+import threading
+import time
+import Queue
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class Batch(object):
+    "Results of one map() call, filled in by the workers."
+    def __init__(self, size):
+        self.pending = size
+        self.results = {}
+        self.exc_info = None
+        self.abandoned = False
+        self.done = threading.Condition(threading.Lock())
+
+    def run(self, func, index, item):
+        if self.abandoned:
+            result = exc_info = None
+        else:
+            try:
+                result, exc_info = func(item), None
+            except Exception:
+                result, exc_info = None, sys.exc_info()
+        with self.done:
+            if exc_info is None:
+                self.results[index] = result
+            elif self.exc_info is None:
+                self.exc_info = exc_info
+            self.pending -= 1
+            if not self.pending:
+                self.done.notify_all()
+
+    def wait(self, deadline):
+        with self.done:
+            while self.pending:
+                if deadline is None:
+                    self.done.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        # Workers skip what they have not started yet.
+                        self.abandoned = True
+                        break
+                    self.done.wait(remaining)
+            return dict(self.results), self.exc_info
+
+
+class Race(object):
+    "Result of one first() call: the first call to succeed wins."
+    def __init__(self):
+        self.pending = 0
+        self.winner = None
+        self.exc_info = None
+        self.done = threading.Condition(threading.Lock())
+
+    def run(self, func, index, item):
+        # Not started before another call won: no need to any more.
+        if self.winner is None:
+            try:
+                result, exc_info = func(item), None
+            except Exception:
+                result, exc_info = None, sys.exc_info()
+            with self.done:
+                if exc_info is None:
+                    if self.winner is None:
+                        self.winner = (index, result)
+                elif self.exc_info is None:
+                    self.exc_info = exc_info
+        with self.done:
+            self.pending -= 1
+            self.done.notify_all()
+
+    def wait(self, deadline):
+        "Waits for a winner, for every running call to fail, or for the deadline."
+        with self.done:
+            while self.winner is None and self.pending:
+                if deadline is None:
+                    self.done.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.done.wait(remaining)
+            return self.winner
+
+
+class BatchExecutor(object):
+    def __init__(self, workers=8):
+        self.workers = max(int(workers), 1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+
+    def _start(self):
+        # Threads do not survive a fork: start a new set in the child.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue.Queue()
+            for i in xrange(self.workers):
+                worker = threading.Thread(target=self._work, args=(self._queue,),
+                                          name='kvcache-batch-%d' % i)
+                worker.daemon = True
+                worker.start()
+            self._pid = os.getpid()
+
+    def _work(self, queue):
+        self._local.worker = True
+        while True:
+            task = queue.get()
+            if task is None:
+                return
+            batch, func, index, item = task
+            batch.run(func, index, item)
+
+    def shutdown(self):
+        """
+        Stops the worker threads once they are done with the calls queued
+        so far. The next map() or first() starts a new set.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for i in xrange(self.workers):
+                self._queue.put(None)
+            self._pid = None
+
+    def map(self, func, items, timeout=None, default=None):
+        """
+        Returns a list with ``func(item)`` for every item, in order. With a
+        ``timeout`` in seconds, the calls not finished by then are given up
+        and their slots hold ``default``. The first exception raised by a
+        call is re-raised once the others are finished.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.workers == 1 or getattr(self._local, 'worker', False):
+            # Nothing to overlap, or called from one of our own workers,
+            # which must not wait for the others: run the calls here.
+            return [func(item) for item in items]
+        if self._pid != os.getpid():
+            self._start()
+        batch = Batch(len(items))
+        for index, item in enumerate(items):
+            self._queue.put((batch, func, index, item))
+        deadline = None if timeout is None else time.time() + timeout
+        results, exc_info = batch.wait(deadline)
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return [results.get(index, default) for index in xrange(len(items))]
+
+    def first(self, func, items, delay):
+        """
+        Calls ``func(item)`` for the first item, then for the next one as
+        soon as every call so far failed or after ``delay`` more seconds
+        without an answer, and so on. Returns ``(index, result)`` of the
+        first call to succeed; calls still running are left to finish in
+        the background. Raises the first exception when every call fails.
+        """
+        items = list(items)
+        if not items:
+            raise ValueError("first() needs at least one item")
+        if len(items) == 1 or getattr(self._local, 'worker', False):
+            # No alternative to start, or no waiting allowed: fail over in turn.
+            exc_info = None
+            for index, item in enumerate(items):
+                try:
+                    return index, func(item)
+                except Exception:
+                    if exc_info is None:
+                        exc_info = sys.exc_info()
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if self._pid != os.getpid():
+            self._start()
+        race = Race()
+        for index, item in enumerate(items):
+            with race.done:
+                race.pending += 1
+            self._queue.put((race, func, index, item))
+            last = index == len(items) - 1
+            winner = race.wait(None if last else time.time() + delay)
+            if winner is not None:
+                return winner
+        exc_info = race.exc_info
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+
+def get_executor(workers):
+    "Returns the shared executor with ``workers`` threads."
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = _executors[workers] = BatchExecutor(workers)
+        return executor
@@ -0,0 +1,84 @@
+"""
+Bloom filter.
+
+Sized for ``capacity`` keys at a false positive rate of ``error_rate``:
+m = -n ln(p) / ln(2)**2 bits and k = m / n ln(2) hash functions, derived
+from one md5 by double hashing. Keys can only be added; the filter is
+emptied as a whole with clear().
+"""
+
+import hashlib
+import math
+import struct
+import threading
+
+from .encoding import smart_str
+
+HASHES = struct.Struct('<QQ')
+# Number of bits set in each byte value.
+_BITS = [bin(i).count('1') for i in xrange(256)]
+
+
+class BloomFilter(object):
+    def __init__(self, capacity=100000, error_rate=0.01):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        self.size = int(math.ceil(-self.capacity * math.log(self.error_rate) /
+                                  math.log(2) ** 2))
+        self.hashes = max(int(round(float(self.size) / self.capacity * math.log(2))), 1)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        h1, h2 = HASHES.unpack(hashlib.md5(smart_str(key)).digest())
+        size = self.size
+        return [(h1 + i * h2) % size for i in xrange(self.hashes)]
+
+    def __contains__(self, key):
+        bits = self._bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        "Adds ``key``. Returns False if the key looked present already."
+        positions = self._positions(key)
+        with self._lock:
+            bits = self._bits
+            new = False
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not bits[position >> 3] & mask:
+                    bits[position >> 3] |= mask
+                    new = True
+            return new
+
+    @property
+    def count(self):
+        "Estimated number of distinct keys, from the share of bits set."
+        # A full filter says nothing more: cap the estimate there.
+        used = min(sum(_BITS[byte] for byte in self._bits), self.size - 1)
+        return int(round(-float(self.size) / self.hashes * math.log(1 - float(used) / self.size)))
+
+    @property
+    def false_positive_rate(self):
+        "Expected false positive rate with the keys in the filter now."
+        return (1 - math.exp(-float(self.hashes) * self.count / self.size)) ** self.hashes
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'size': self.size,
+            'bytes': len(self._bits),
+            'hashes': self.hashes,
+            'count': self.count,
+            'false_positive_rate': self.false_positive_rate,
+        }
@@ -0,0 +1,134 @@
+"""
+Optional compression of encoded cache values.
+
+Compressed payloads start with a NUL byte followed by a one byte codec id.
+None of the serializers produce output starting with NUL (msgpack only for
+the one byte encoding of 0), so ``decompress()`` can tell compressed and
+plain payloads apart without any configuration: a cache reads compressed
+values even if it does not compress itself.
+"""
+
+import zlib
+
+MARKER = '\x00'
+HEADER_SIZE = 2
+
+
+class ZlibCodec(object):
+    id = 'z'
+
+    def __init__(self, level=None):
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Codec(object):
+    "Much faster than zlib for a somewhat lower ratio. Needs the 'lz4' library."
+    id = '4'
+
+    def __init__(self, level=None):
+        try:
+            import lz4.block
+        except ImportError:
+            raise ImportError("The lz4 codec requires the 'lz4' library")
+        self._lz4 = lz4.block
+
+    def compress(self, data):
+        return self._lz4.compress(data)
+
+    def decompress(self, data):
+        return self._lz4.decompress(data)
+
+
+CODECS = {
+    'zlib': ZlibCodec,
+    'lz4': LZ4Codec,
+}
+
+_decoders = {}
+
+def get_codec(name, level=None):
+    """
+    Returns a codec instance. 'auto' picks lz4 when it is installed and zlib
+    otherwise. Raises ValueError for unknown names and ImportError when the
+    codec's library is missing.
+    """
+    if name == 'auto':
+        try:
+            return LZ4Codec(level)
+        except ImportError:
+            return ZlibCodec(level)
+    try:
+        return CODECS[name](level)
+    except KeyError:
+        raise ValueError("Unknown compression codec '%s'" % name)
+
+
+def is_compressed(data):
+    return data[:1] == MARKER and len(data) >= HEADER_SIZE
+
+
+def decompress(data):
+    "Returns the original payload of a value produced by Compressor.compress."
+    codec_id = data[1]
+    codec = _decoders.get(codec_id)
+    if codec is None:
+        for cls in CODECS.values():
+            if cls.id == codec_id:
+                codec = _decoders[codec_id] = cls()
+                break
+        else:
+            raise ValueError("Unknown compression codec id %r" % codec_id)
+    return codec.decompress(data[HEADER_SIZE:])
+
+
+class Compressor(object):
+    """
+    Compresses payloads of at least ``threshold`` bytes, keeping the
+    result only when it is actually smaller. Counts the bytes it saw and
+    produced so the achieved ratio can be reported; the counters are not
+    locked and may miss a few updates under heavy concurrency.
+    """
+    def __init__(self, codec='zlib', threshold=1024, level=None):
+        self.codec = get_codec(codec, level)
+        self.threshold = threshold
+        self.header = MARKER + self.codec.id
+        self.reset()
+
+    def compress(self, data):
+        if len(data) < self.threshold:
+            return data
+        packed = self.codec.compress(data)
+        if len(packed) + HEADER_SIZE >= len(data):
+            return data
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(packed) + HEADER_SIZE
+        return self.header + packed
+
+    @property
+    def ratio(self):
+        "Original size divided by compressed size of everything compressed."
+        if not self.bytes_out:
+            return 1.0
+        return float(self.bytes_in) / self.bytes_out
+
+    def stats(self):
+        return {
+            'codec': self.codec.__class__.__name__,
+            'threshold': self.threshold,
+            'compressed': self.compressed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': self.ratio,
+        }
+
+    def reset(self):
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
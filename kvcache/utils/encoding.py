@@ -1,9 +1,8 @@
+import sys
 import types
-import urllib
 import locale
 import datetime
 import codecs
-from decimal import Decimal
 
 class KVCacheUnicodeDecodeError(UnicodeDecodeError):
     def __init__(self, obj, *args):
@@ -39,12 +38,16 @@ def is_protected_type(obj):
     Objects of protected types are preserved as-is when passed to
     force_unicode(strings_only=True).
     """
-    return isinstance(obj, (
+    if isinstance(obj, (
         types.NoneType,
         int, long,
         datetime.datetime, datetime.date, datetime.time,
-        float, Decimal)
-    )
+        float)):
+        return True
+    # Not imported up front (it is slow to import); if nobody imported it,
+    # obj cannot be a Decimal.
+    decimal = sys.modules.get('decimal')
+    return decimal is not None and isinstance(obj, decimal.Decimal)
 
 def force_unicode(s, encoding='utf-8', strings_only=False, errors='strict'):
     """
@@ -150,6 +153,7 @@ def iri_to_uri(iri):
     # converted.
     if iri is None:
         return iri
+    import urllib
     return urllib.quote(smart_str(iri), safe="/#%[]=:;$&()+,!?*@'~")
 
 def filepath_to_uri(path):
@@ -169,6 +173,7 @@ def filepath_to_uri(path):
         return path
     # I know about `os.sep` and `os.altsep` but I want to leave
     # some flexibility for hardcoding separators.
+    import urllib
     return urllib.quote(smart_str(path).replace("\\", "/"), safe="/~!*()'")
 
 # The encoding of the default system locale but falls back to the
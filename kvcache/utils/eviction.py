@@ -0,0 +1,317 @@
+"""
+Eviction policies for the in-memory cache backends.
+
+A policy only tracks keys; the cache owns the values. All methods except
+``touch()`` must be called while the cache holds its write lock. Reads are
+recorded through ``touch()``, which only appends to a bounded buffer so it
+is safe to call under a shared reader lock (or no lock at all); the buffer
+is replayed the next time the policy is updated. When the buffer overflows
+the oldest reads are dropped, which only makes the policy slightly less
+accurate.
+"""
+
+import struct
+import sys
+from collections import deque, OrderedDict
+
+from .importlib import import_module
+
+# Number of recorded reads kept between two writes.
+READ_BUFFER_SIZE = 1024
+
+# Rough size of one dict slot (hash, key and value pointers at two thirds
+# load), used for the entry_overhead estimates.
+DICT_SLOT_SIZE = 3 * struct.calcsize('P') * 3 // 2
+
+
+class BasePolicy(object):
+    # Whether reads of missing keys should be passed to touch() as well.
+    record_misses = False
+    # Approximate bytes of bookkeeping per tracked key.
+    entry_overhead = 0
+
+    def __init__(self, capacity=0, cull_frequency=3):
+        self.capacity = capacity
+        self.cull_frequency = cull_frequency
+        self._reads = deque(maxlen=READ_BUFFER_SIZE)
+
+    def touch(self, key):
+        """Record a read of ``key``. Safe to call without the write lock."""
+        self._reads.append(key)
+
+    def _drain(self):
+        reads = self._reads
+        while True:
+            try:
+                key = reads.popleft()
+            except IndexError:
+                break
+            self._access(key)
+
+    def _access(self, key):
+        raise NotImplementedError
+
+    def insert(self, key):
+        """Record a write of ``key``, new or existing."""
+        raise NotImplementedError
+
+    def remove(self, key):
+        """Forget ``key``. Unknown keys are ignored."""
+        raise NotImplementedError
+
+    def evict(self, candidate):
+        """
+        Called when ``candidate`` is about to be added to a full cache.
+        Returns the list of keys to remove to make room, or None if the
+        candidate should not be admitted at all.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        self._reads.clear()
+
+
+class LRUPolicy(BasePolicy):
+    "Least recently used."
+    # OrderedDict: a slot in itself and in its link map, plus the link.
+    entry_overhead = 2 * DICT_SLOT_SIZE + sys.getsizeof([None] * 3)
+
+    def __init__(self, *args, **kwargs):
+        super(LRUPolicy, self).__init__(*args, **kwargs)
+        self._order = OrderedDict()
+
+    def _access(self, key):
+        order = self._order
+        if key in order:
+            del order[key]
+            order[key] = None
+
+    def insert(self, key):
+        self._drain()
+        self._order.pop(key, None)
+        self._order[key] = None
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        self._drain()
+        for key in self._order:
+            return key
+        return None
+
+    def evict(self, candidate):
+        key = self.victim()
+        if key is None:
+            return []
+        return [key]
+
+    def clear(self):
+        super(LRUPolicy, self).clear()
+        self._order.clear()
+
+
+class LFUPolicy(BasePolicy):
+    """
+    Least frequently used, ties broken by least recently used. Keys are kept
+    in one bucket per access count so every operation is O(1).
+    """
+    # A slot in _freq plus an LRU-style OrderedDict entry in its bucket.
+    entry_overhead = 3 * DICT_SLOT_SIZE + sys.getsizeof([None] * 3)
+
+    def __init__(self, *args, **kwargs):
+        super(LFUPolicy, self).__init__(*args, **kwargs)
+        self._freq = {}
+        self._buckets = {}
+        self._min_freq = 0
+
+    def _access(self, key):
+        freq = self._freq.get(key)
+        if freq is None:
+            return
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def insert(self, key):
+        self._drain()
+        if key in self._freq:
+            self._access(key)
+            return
+        self._freq[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._min_freq = 1
+
+    def remove(self, key):
+        freq = self._freq.pop(key, None)
+        if freq is None:
+            return
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+
+    def evict(self, candidate):
+        self._drain()
+        if not self._buckets:
+            return []
+        if self._min_freq not in self._buckets:
+            # Only happens after remove() emptied the lowest bucket.
+            self._min_freq = min(self._buckets)
+        for key in self._buckets[self._min_freq]:
+            return [key]
+        return []
+
+    def clear(self):
+        super(LFUPolicy, self).clear()
+        self._freq.clear()
+        self._buckets.clear()
+        self._min_freq = 0
+
+
+class CountMinSketch(object):
+    """
+    Approximate access counter with periodic aging: once ``sample_size``
+    increments have been recorded every counter is halved, so the sketch
+    reflects recent popularity rather than all-time popularity.
+    """
+    depth = 4
+
+    def __init__(self, capacity):
+        width = 16
+        while width < capacity:
+            width <<= 1
+        self._mask = width - 1
+        self._table = [0] * (width * self.depth)
+        self._width = width
+        self._sample_size = 10 * width
+        self._additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        width, mask = self._width, self._mask
+        for i in xrange(self.depth):
+            h = hash((h, i))
+            yield i * width + (h & mask)
+
+    def increment(self, key):
+        table = self._table
+        for i in self._indexes(key):
+            table[i] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._reset()
+
+    def estimate(self, key):
+        table = self._table
+        return min(table[i] for i in self._indexes(key))
+
+    def _reset(self):
+        self._table = [c >> 1 for c in self._table]
+        self._additions >>= 1
+
+    def clear(self):
+        self._table = [0] * len(self._table)
+        self._additions = 0
+
+
+class TinyLFUPolicy(LRUPolicy):
+    """
+    LRU eviction guarded by a TinyLFU admission filter: a new key only
+    replaces the LRU victim if it has been requested more often recently.
+    One-hit wonders therefore can not flush the hot working set.
+    """
+    # Misses are recorded too, which is what lets a key that is asked for
+    # repeatedly earn its way into the cache.
+    record_misses = True
+
+    def __init__(self, *args, **kwargs):
+        super(TinyLFUPolicy, self).__init__(*args, **kwargs)
+        self._sketch = CountMinSketch(self.capacity)
+
+    def _access(self, key):
+        self._sketch.increment(key)
+        super(TinyLFUPolicy, self)._access(key)
+
+    def insert(self, key):
+        self._drain()
+        if key not in self._order:
+            self._sketch.increment(key)
+        self._order.pop(key, None)
+        self._order[key] = None
+
+    def evict(self, candidate):
+        key = self.victim()
+        if key is None:
+            return []
+        if self._sketch.estimate(candidate) < self._sketch.estimate(key):
+            return None
+        return [key]
+
+    def clear(self):
+        super(TinyLFUPolicy, self).clear()
+        self._sketch.clear()
+
+
+class CullPolicy(BasePolicy):
+    """
+    The historical behaviour: when the cache is full drop every
+    ``cull_frequency``-th key, or everything if ``cull_frequency`` is 0.
+    Eviction is O(n); kept for backwards compatibility.
+    """
+    entry_overhead = DICT_SLOT_SIZE
+
+    def __init__(self, *args, **kwargs):
+        super(CullPolicy, self).__init__(*args, **kwargs)
+        self._keys = {}
+
+    def touch(self, key):
+        pass
+
+    def _access(self, key):
+        pass
+
+    def insert(self, key):
+        self._keys[key] = None
+
+    def remove(self, key):
+        self._keys.pop(key, None)
+
+    def evict(self, candidate):
+        if self.cull_frequency == 0:
+            return list(self._keys)
+        return [k for (i, k) in enumerate(self._keys) if i % self.cull_frequency == 0]
+
+    def clear(self):
+        super(CullPolicy, self).clear()
+        self._keys.clear()
+
+
+POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'tinylfu': TinyLFUPolicy,
+    'cull': CullPolicy,
+}
+
+def get_policy_class(policy):
+    """
+    Returns the policy class for a name in ``POLICIES``, a dotted import
+    path, or a class. Raises ValueError for unknown names.
+    """
+    if not isinstance(policy, basestring):
+        return policy
+    if policy.lower() in POLICIES:
+        return POLICIES[policy.lower()]
+    if '.' in policy:
+        module_path, class_name = policy.rsplit('.', 1)
+        try:
+            return getattr(import_module(module_path), class_name)
+        except (ImportError, AttributeError):
+            pass
+    raise ValueError("Unknown eviction policy '%s'" % policy)
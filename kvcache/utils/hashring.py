@@ -0,0 +1,64 @@
+"""
+Consistent hash ring (ketama style).
+
+Every node is placed on a 32-bit ring at ``vnodes`` pseudo-random points
+derived from its name; a key belongs to the node owning the first point at
+or after the key's hash. Adding or removing one of N nodes therefore only
+moves the keys between that node's points and their predecessors, about
+1/N of all keys, and the virtual nodes keep the shares even.
+"""
+
+import bisect
+import hashlib
+import struct
+
+from .encoding import smart_str
+
+POINT = struct.Struct('<I')
+
+
+def hash_key(key):
+    return POINT.unpack_from(hashlib.md5(smart_str(key)).digest())[0]
+
+
+class HashRing(object):
+    def __init__(self, nodes=(), vnodes=160):
+        # One md5 digest yields four points.
+        self.vnodes = max(int(vnodes) // 4, 1) * 4
+        self._points = []
+        self._owners = []
+        self.nodes = []
+        for node in nodes:
+            self.add_node(node)
+
+    def _node_points(self, node):
+        for i in xrange(self.vnodes // 4):
+            digest = hashlib.md5(smart_str('%s-%d' % (node, i))).digest()
+            for j in xrange(4):
+                yield POINT.unpack_from(digest, j * 4)[0]
+
+    def _rebuild(self, ring):
+        ring.sort()
+        self._points = [point for point, node in ring]
+        self._owners = [node for point, node in ring]
+
+    def add_node(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        ring = zip(self._points, self._owners)
+        ring.extend((point, node) for point in self._node_points(node))
+        self._rebuild(ring)
+
+    def remove_node(self, node):
+        self.nodes.remove(node)
+        self._rebuild([(point, owner) for point, owner in zip(self._points, self._owners)
+                       if owner != node])
+
+    def get_node(self, key):
+        if not self._points:
+            raise ValueError("The hash ring has no nodes")
+        index = bisect.bisect(self._points, hash_key(key))
+        if index == len(self._points):
+            index = 0
+        return self._owners[index]
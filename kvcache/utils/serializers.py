@@ -0,0 +1,106 @@
+"""
+Serializers used by BaseCache.encode/decode to turn values into the byte
+strings the backends store.
+
+A serializer is any object with ``dumps(value)`` and ``loads(data)``. The
+built-in ones are registered by name in ``SERIALIZERS``; a dotted import
+path selects a custom class.
+"""
+
+import json
+import marshal
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .importlib import import_module
+
+
+class BaseSerializer(object):
+    def dumps(self, value):
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class PickleSerializer(BaseSerializer):
+    "Any picklable value. Uses the most compact protocol by default."
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class MarshalSerializer(BaseSerializer):
+    """
+    Built-in types only (no instances), but much faster than pickle. The
+    format is specific to the Python version.
+    """
+    def dumps(self, value):
+        return marshal.dumps(value, 2)
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+
+class JSONSerializer(BaseSerializer):
+    """
+    Portable across languages. Tuples come back as lists and strings as
+    unicode.
+    """
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class MsgPackSerializer(BaseSerializer):
+    "Compact binary encoding of built-in types. Needs the 'msgpack' library."
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError("The msgpack serializer requires the 'msgpack' library")
+        self._msgpack = msgpack
+
+    def dumps(self, value):
+        return self._msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, raw=False)
+
+
+SERIALIZERS = {
+    'pickle': PickleSerializer,
+    'marshal': MarshalSerializer,
+    'json': JSONSerializer,
+    'msgpack': MsgPackSerializer,
+}
+
+def get_serializer(serializer):
+    """
+    Returns a serializer instance for a name in ``SERIALIZERS``, a dotted
+    import path to a class, a class, or an object that already has
+    dumps/loads. Raises ValueError for unknown names and ImportError when a
+    serializer's library is missing.
+    """
+    if isinstance(serializer, type):
+        return serializer()
+    if not isinstance(serializer, basestring):
+        return serializer
+    if serializer.lower() in SERIALIZERS:
+        return SERIALIZERS[serializer.lower()]()
+    if '.' in serializer:
+        module_path, class_name = serializer.rsplit('.', 1)
+        try:
+            return getattr(import_module(module_path), class_name)()
+        except (ImportError, AttributeError):
+            pass
+    raise ValueError("Unknown serializer '%s'" % serializer)
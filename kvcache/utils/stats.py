@@ -0,0 +1,327 @@
+"""
+Operation statistics for cache backends: call, hit, miss and error counts,
+bytes read and written, and latency histograms.
+
+Every thread records into counters of its own, so recording never takes a
+lock and never loses an update; ``CacheStats.snapshot()`` adds up the
+counters of all threads. The counters of threads that have exited are
+folded into one shared total, so short lived threads do not pile up.
+Calls, hits, misses and errors are counted on every call, but only one
+call in ``sample`` is timed. Latencies go in log-linear buckets (eight
+per power of two), so percentiles are accurate to about 6%.
+"""
+
+import math
+import threading
+import time
+import weakref
+
+SUB_BUCKETS = 8
+# Latencies below this many seconds are counted in the first bucket.
+MIN_LATENCY = 1e-7
+# Time one call in this many by default.
+DEFAULT_SAMPLE = 16
+
+
+def bucket_of(seconds):
+    mantissa, exponent = math.frexp(max(seconds, MIN_LATENCY))
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def bucket_value(bucket):
+    "Middle of the latency range of a bucket."
+    exponent, sub = divmod(bucket, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 0.5) / (2.0 * SUB_BUCKETS), exponent)
+
+
+class Histogram(object):
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        bucket = bucket_of(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q):
+        "Latency in seconds below which a fraction ``q`` of the calls fall."
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return bucket_value(bucket)
+        return bucket_value(max(self.buckets))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class OperationStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        # Only the sampled calls.
+        self.latency = Histogram()
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.hits += other.hits
+        self.misses += other.misses
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+    def snapshot(self):
+        latency = self.latency
+        return {
+            'calls': self.calls,
+            'timed': latency.count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'mean': latency.mean,
+            'p50': latency.percentile(0.5),
+            'p99': latency.percentile(0.99),
+            'p999': latency.percentile(0.999),
+        }
+
+
+class ThreadStats(object):
+    "Counters written by a single thread."
+    def __init__(self, generation, thread=None):
+        self.generation = generation
+        self._thread = None if thread is None else weakref.ref(thread)
+        self.operations = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.busy = False
+        # Calls left until the next timed one.
+        self.countdown = 1
+
+    @property
+    def finished(self):
+        "True once the thread that writes these counters has exited."
+        thread = self._thread and self._thread()
+        return thread is None or not thread.is_alive()
+
+    def merge(self, other):
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        for name, op in other.operations.items():
+            if name not in self.operations:
+                self.operations[name] = OperationStats()
+            self.operations[name].merge(op)
+
+
+class CacheStats(object):
+    def __init__(self, sample=DEFAULT_SAMPLE):
+        # 0 times no call at all: only the counters are kept.
+        self.sample = sample
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._threads = []
+            # Counters of the threads that have exited.
+            self._finished = ThreadStats(None)
+            self._generation = getattr(self, '_generation', 0) + 1
+            self.since = time.time()
+
+    def _mine(self):
+        mine = getattr(self._local, 'stats', None)
+        if mine is None or mine.generation != self._generation:
+            mine = self._local.stats = ThreadStats(
+                self._generation, threading.current_thread())
+            # Only taken once per thread (and per reset).
+            with self._lock:
+                self._prune()
+                self._threads.append(mine)
+        return mine
+
+    def _prune(self):
+        "Folds the counters of exited threads into the shared total."
+        live = []
+        for thread in self._threads:
+            if thread.finished:
+                self._finished.merge(thread)
+            else:
+                live.append(thread)
+        self._threads = live
+
+    def _operation(self, operation):
+        "This thread's counters of ``operation``."
+        mine = self._mine()
+        op = mine.operations.get(operation)
+        if op is None:
+            op = mine.operations[operation] = OperationStats()
+        return mine, op
+
+    def record(self, operation, seconds, hits=0, misses=0, error=False):
+        mine, op = self._operation(operation)
+        op.calls += 1
+        op.latency.record(seconds)
+        op.hits += hits
+        op.misses += misses
+        if error:
+            op.errors += 1
+
+    def add_bytes(self, read=0, written=0):
+        mine = self._mine()
+        mine.bytes_read += read
+        mine.bytes_written += written
+
+    def snapshot(self):
+        total = ThreadStats(None)
+        with self._lock:
+            self._prune()
+            threads = list(self._threads)
+            since = self.since
+            total.merge(self._finished)
+        for thread in threads:
+            total.merge(thread)
+        result = {
+            'since': since,
+            'bytes_read': total.bytes_read,
+            'bytes_written': total.bytes_written,
+            'operations': dict((name, op.snapshot()) for name, op in total.operations.items()),
+        }
+        for counter in ('hits', 'misses', 'errors'):
+            result[counter] = sum(op[counter] for op in result['operations'].values())
+        return result
+
+    def timed(self, operation, method, classify=None):
+        """
+        Returns ``method`` wrapped to count its calls under ``operation``
+        and time one call in ``sample``. ``classify(args, kwargs, result)``
+        returns the ``(hits, misses)`` of a call. Calls made from inside
+        another timed call of the same thread (get_many() looping over
+        get()) are not recorded again.
+        """
+        # Each thread looks its counters up once, not on every call.
+        bound = threading.local()
+        sample = self.sample
+
+        def wrapper(*args, **kwargs):
+            counters = getattr(bound, 'counters', None)
+            if counters is None or counters[0] != self._generation:
+                counters = bound.counters = (self._generation,) + self._operation(operation)
+            mine, op = counters[1], counters[2]
+            if mine.busy:
+                return method(*args, **kwargs)
+            op.calls += 1
+            mine.countdown -= 1
+            if mine.countdown or not sample:
+                mine.busy = True
+                try:
+                    result = method(*args, **kwargs)
+                except Exception:
+                    op.errors += 1
+                    raise
+                finally:
+                    mine.busy = False
+            else:
+                mine.countdown = sample
+                mine.busy = True
+                start = time.time()
+                try:
+                    result = method(*args, **kwargs)
+                except Exception:
+                    op.errors += 1
+                    raise
+                finally:
+                    mine.busy = False
+                    op.latency.record(time.time() - start)
+            if classify is _classify_get:
+                # get() is the hot path: no extra call to classify it.
+                if result is (args[1] if len(args) > 1 else kwargs.get('default')):
+                    op.misses += 1
+                else:
+                    op.hits += 1
+            elif classify is not None:
+                hits, misses = classify(args, kwargs, result)
+                op.hits += hits
+                op.misses += misses
+            return result
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+
+def _classify_get(args, kwargs, result):
+    if len(args) > 1:
+        default = args[1]
+    else:
+        default = kwargs.get('default')
+    return (0, 1) if result is default else (1, 0)
+
+
+def _classify_has_key(args, kwargs, result):
+    return (1, 0) if result else (0, 1)
+
+
+def _classify_get_many(args, kwargs, result):
+    hits = len(result)
+    try:
+        keys = len(args[0] if args else kwargs['keys'])
+    except (TypeError, KeyError):
+        # Keys given as an iterator: misses are unknown.
+        keys = hits
+    return hits, max(keys - hits, 0)
+
+
+# Operations recorded by instrument(), with how to tell hits from misses.
+OPERATIONS = {
+    'get': _classify_get,
+    'get_many': _classify_get_many,
+    'has_key': _classify_has_key,
+    'add': None,
+    'set': None,
+    'set_many': None,
+    'delete': None,
+    'delete_many': None,
+    'incr': None,
+    'decr': None,
+    'clear': None,
+}
+
+
+def instrument(cache, stats):
+    """
+    Records the operations of one cache instance in ``stats`` by shadowing
+    its methods with timed wrappers; other instances of the class are left
+    alone and pay nothing.
+    """
+    for name, classify in OPERATIONS.items():
+        method = getattr(cache, name, None)
+        if method is not None:
+            setattr(cache, name, stats.timed(name, method, classify))
+
+    encode, decode = cache.encode, cache.decode
+
+    def counted_encode(value):
+        data = encode(value)
+        stats._mine().bytes_written += len(data)
+        return data
+
+    def counted_decode(value, default=None):
+        if isinstance(value, basestring):
+            stats._mine().bytes_read += len(value)
+        return decode(value, default)
+
+    cache.encode, cache.decode = counted_encode, counted_decode
@@ -2,6 +2,7 @@
 Synchronization primitives:
 
     - reader-writer lock (preference to writers)
+    - single-flight call deduplication
 
 (Contributed to Django by eugene@lazutkin.com)
 """
@@ -9,6 +10,7 @@ Synchronization primitives:
 from __future__ import with_statement
 
 import contextlib
+import sys
 try:
     import threading
 except ImportError:
@@ -92,4 +94,59 @@ class RWLock(object):
         try:
             yield
         finally:
-            self.writer_leaves()
\ No newline at end of file
+            self.writer_leaves()
+
+class Flight(object):
+    "The pending result of one call, shared by everyone who asked for it."
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        if not self.done.is_set():
+            raise RuntimeError("Timed out waiting for another caller")
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    Makes concurrent calls for the same key run only once: the first caller
+    runs the function and the others wait for its result (or its
+    exception).
+
+    API:
+        do(key, func, fallback=None, timeout=None)
+
+    If ``fallback`` is given, callers that would have to wait call it
+    first and return its result instead when it is not None.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, func, fallback=None, timeout=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+        if not leader:
+            if fallback is not None:
+                result = fallback()
+                if result is not None:
+                    return result
+            return flight.wait(timeout)
+        try:
+            flight.result = func()
+        except:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
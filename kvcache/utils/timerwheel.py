@@ -0,0 +1,78 @@
+"""
+Hashed timer wheel used to find expired cache keys without scanning the
+whole cache.
+
+Keys are filed in a bucket per tick of ``resolution`` seconds, the buckets
+being hashed by absolute tick number so a bucket only ever holds keys that
+expire during that tick. A cursor walks the ticks as time passes and every
+key in a bucket that lies wholly in the past is expired, so each key is
+looked at once. Scheduling, cancelling and expiring a key are all O(1).
+The wheel is not thread-safe and is meant to be used under the owner's
+lock.
+"""
+
+import time
+
+
+class TimerWheel(object):
+    def __init__(self, resolution=1.0, now=None):
+        if now is None:
+            now = time.time()
+        self._resolution = float(resolution)
+        self._buckets = {}
+        # First tick that has not been completely swept yet.
+        self._cursor = int(now / self._resolution)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.itervalues())
+
+    def _tick(self, exp):
+        return max(int(exp / self._resolution), self._cursor)
+
+    def schedule(self, key, exp):
+        tick = self._tick(exp)
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = {}
+        bucket[key] = exp
+
+    def cancel(self, key, exp):
+        tick = self._tick(exp)
+        bucket = self._buckets.get(tick)
+        if bucket is not None and bucket.get(key) == exp:
+            del bucket[key]
+            if not bucket:
+                del self._buckets[tick]
+
+    def expired(self, now=None, limit=None):
+        """
+        Removes and returns up to ``limit`` ``(key, exp)`` pairs whose tick
+        has fully elapsed by ``now``. Keys are therefore reported at most
+        ``resolution`` seconds after they expire.
+        """
+        if now is None:
+            now = time.time()
+        result = []
+        last = int(now / self._resolution)
+        buckets = self._buckets
+        if last - self._cursor > len(buckets):
+            # Long pause: cheaper to visit the existing buckets than every
+            # tick in between.
+            ticks = sorted(t for t in buckets if t < last)
+        else:
+            ticks = xrange(self._cursor, last)
+        for tick in ticks:
+            bucket = buckets.get(tick)
+            while bucket:
+                result.append(bucket.popitem())
+                if limit is not None and len(result) >= limit:
+                    if not bucket:
+                        del buckets[tick]
+                    self._cursor = tick
+                    return result
+            buckets.pop(tick, None)
+        self._cursor = max(self._cursor, last)
+        return result
+
+    def clear(self):
+        self._buckets.clear()
@@ -0,0 +1,27 @@
+"Cache wrappers shared by the tests of the composite backends."
+
+
+class CountingCache(object):
+    """
+    Passes calls through to a cache, recording the name of each call in
+    ``calls`` and its positional arguments in ``args``.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.reset()
+
+    def reset(self):
+        self.calls = []
+        self.args = []
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+
+        def call(*args, **kwargs):
+            return self.call(name, method, args, kwargs)
+        return call
+
+    def call(self, name, method, args, kwargs):
+        self.calls.append(name)
+        self.args.append(args)
+        return method(*args, **kwargs)
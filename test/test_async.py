@@ -0,0 +1,139 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache, AsyncBaseCache, InvalidCacheBackendError
+from multiprocessing.pool import ThreadPool
+import random
+import threading
+import time
+
+try:
+    from kvcache.backends.asyncbase import import_asyncio
+    asyncio = import_asyncio()
+except InvalidCacheBackendError:
+    asyncio = None
+
+
+@unittest.skipIf(asyncio is None, "asyncio is not available")
+class KVTests(unittest.TestCase):
+    URI = 'locmem://async'
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_until_complete(self, future):
+        return self.loop.run_until_complete(future)
+
+    def test_get_set(self):
+        cache = get_cache(self.URI, asynchronous=True)
+        self.assertTrue(isinstance(cache, AsyncBaseCache))
+        k, v = random.random(), random.random()
+        self.run_until_complete(cache.set(k, v))
+        self.assertEqual(self.run_until_complete(cache.get(k)), v)
+        self.run_until_complete(cache.delete(k))
+        self.assertEqual(self.run_until_complete(cache.get(k)), None)
+        cache.close()
+
+    def test_many(self):
+        cache = get_cache(self.URI + '?asynchronous=1&async_workers=2')
+        data = dict(('key%d' % i, i) for i in range(10))
+        self.run_until_complete(cache.set_many(data))
+        self.assertEqual(self.run_until_complete(cache.get_many(list(data))), data)
+        results = self.run_until_complete(asyncio.gather(
+            *[cache.incr('key%d' % i, 10) for i in range(10)]))
+        self.assertEqual(results, [i + 10 for i in range(10)])
+        self.assertRaises(ValueError, self.run_until_complete, cache.incr('missing'))
+        cache.close()
+
+    def test_sqlite(self):
+        cache = get_cache('sqlite:///tmp/test.db.async', asynchronous=True)
+        self.run_until_complete(cache.set('k', 'v'))
+        self.assertEqual(self.run_until_complete(cache.get('k')), 'v')
+        cache.close()
+
+
+class PoolExecutor(object):
+    "Bounded executor on a ThreadPool, standing in for concurrent.futures."
+    def __init__(self, workers):
+        self.pool = ThreadPool(workers)
+        self.shut_down = False
+
+    def submit(self, func):
+        return PoolFuture(self.pool.apply_async(func))
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+        self.pool.close()
+
+
+class PoolFuture(object):
+    def __init__(self, result):
+        self._result = result
+
+    def result(self, timeout=5):
+        return self._result.get(timeout)
+
+
+class DirectLoop(object):
+    "Hands calls to the executor and returns its futures, like run_in_executor()."
+    def run_in_executor(self, executor, func):
+        return executor.submit(func)
+
+
+class SlowCache(object):
+    "Records how many calls run at once."
+    def __init__(self, cache):
+        self.cache = cache
+        self.running = self.most = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def get(self, key, default=None, version=None):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return self.cache.get(key, default, version=version)
+
+
+class ThreadPoolTests(unittest.TestCase):
+    "The wrapper itself, with an explicit loop: needs neither asyncio nor futures."
+
+    def test_get_set(self):
+        executor = PoolExecutor(2)
+        cache = AsyncBaseCache(get_cache('locmem://async-pool'),
+                               loop=DirectLoop(), executor=executor)
+        cache.set('k', 1).result()
+        self.assertEqual(cache.get('k').result(), 1)
+        cache.set_many({'a': 1, 'b': 2}).result()
+        self.assertEqual(cache.get_many(['a', 'b', 'c']).result(), {'a': 1, 'b': 2})
+        self.assertEqual(cache.incr('a', 10).result(), 11)
+        self.assertRaises(ValueError, cache.incr('missing').result)
+        self.assertTrue(cache.has_key('b').result())
+        cache.delete('k').result()
+        self.assertEqual(cache.get('k').result(), None)
+        cache.close()
+        # Not ours to stop.
+        self.assertFalse(executor.shut_down)
+        executor.shutdown()
+
+    def test_bounded(self):
+        slow = SlowCache(get_cache('locmem://async-bounded'))
+        executor = PoolExecutor(2)
+        cache = AsyncBaseCache(slow, loop=DirectLoop(), executor=executor)
+        futures = [cache.get('k%d' % i) for i in range(8)]
+        self.assertEqual([future.result() for future in futures], [None] * 8)
+        self.assertEqual(slow.most, 2)
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+import random
+from kvcache import get_cache
+from kvcache import bench
+
+
+class KVTests(unittest.TestCase):
+
+    def test_zipf(self):
+        keys = bench.ZipfKeys(100, 1.0)
+        rnd = random.Random(0)
+        draws = [keys.draw(rnd) for i in range(10000)]
+        self.assertTrue(all(0 <= d < 100 for d in draws))
+        # Rank 0 is drawn about twice as often as rank 1.
+        self.assertTrue(draws.count(0) > 1.5 * draws.count(1))
+
+    def test_run(self):
+        cache = get_cache('locmem://bench-test')
+        result = bench.run(cache, threads=2, batch=4, read_ratio=0.5, keys=100,
+                           value_size=(10, 20), duration=10, ops=50)
+        self.assertEqual(result['ops'], 100)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['hit_ratio'], 1.0)
+        self.assertEqual(sorted(result['latency']), ['get_many', 'set_many'])
+        latency = result['latency']['get_many']
+        self.assertTrue(latency['p50'] <= latency['p99'] <= latency['p999'])
+
+    def test_stand_in(self):
+        cache, uri = bench.open_cache('redis://127.0.0.1:6379', stand_in=True, rtt=1)
+        self.assertEqual(uri, 'locmem://bench-redis')
+        cache.set('k', 1)
+        self.assertEqual(cache.get('k'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
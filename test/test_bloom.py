@@ -0,0 +1,126 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache, InvalidCacheBackendError
+from kvcache.utils.bloom import BloomFilter
+import random
+
+from helpers import CountingCache
+
+
+class KVTests(unittest.TestCase):
+    URI = 'bloom://'
+
+    def test_get_set(self):
+        cache = get_cache(self.URI, cache='locmem://bloom-get-set')
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        cache.set('n', 1)
+        self.assertEqual(cache.incr('n'), 2)
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI,
+                          cache='locmem://bloom-get-set', error_rate=2)
+
+    def test_definite_misses(self):
+        inner = CountingCache(get_cache('locmem://bloom-misses'))
+        cache = get_cache(self.URI, cache=inner, warm=1, stats=1)
+        cache.set_many({'a': 1, 'b': 2})
+        inner.reset()
+        self.assertEqual(cache.get('missing'), None)
+        self.assertFalse(cache.has_key('missing'))
+        self.assertEqual(cache.get_many(['x', 'y']), {})
+        self.assertRaises(ValueError, cache.incr, 'missing')
+        self.assertEqual(inner.calls, [])
+        self.assertEqual(cache.get_many(['a', 'b', 'x']), {'a': 1, 'b': 2})
+        self.assertEqual(inner.calls, ['get_many'])
+        # Deleted keys stay in the filter: reading them asks the backend.
+        cache.delete('a')
+        inner.reset()
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(inner.calls, ['get'])
+        stats = cache.stats()['bloom']
+        self.assertEqual(stats['error_rate'], 0.01)
+        self.assertEqual(stats['capacity'], 100000)
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['passed'], 3)
+        self.assertEqual(stats['skipped'], 6)
+        self.assertEqual(stats['backend_misses'], 1)
+
+    def test_delete_false_positive(self):
+        cache = get_cache(self.URI, cache='locmem://bloom-false-positive',
+                          warm=1, capacity=20, error_rate=0.2)
+        data = dict(('key-%d' % i, i) for i in range(20))
+        cache.set_many(data)
+        colliding = [key for key in ('other-%d' % i for i in range(1000))
+                     if cache.make_key(key) in cache.filter]
+        self.assertTrue(colliding)
+        for key in colliding:
+            cache.delete(key)
+        cache.delete_many(colliding)
+        cache.delete('key-0')
+        del data['key-0']
+        self.assertEqual(cache.get_many(data.keys()), data)
+        for key, value in data.items():
+            self.assertTrue(cache.has_key(key))
+            self.assertEqual(cache.incr(key), value + 1)
+
+    def test_filter_before_backend(self):
+        # A read racing a write must not be answered from a filter that
+        # does not know the key yet.
+        seen = []
+
+        class Checking(CountingCache):
+            def call(self, name, method, args, kwargs):
+                if name in ('set', 'add', 'set_many'):
+                    keys = args[0] if name == 'set_many' else [args[0]]
+                    seen.extend(cache.make_key(key) in cache.filter for key in keys)
+                return CountingCache.call(self, name, method, args, kwargs)
+        cache = get_cache(self.URI, cache=Checking(get_cache('locmem://bloom-order')),
+                          warm=1)
+        cache.set('a', 1)
+        cache.add('b', 2)
+        cache.set_many({'c': 3, 'd': 4})
+        self.assertEqual(seen, [True] * 4)
+
+    def test_warm_up(self):
+        inner = get_cache('locmem://bloom-warm-up')
+        inner.set_many({'a': 1, 'b': 2})
+        cache = get_cache(self.URI, cache=inner)
+        # Not warm: the backend is asked.
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get_many(['b', 'c']), {'b': 2})
+        self.assertEqual(cache.stats()['bloom']['skipped'], 0)
+        cache.rebuild(['a'])
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        cache.clear()
+        cache.set('c', 3)
+        self.assertEqual(cache.get_many(['a', 'c']), {'c': 3})
+        self.assertEqual(cache.stats()['bloom']['skipped'], 2)
+
+    def test_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        self.assertEqual(bloom.hashes, 7)
+        self.assertTrue(9000 < bloom.size < 10000)
+        # One bit per position.
+        self.assertEqual(bloom.stats()['bytes'], (bloom.size + 7) // 8)
+        added = sum(1 for i in range(1000) if bloom.add('key-%d' % i))
+        # A few keys already look present when added.
+        self.assertTrue(added > 980, added)
+        self.assertTrue(980 < bloom.count < 1020, bloom.count)
+        for i in range(1000):
+            self.assertTrue('key-%d' % i in bloom)
+        false_positives = sum(1 for i in range(10000) if 'other-%d' % i in bloom)
+        self.assertTrue(false_positives < 200, false_positives)
+        self.assertTrue(0.005 < bloom.false_positive_rate < 0.02)
+        self.assertFalse(bloom.add('key-0'))
+        bloom.clear()
+        self.assertEqual(bloom.count, 0)
+        self.assertFalse(any('key-%d' % i in bloom for i in range(1000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,6 @@
 import sys
 sys.path.insert(0, '..')
 import unittest
-import MySQLdb
 from kvcache import get_cache
 import random
 
@@ -0,0 +1,56 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache
+from kvcache.utils.batch import BatchExecutor
+import random
+import shutil
+import tempfile
+import time
+
+
+class KVTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.URI = 'file://%s' % self.dir
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_get_set(self):
+        cache = get_cache(self.URI)
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        self.assertTrue(cache.has_key(k))
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+
+    def test_many(self):
+        cache = get_cache(self.URI, batch_workers=4)
+        data = dict(('key%d' % i, i) for i in range(20))
+        cache.set_many(data)
+        self.assertEqual(cache.get_many(list(data) + ['missing']), data)
+        cache.delete_many(['key%d' % i for i in range(10)])
+        self.assertEqual(sorted(cache.get_many(data)),
+                         sorted('key%d' % i for i in range(10, 20)))
+
+    def test_batch_overlaps(self):
+        executor = BatchExecutor(4)
+
+        def slow(item):
+            time.sleep(0.1)
+            return item * 2
+
+        start = time.time()
+        self.assertEqual(executor.map(slow, range(4)), [0, 2, 4, 6])
+        self.assertTrue(time.time() - start < 0.3)
+        # Past the deadline the missing results are given up.
+        self.assertEqual(executor.map(slow, range(8), timeout=0.15),
+                         [0, 2, 4, 6, None, None, None, None])
+        self.assertRaises(ZeroDivisionError, executor.map, lambda x: 1 / x, [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+import os
+import subprocess
+import threading
+from kvcache import get_cache, close_all, parse_backend_uri, _instance_key
+
+
+class KVTests(unittest.TestCase):
+
+    def test_reuse(self):
+        cache = get_cache('locmem://registry?max_entries=10')
+        self.assertTrue(get_cache('locmem://registry?max_entries=10') is cache)
+        self.assertTrue(get_cache('LOCMEM://registry', max_entries='10') is cache)
+        self.assertFalse(get_cache('locmem://registry?max_entries=20') is cache)
+        self.assertFalse(get_cache('locmem://registry?max_entries=10', reuse=False) is cache)
+        self.assertTrue(get_cache('locmem://registry', OPTIONS={'A': [1]}) is
+                        get_cache('locmem://registry', OPTIONS={'A': [1]}))
+
+    def test_exact_names(self):
+        get_cache('locmem://Registry-Case').set('k', 'A')
+        self.assertEqual(get_cache('locmem://registry-case').get('k'), None)
+        self.assertFalse(get_cache('locmem://Registry-Case') is
+                         get_cache('locmem://registry-case'))
+        # Host names are not case sensitive, user names are.
+        def key(uri):
+            return _instance_key(*parse_backend_uri(uri))
+        self.assertEqual(key('redis://LOCALHOST:6379'), key('redis://localhost:6379'))
+        self.assertNotEqual(key('mysql://User:pw@localhost/db'),
+                            key('mysql://user:pw@localhost/db'))
+        self.assertNotEqual(key('sqlite:///tmp/Cache.db'), key('sqlite:///tmp/cache.db'))
+
+    def test_close(self):
+        uri = 'locmem://registry-child'
+        child = get_cache(uri)
+        child.set('k', 1)
+        closed = []
+        child.close = lambda **kwargs: closed.append(child)
+        # A composite only closes what it built itself.
+        for composite in (get_cache('sharded://', shards=[uri]),
+                          get_cache('replicated://', replicas=[uri]),
+                          get_cache('near://', remote=uri),
+                          get_cache('tagged://', cache=uri),
+                          get_cache('bloom://', cache=uri)):
+            composite.close()
+            self.assertTrue(get_cache(uri) is child)
+            self.assertEqual(child.get('k'), 1)
+        get_cache('tagged://', cache=child).close()
+        self.assertEqual(closed, [])
+        # Closed directly, an instance leaves the registry.
+        cache = get_cache('tagged://', cache=uri)
+        cache.close()
+        self.assertFalse(get_cache('tagged://', cache=uri) is cache)
+        self.assertEqual(get_cache('tagged://', cache=uri).get('k'), 1)
+
+    def test_threads(self):
+        caches = []
+
+        def work():
+            caches.append(get_cache('locmem://registry-threads'))
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(map(id, caches))), 1)
+
+    def test_close_all(self):
+        closed = []
+        cache = get_cache('locmem://registry-close')
+        cache.close = lambda **kwargs: closed.append(cache)
+        close_all()
+        self.assertEqual(closed, [cache])
+        self.assertFalse(get_cache('locmem://registry-close') is cache)
+
+    def test_fork(self):
+        cache = get_cache('locmem://registry-fork')
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write, '1' if get_cache('locmem://registry-fork') is cache else '0')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), '0')
+        self.assertTrue(get_cache('locmem://registry-fork') is cache)
+
+    def test_lazy_imports(self):
+        # A fresh interpreter: importing kvcache and every backend module,
+        # and using locmem and sqlite, must not load any other driver.
+        code = '''
+import sys
+sys.path.insert(0, %r)
+import kvcache
+from kvcache.utils import importlib
+for module in set(kvcache.BACKENDS.values()):
+    importlib.import_module('kvcache.backends.' + module)
+kvcache.get_cache('locmem://').set('k', 1)
+kvcache.get_cache('sqlite:///tmp/test.db.lazy').set('k', 1)
+drivers = ['MySQLdb', 'django', 'storages', 'boto', 'redis', 'memcache',
+           'pylibmc', 'pymongo', 'bson', 'leveldb', 'dbm']
+print ','.join(m for m in drivers if m in sys.modules)
+''' % os.path.abspath('..')
+        out = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(out.strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
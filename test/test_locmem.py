@@ -1,9 +1,11 @@
 import sys
 sys.path.insert(0, '..')
 import unittest
-import MySQLdb
-from kvcache import get_cache
+from kvcache import get_cache, InvalidCacheBackendError
 import random
+import time
+import threading
+import warnings
 
 
 class KVTests(unittest.TestCase):
@@ -16,7 +18,329 @@ class KVTests(unittest.TestCase):
         self.assertEqual(cache.get(k), v)
         cache.delete(k)
         self.assertEqual(cache.get(k), None)
-        
+
+    def test_lru_policy(self):
+        cache = get_cache('locmem://lru?max_entries=3&policy=lru')
+        for k in 'abc':
+            cache.set(k, k)
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('d'), 'd')
+
+    def test_lfu_policy(self):
+        cache = get_cache('locmem://lfu?max_entries=3&policy=lfu')
+        for k in 'abc':
+            cache.set(k, k)
+        for k in 'aab':
+            cache.get(k)
+        cache.set('d', 'd')
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('b'), 'b')
+
+    def test_tinylfu_admission(self):
+        cache = get_cache('locmem://tinylfu?max_entries=2&policy=tinylfu')
+        cache.set('a', 'a')
+        cache.set('b', 'b')
+        for i in range(5):
+            cache.get('a')
+            cache.get('b')
+        self.assertFalse(cache.add('c', 'c'))
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('b'), 'b')
+
+    def test_segments(self):
+        cache = get_cache('locmem://sharded?segments=4')
+        data = dict(('key%d' % i, i) for i in range(100))
+        for k, v in data.items():
+            cache.set(k, v)
+        for k, v in data.items():
+            self.assertEqual(cache.get(k), v)
+        self.assertEqual(len(cache._segments), 4)
+        self.assertTrue(all(len(s) for s in cache._segments))
+        cache.clear()
+        self.assertFalse(cache.has_key('key1'))
+
+    def test_segment_limits(self):
+        cache = get_cache('locmem://segment_limits?max_entries=5&segments=4')
+        for i in range(100):
+            cache.set('key%d' % i, i)
+        self.assertTrue(len(cache) <= 5)
+        self.assertEqual(sum(s._max_entries for s in cache._segments), 5)
+        self.assertRaises(InvalidCacheBackendError, get_cache,
+                          'locmem://segment_limits_low?max_entries=3&segments=4')
+
+    def test_lock_free_reads(self):
+        cache = get_cache('locmem://lockfree?lock_free_reads=1')
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertTrue(cache.has_key('a'))
+        cache.set('b', 2, timeout=-1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertFalse(cache.has_key('b'))
+
+    def test_sweep(self):
+        cache = get_cache('locmem://sweep?sweep_batch=0&sweep_interval=60')
+        for i in range(10):
+            cache.set('key%d' % i, i, timeout=0)
+        cache.set('live', 1)
+        time.sleep(1.1)
+        self.assertEqual(cache.sweep(), 10)
+        self.assertEqual(sum(len(s) for s in cache._segments), 1)
+        self.assertEqual(cache.get('live'), 1)
+
+    def test_sweep_on_write(self):
+        cache = get_cache('locmem://sweep-on-write?sweep_batch=4')
+        for i in range(4):
+            cache.set('key%d' % i, i, timeout=0)
+        time.sleep(1.1)
+        cache.set('live', 1)
+        self.assertEqual(sum(len(s) for s in cache._segments), 1)
+
+    def test_max_bytes(self):
+        cache = get_cache('locmem://bytes?max_bytes=2000')
+        for i in range(10):
+            cache.set('key%d' % i, 'x' * 400)
+        self.assertTrue(cache.bytes_used <= 2000)
+        self.assertTrue(0 < len(cache) < 10)
+        self.assertEqual(cache.get('key9'), 'x' * 400)
+        self.assertEqual(cache.get('key0'), None)
+        self.assertTrue(cache.entry_overhead > 0)
+        cache.set('huge', 'x' * 5000)
+        self.assertEqual(cache.get('huge'), None)
+        # An overwrite that does not fit must not leave the old value.
+        cache.set('k', 'small')
+        cache.set('k', 'x' * 5000)
+        self.assertEqual(cache.get('k'), None)
+        cache.clear()
+        self.assertEqual(cache.bytes_used, 0)
+
+    def test_store_by_reference(self):
+        cache = get_cache('locmem://byref?serialize=0')
+        value = {'a': [1, 2]}
+        cache.set('k', value)
+        self.assertTrue(cache.get('k') is value)
+
+        cache = get_cache('locmem://byref-shallow?serialize=0&copy_on_read=shallow')
+        cache.set('k', value)
+        got = cache.get('k')
+        self.assertEqual(got, value)
+        self.assertFalse(got is value)
+        self.assertTrue(got['a'] is value['a'])
+
+        cache = get_cache('locmem://byref-deep?serialize=0&copy_on_read=deep')
+        cache.set('k', value)
+        self.assertFalse(cache.get('k')['a'] is value['a'])
+
+    def test_many(self):
+        for uri in ('locmem://many', 'locmem://many-sharded?segments=4',
+                    'locmem://many-lockfree?lock_free_reads=1&serialize=0'):
+            cache = get_cache(uri)
+            data = dict(('key%d' % i, i) for i in range(50))
+            cache.set_many(data)
+            self.assertEqual(cache.get_many(list(data) + ['missing']), data)
+            cache.delete_many(['key%d' % i for i in range(25)])
+            self.assertEqual(sorted(cache.get_many(data)),
+                             sorted('key%d' % i for i in range(25, 50)))
+            cache.set_many({'old': 1}, timeout=-1)
+            self.assertEqual(cache.get_many(['old']), {})
+            # Live keys are refused, expired ones replaced.
+            refused = cache.add_many({'key30': 'x', 'key5': 'y', 'old': 'z'})
+            self.assertEqual(refused, ['key30'])
+            self.assertEqual(cache.get_many(['key30', 'key5', 'old']),
+                             {'key30': 30, 'key5': 'y', 'old': 'z'})
+
+    def test_incr(self):
+        cache = get_cache('locmem://incr')
+        self.assertRaises(ValueError, cache.incr, 'counter')
+        cache.set('counter', 0, timeout=60)
+        key = cache.make_key('counter')
+        exp = cache._segment(key)._expire_info[key]
+
+        def work():
+            for i in range(500):
+                cache.incr('counter')
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cache.get('counter'), 4000)
+        self.assertEqual(cache.decr('counter', 1000), 3000)
+        self.assertEqual(cache._segment(key)._expire_info[key], exp)
+        cache.set('float', 1.5)
+        self.assertEqual(cache.incr('float'), 2.5)
+
+    def test_serializers(self):
+        value = {'a': [1, 2.5, None], 'b': 'text'}
+        for name in ('pickle', 'marshal', 'json'):
+            cache = get_cache('locmem://serializer-%s?serializer=%s' % (name, name))
+            cache.set('k', value)
+            self.assertEqual(cache.get('k'), value)
+        self.assertRaises(InvalidCacheBackendError, get_cache,
+                          'locmem://?serializer=nope')
+
+    def test_compression(self):
+        cache = get_cache('locmem://compressed?compress=zlib&compress_threshold=100')
+        big, small = 'x' * 10000, 'y' * 10
+        cache.set('big', big)
+        cache.set('small', small)
+        self.assertEqual(cache.get('big'), big)
+        self.assertEqual(cache.get('small'), small)
+        self.assertTrue(cache.bytes_used < 1000)
+        self.assertTrue(cache.compression_ratio > 10)
+        plain = get_cache('locmem://compressed')
+        self.assertEqual(plain.compression_ratio, 1.0)
+
+    def test_make_key(self):
+        cache = get_cache('locmem://', KEY_PREFIX='p%s', VERSION=3)
+        self.assertEqual(cache.make_key('k'), 'p%s:3:k')
+        self.assertEqual(cache.make_key(('a', 1)), "p%s:3:('a', 1)")
+        self.assertEqual(cache.make_key('k', version=4), 'p%s:4:k')
+        long_key = 'x' * 300
+        self.assertEqual(cache.make_key(long_key), 'p%s:3:' + long_key)
+        cache = get_cache('locmem://hashed?hash_long_keys=1')
+        made = cache.make_key(long_key)
+        self.assertEqual(len(made), 250)
+        self.assertNotEqual(made, cache.make_key(long_key + 'y'))
+        cache.set(long_key, 1)
+        self.assertEqual(cache.get(long_key), 1)
+
+    def test_validate_key(self):
+        cache = get_cache('locmem://')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            cache.validate_key('good:key')
+            self.assertEqual(len(caught), 0)
+            cache.validate_key('bad key\n')
+            self.assertEqual(len(caught), 1)
+
+    def test_get_or_set(self):
+        cache = get_cache('locmem://get-or-set')
+        calls = []
+
+        def producer():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            cache.get_or_set('k', producer))) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ['value'] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get_or_set('k', producer), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_lease(self):
+        # Another instance (standing in for another process) holds the lease.
+        cache = get_cache('locmem://get-or-set-lease')
+        other = get_cache('locmem://get-or-set-lease')
+        other.add('k', 1, 5, version=other.companion_version(None, 'lease'))
+        threading.Timer(0.1, lambda: other.set('k', 'theirs')).start()
+        self.assertEqual(cache.get_or_set('k', lambda: 'mine'), 'theirs')
+
+    def test_get_or_set_stale(self):
+        cache = get_cache('locmem://get-or-set-stale')
+        cache.get_or_set('k', lambda: 'old', timeout=60, stale_timeout=60)
+        cache.delete('k')
+        cache.add('k', 1, 5, version=cache.companion_version(None, 'lease'))
+        self.assertEqual(cache.get_or_set('k', lambda: 'new', stale_timeout=60), 'old')
+
+    def test_get_or_set_reserved_keys(self):
+        cache = get_cache('locmem://get-or-set-reserved')
+        # User keys named like a lease or a stale copy are left alone.
+        cache.set('lease:k', 'user lease')
+        cache.set('stale:k', 'user stale')
+        self.assertEqual(cache.get_or_set('k', lambda: 'value', stale_timeout=60), 'value')
+        self.assertEqual(cache.get('lease:k'), 'user lease')
+        self.assertEqual(cache.get('stale:k'), 'user stale')
+        cache.delete('k')
+        self.assertEqual(cache.get_or_set('lease:k', lambda: 'other'), 'user lease')
+        cache.delete('lease:k')
+        self.assertEqual(cache.get_or_set('lease:k', lambda: 'other'), 'other')
+
+    def test_get_or_set_xfetch(self):
+        cache = get_cache('locmem://get-or-set-xfetch')
+        calls = []
+
+        def producer():
+            time.sleep(0.01)
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cache.get_or_set('k', producer, timeout=60, beta=1.0), 1)
+        # Far from the expiry a cheap value is not recomputed.
+        self.assertEqual(cache.get_or_set('k', producer, timeout=60, beta=1.0), 1)
+        self.assertEqual(len(calls), 1)
+        # A huge beta makes every read recompute early.
+        self.assertEqual(cache.get_or_set('k', producer, timeout=60, beta=1e12), 2)
+        # Another caller holding the lease: the current value is served.
+        cache.add('k', 1, 5, version=cache.companion_version(None, 'lease'))
+        self.assertEqual(cache.get_or_set('k', producer, timeout=60, beta=1e12), 2)
+        self.assertEqual(len(calls), 2)
+        # Other read paths see the plain value.
+        self.assertEqual(cache.get('k'), 2)
+        self.assertEqual(cache.get_many(['k']), {'k': 2})
+        self.assertEqual(cache.incr('k'), 3)
+        # A user key named like the metadata is neither read nor overwritten.
+        cache.set('xfetch:x', (0, 0))
+        self.assertEqual(cache.get_or_set('x', producer, timeout=60, beta=1.0), 3)
+        self.assertEqual(cache.get_or_set('x', producer, timeout=60, beta=1.0), 3)
+        self.assertEqual(cache.get('xfetch:x'), (0, 0))
+
+    def test_stats(self):
+        cache = get_cache('locmem://stats?stats=1&stats_sample=1')
+        self.assertEqual(get_cache('locmem://stats').stats(), {})
+        cache.set('a', 'x' * 100)
+        cache.get('a')
+        cache.get('missing')
+        cache.get_many(['a', 'b'])
+        self.assertRaises(ValueError, cache.incr, 'missing')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['errors']), (2, 2, 1))
+        get = stats['operations']['get']
+        self.assertEqual((get['calls'], get['hits'], get['misses']), (2, 1, 1))
+        self.assertEqual(stats['operations']['get_many']['calls'], 1)
+        self.assertTrue(0 < get['p50'] <= get['p99'] <= get['p999'])
+        self.assertTrue(stats['bytes_written'] > 100)
+        self.assertTrue(stats['bytes_read'] > 200)
+
+        def work():
+            for i in range(100):
+                cache.get('a')
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cache.stats()['operations']['get']['hits'], 401)
+        # The exited threads' counters are folded into one total.
+        self.assertEqual(len(cache._stats._threads), 1)
+        self.assertEqual(cache.stats()['operations']['get']['hits'], 401)
+        cache.reset_stats()
+        self.assertEqual(cache.stats()['operations'], {})
+
+    def test_stats_sample(self):
+        cache = get_cache('locmem://stats-sample?stats=1&stats_sample=4')
+        for i in range(100):
+            cache.get('a')
+        get = cache.stats()['operations']['get']
+        self.assertEqual((get['calls'], get['misses'], get['timed']), (100, 100, 25))
+        cache = get_cache('locmem://stats-sample?stats=1&stats_sample=0')
+        cache.get('a')
+        get = cache.stats()['operations']['get']
+        self.assertEqual((get['calls'], get['timed'], get['p50']), (1, 0, 0.0))
+
+    def test_unknown_policy(self):
+        self.assertRaises(InvalidCacheBackendError, get_cache,
+                          'locmem://bad?max_entries=3&policy=nope')
+
 
 if __name__ == '__main__':
     unittest.main()        
@@ -1,7 +1,7 @@
 import sys
 sys.path.insert(0, '..')
 import unittest
-from kvcache import get_cache
+from kvcache import get_cache, InvalidCacheBackendError
 import random
 
 
@@ -15,7 +15,13 @@ class KVTests(unittest.TestCase):
         self.assertEqual(cache.get(k), v)
         cache.delete(k)
         self.assertEqual(cache.get(k), None)
-        
+
+    def test_compress(self):
+        cache = get_cache(self.URI, compress='zlib', compress_threshold=100)
+        self.assertEqual(cache._min_compress_len, 100)
+        self.assertEqual(cache.compression_ratio, None)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI, compress='lz4')
+
 
 if __name__ == '__main__':
     unittest.main()        
@@ -0,0 +1,84 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache, InvalidCacheBackendError
+import gc
+import random
+import time
+import weakref
+
+
+class KVTests(unittest.TestCase):
+    URI = 'near://'
+
+    def test_get_set(self):
+        cache = get_cache(self.URI, remote='locmem://near-get-set')
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+
+    def test_tiers(self):
+        remote = get_cache('locmem://near-tiers')
+        cache = get_cache(self.URI, remote=remote)
+        remote.set('k', 1)
+        self.assertEqual(cache.get('k'), 1)
+        self.assertEqual(cache.get('k'), 1)
+        self.assertEqual(cache.get('missing'), None)
+        stats = cache.stats()
+        self.assertEqual(stats['l1'], {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3.0})
+        self.assertEqual(stats['l2'], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        # Written through to the backend.
+        cache.set('w', 2)
+        self.assertEqual(remote.get('w'), 2)
+        cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(cache.get_many(['a', 'b', 'k', 'missing']), {'a': 1, 'b': 2, 'k': 1})
+        cache.reset_stats()
+        self.assertEqual(cache.stats()['l1']['hits'], 0)
+
+    def test_private_l1(self):
+        from kvcache.backends import locmem
+        remote = get_cache('locmem://near-private')
+        known = len(locmem._segments)
+        caches = [get_cache(self.URI, remote=remote, reuse=False) for i in range(10)]
+        caches[0].set('k', 1)
+        self.assertEqual(caches[0].get('k'), 1)
+        self.assertEqual(len(locmem._segments), known)
+        segment = weakref.ref(caches[0].l1._segments[0])
+        del caches
+        gc.collect()
+        self.assertEqual(segment(), None)
+
+    def test_l1_timeout(self):
+        remote = get_cache('locmem://near-l1-timeout')
+        cache = get_cache(self.URI, remote=remote, l1_timeout='0.2')
+        cache.set('k', 1)
+        remote.set('k', 2)
+        self.assertEqual(cache.get('k'), 1)
+        time.sleep(0.3)
+        self.assertEqual(cache.get('k'), 2)
+
+    def test_version_invalidation(self):
+        # Two nodes: two private instances.
+        options = dict(remote='locmem://near-version', invalidation='version',
+                       stamp_interval=0, reuse=False)
+        node1 = get_cache(self.URI, **options)
+        node2 = get_cache(self.URI, **options)
+        node1.set('k', 1)
+        self.assertEqual(node2.get('k'), 1)
+        node1.set('k', 2)
+        self.assertEqual(node2.get('k'), 2)
+        self.assertEqual(node1.get('k'), 2)
+        self.assertEqual(node1.stats()['l1']['hits'], 1)
+        node2.incr('k')
+        self.assertEqual(node1.get('k'), 3)
+
+    def test_invalid(self):
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI,
+                          remote='locmem://', invalidation='pubsub')
+
+
+if __name__ == '__main__':
+    unittest.main()
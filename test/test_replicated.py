@@ -0,0 +1,164 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache, InvalidCacheBackendError
+import random
+import threading
+import time
+
+from helpers import CountingCache
+
+
+class FlakyCache(CountingCache):
+    "Passes calls through to a cache, after ``delay`` seconds or raising."
+    def __init__(self, cache):
+        CountingCache.__init__(self, cache)
+        self.delay = 0
+        self.broken = False
+        self.gets = 0
+
+    def call(self, name, method, args, kwargs):
+        if name == 'get':
+            self.gets += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.broken:
+            raise IOError('replica is broken')
+        return CountingCache.call(self, name, method, args, kwargs)
+
+
+class KVTests(unittest.TestCase):
+    URI = 'replicated://'
+
+    def replicas(self, name, count=2):
+        return [FlakyCache(get_cache('locmem://replicated-%s-%d' % (name, i)))
+                for i in range(count)]
+
+    def test_get_set(self):
+        uris = ['locmem://replicated-get-set-%d' % i for i in range(3)]
+        cache = get_cache(self.URI, replicas=','.join(uris))
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        for uri in uris:
+            self.assertEqual(get_cache(uri).get(k), v)
+        cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(cache.incr('a'), 2)
+        self.assertEqual([get_cache(uri).get('a') for uri in uris], [2, 2, 2])
+        self.assertRaises(ValueError, cache.incr, 'missing')
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI)
+
+    def test_failover(self):
+        replicas = self.replicas('failover')
+        cache = get_cache(self.URI, replicas=replicas, retry_interval=60)
+        cache.set('k', 1)
+        cache.replicas[1].latency = 1.0
+        replicas[0].broken = True
+        self.assertEqual(cache.get('k'), 1)
+        stats = cache.stats()['replicas']
+        self.assertFalse(stats['replica-0']['up'])
+        self.assertTrue(stats['replica-1']['up'])
+        # Down replicas are skipped.
+        gets = replicas[0].gets
+        self.assertEqual(cache.get('k'), 1)
+        self.assertEqual(replicas[0].gets, gets)
+
+    def test_stalled_replica(self):
+        replicas = self.replicas('stalled')
+        cache = get_cache(self.URI, replicas=replicas, slow_timeout=0.05, retry_interval=60)
+        cache.set('k', 1)
+        cache.replicas[1].latency = 1.0
+        replicas[0].delay = 0.5
+        start = time.time()
+        self.assertEqual(cache.get('k'), 1)
+        self.assertTrue(time.time() - start < 0.3)
+        self.assertFalse(cache.replicas[0].up(time.time()))
+        start = time.time()
+        self.assertEqual(cache.get('k'), 1)
+        self.assertTrue(time.time() - start < 0.05)
+
+    def test_hedge(self):
+        replicas = self.replicas('hedge')
+        cache = get_cache(self.URI, replicas=replicas, hedge=0.9, slow_timeout=2)
+        cache.set('k', 1)
+        cache.replicas[1].latency = 0.01
+        for i in range(50):
+            cache.get('k')
+        self.assertEqual(replicas[1].gets, 0)
+        replicas[0].delay = 0.3
+        start = time.time()
+        self.assertEqual(cache.get('k'), 1)
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertEqual(replicas[1].gets, 1)
+        # Slow, but not down: once the first read is back, the other
+        # replica is the faster one.
+        time.sleep(0.35)
+        self.assertTrue(cache.replicas[0].up(time.time()))
+        gets = replicas[0].gets
+        self.assertEqual(cache.get('k'), 1)
+        self.assertEqual(replicas[0].gets, gets)
+        self.assertEqual(replicas[1].gets, 2)
+
+    def test_catch_up(self):
+        replicas = self.replicas('catch-up')
+        cache = get_cache(self.URI, replicas=replicas, retry_interval=0.1)
+        cache.set_many({'a': 1, 'b': 2})
+        replicas[1].broken = True
+        cache.set('a', 3)
+        replicas[1].broken = False
+        cache.delete('b')
+        self.assertEqual(replicas[1].cache.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        time.sleep(0.15)
+        cache.get('a')
+        self.assertEqual(replicas[1].cache.get_many(['a', 'b']), {})
+
+    def test_clear_while_down(self):
+        replicas = self.replicas('clear-down')
+        cache = get_cache(self.URI, replicas=replicas, retry_interval=0.1)
+        cache.set_many({'a': 1, 'b': 2})
+        replicas[1].broken = True
+        cache.set('c', 3)
+        cache.clear()
+        replicas[1].broken = False
+        self.assertEqual(replicas[1].cache.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        time.sleep(0.15)
+        cache.get('a')
+        self.assertEqual(replicas[1].cache.get_many(['a', 'b', 'c']), {})
+
+    def test_close(self):
+        uris = ['locmem://replicated-close-%d' % i for i in range(2)]
+        before = set(threading.enumerate())
+        cache = get_cache(self.URI, replicas=','.join(uris), reuse=False)
+        cache.set_many({'a': 1, 'b': 2})
+        workers = set(threading.enumerate()) - before
+        self.assertTrue(workers)
+        cache.close()
+        for worker in workers:
+            worker.join(1)
+            self.assertFalse(worker.is_alive())
+        # Closed caches start new threads if used again.
+        cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(cache.get('a'), 1)
+        cache.close()
+
+    def test_incr_missing(self):
+        replicas = self.replicas('incr-missing')
+        cache = get_cache(self.URI, replicas=replicas)
+        self.assertRaises(ValueError, cache.incr, 'missing')
+        for replica in cache.replicas:
+            self.assertTrue(replica.up(time.time()))
+            self.assertEqual(replica.missed, set())
+        # Missing on one replica only: it is brought back in step.
+        cache.set('n', 1)
+        replicas[1].cache.delete('n')
+        self.assertEqual(cache.incr('n'), 2)
+        self.assertEqual(cache.replicas[1].missed, set([('n', None)]))
+        cache.get('n')
+        self.assertEqual(replicas[1].cache.get('n'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache, InvalidCacheBackendError
+from kvcache.utils.hashring import HashRing
+import random
+
+from helpers import CountingCache
+
+
+class KVTests(unittest.TestCase):
+    URI = 'sharded://'
+
+    def shard_uris(self, name, count=3):
+        return ['locmem://sharded-%s-%d' % (name, i) for i in range(count)]
+
+    def test_get_set(self):
+        cache = get_cache(self.URI, shards=self.shard_uris('get-set'))
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        self.assertTrue(cache.has_key(k))
+        self.assertEqual(cache.get_shard(k).get(k), v)
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+        cache.set('n', 1)
+        self.assertEqual(cache.incr('n'), 2)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI)
+
+    def test_uri(self):
+        uris = self.shard_uris('uri', 2)
+        cache = get_cache('%s?shards=%s' % (self.URI, ','.join(uris)))
+        self.assertEqual(sorted(cache.shards), uris)
+
+    def test_spread(self):
+        uris = self.shard_uris('spread', 4)
+        cache = get_cache(self.URI, shards=uris)
+        data = dict(('key-%d' % i, i) for i in range(2000))
+        cache.set_many(data)
+        self.assertEqual(cache.get_many(data.keys()), data)
+        for uri in uris:
+            held = len(get_cache(uri).get_many(data.keys()))
+            self.assertTrue(300 < held < 700, held)
+        cache.delete_many(data.keys())
+        self.assertEqual(cache.get_many(data.keys()), {})
+        # The order of the list does not matter.
+        other = get_cache(self.URI, shards=list(reversed(uris)), reuse=False)
+        for key in list(data)[:100]:
+            self.assertEqual(cache.ring.get_node(cache.make_key(key)),
+                             other.ring.get_node(other.make_key(key)))
+
+    def test_rebalance(self):
+        keys = ['key-%d' % i for i in range(10000)]
+        ring = HashRing(['a', 'b', 'c', 'd'])
+        before = dict((key, ring.get_node(key)) for key in keys)
+        ring.add_node('e')
+        after = dict((key, ring.get_node(key)) for key in keys)
+        moved = [key for key in keys if before[key] != after[key]]
+        # About 1/5 of the keys move, and only to the new shard.
+        self.assertTrue(0.15 < len(moved) / float(len(keys)) < 0.25, len(moved))
+        self.assertEqual(set(after[key] for key in moved), set(['e']))
+        ring.remove_node('e')
+        self.assertEqual(dict((key, ring.get_node(key)) for key in keys), before)
+
+    def test_batch_per_shard(self):
+        shards = [CountingCache(get_cache(uri)) for uri in self.shard_uris('batch')]
+        cache = get_cache(self.URI, shards=shards)
+        data = dict(('key-%d' % i, i) for i in range(100))
+        cache.set_many(data)
+        self.assertEqual(cache.get_many(data.keys()), data)
+        cache.delete_many(data.keys())
+        for shard in shards:
+            self.assertEqual(shard.calls, ['set_many', 'get_many', 'delete_many'])
+            held = sorted(shard.args[0][0])
+            self.assertTrue(held)
+            self.assertEqual(held, sorted(shard.args[1][0]))
+            self.assertEqual(held, sorted(shard.args[2][0]))
+        self.assertEqual(sum(len(shard.args[0][0]) for shard in shards), len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import sys
+sys.path.insert(0, '..')
+import os
+import unittest
+from kvcache import get_cache
+from kvcache.backends.shm import ItemTooLarge
+import random
+
+
+class KVTests(unittest.TestCase):
+    URI = 'shm://kvcache-test?size=1M'
+
+    def setUp(self):
+        get_cache(self.URI).clear()
+
+    def test_get_set(self):
+        cache = get_cache(self.URI)
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+
+    def test_add_and_expiry(self):
+        cache = get_cache(self.URI)
+        self.assertTrue(cache.add('a', 1))
+        self.assertFalse(cache.add('a', 2))
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('b', 1, timeout=-1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertTrue(cache.add('b', 2))
+
+    def test_too_big(self):
+        cache = get_cache(self.URI)
+        self.assertFalse(cache.set('big', 'x' * 4096))
+        self.assertEqual(cache.get('big'), None)
+        # Overwriting with a value too big drops the old one.
+        cache.set('k', 'small')
+        self.assertFalse(cache.set('k', 'x' * 4096))
+        self.assertEqual(cache.get('k'), None)
+        # add() of a value too big leaves a live value alone.
+        cache.set('k', 'small')
+        self.assertFalse(cache.add('k', 'x' * 4096))
+        self.assertEqual(cache.get('k'), 'small')
+        cache.set('n', 10 ** 800)
+        self.assertRaises(ItemTooLarge, cache.incr, 'n', 10 ** 4000)
+        self.assertEqual(cache.get('n'), 10 ** 800)
+
+    def test_shared_between_processes(self):
+        cache = get_cache(self.URI)
+        cache.set('counter', 0)
+        children = []
+        for i in range(4):
+            pid = os.fork()
+            if pid == 0:
+                child = get_cache(self.URI)
+                for j in range(50):
+                    child.incr('counter')
+                child.set('child%d' % i, i)
+                os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+        self.assertEqual(cache.get('counter'), 200)
+        self.assertEqual(cache.get_many(['child%d' % i for i in range(4)]),
+                         dict(('child%d' % i, i) for i in range(4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
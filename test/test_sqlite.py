@@ -1,9 +1,9 @@
 import sys
 sys.path.insert(0, '..')
 import unittest
-import MySQLdb
 from kvcache import get_cache
 import random
+import threading
 
 
 class KVTests(unittest.TestCase):
@@ -15,6 +15,48 @@ class KVTests(unittest.TestCase):
         cache.set(k, v)
         self.assertEqual(cache.get(k), v)
 
+    def test_many(self):
+        cache = get_cache(self.URI)
+        data = dict(('key%d' % i, i) for i in range(10))
+        cache.set_many(data)
+        self.assertEqual(cache.get_many(list(data) + ['missing']), data)
+        cache.delete_many(['key%d' % i for i in range(5)])
+        self.assertEqual(sorted(cache.get_many(data)),
+                         sorted('key%d' % i for i in range(5, 10)))
+
+    def test_many_chunked(self):
+        # More keys than one statement may bind.
+        cache = get_cache(self.URI, reuse=False)
+        cache.max_query_params = 7
+        data = dict(('chunk%d' % i, i) for i in range(50))
+        cache.set_many(data)
+        self.assertEqual(cache.get_many(list(data)), data)
+        cache.delete_many(list(data))
+        self.assertEqual(cache.get_many(list(data)), {})
+
+    def test_threads(self):
+        cache = get_cache(self.URI)
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(30):
+                    key = 'thread%d-%d' % (n, i)
+                    cache.set(key, i)
+                    if cache.get(key) != i:
+                        errors.append('%s: lost' % key)
+                    cache.delete(key)
+                    if cache.get(key) is not None:
+                        errors.append('%s: not deleted' % key)
+            except Exception, e:
+                errors.append(repr(e))
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
 if __name__ == '__main__':
     unittest.main()        
 
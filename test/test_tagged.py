@@ -0,0 +1,105 @@
+import sys
+sys.path.insert(0, '..')
+import unittest
+from kvcache import get_cache, InvalidCacheBackendError
+import random
+
+from helpers import CountingCache
+
+
+class KVTests(unittest.TestCase):
+    URI = 'tagged://'
+
+    def test_get_set(self):
+        cache = get_cache(self.URI, cache='locmem://tagged-get-set')
+        k, v = random.random(), random.random()
+        cache.set(k, v)
+        self.assertEqual(cache.get(k), v)
+        cache.set('n', 1)
+        self.assertEqual(cache.incr('n'), 2)
+        cache.delete(k)
+        self.assertEqual(cache.get(k), None)
+        self.assertRaises(InvalidCacheBackendError, get_cache, self.URI)
+
+    def test_invalidate_tag(self):
+        cache = get_cache(self.URI, cache='locmem://tagged-invalidate')
+        cache.set('a', 1, tags=['user:1'])
+        cache.set('b', 2, tags=['user:1', 'page:home'])
+        cache.set_many({'c': 3, 'd': 4}, tags=['page:home'])
+        cache.set('e', 5)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.get_many(['a', 'b', 'c', 'd', 'e']),
+                         {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5})
+        cache.invalidate_tag('page:home')
+        self.assertEqual(cache.get_many(['a', 'b', 'c', 'd', 'e']), {'a': 1, 'e': 5})
+        self.assertEqual(cache.get('c', 'gone'), 'gone')
+        self.assertFalse(cache.has_key('b'))
+        # Stored again after the invalidation: valid.
+        cache.set('c', 6, tags=['page:home'])
+        self.assertEqual(cache.get('c'), 6)
+        cache.invalidate_tag('unknown')
+        # Tags are per version, like keys.
+        cache.set('a', 7, version=2, tags=['user:1'])
+        cache.invalidate_tag('user:1')
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('a', version=2), 7)
+
+    def test_evicted_generation(self):
+        inner = get_cache('locmem://tagged-evicted')
+        cache = get_cache(self.URI, cache=inner)
+        cache.set('a', 1, tags=['t'])
+        inner.delete(cache.tag_key('t'), version=cache.tag_version())
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', 2, tags=['t'])
+        self.assertEqual(cache.get('a'), 2)
+
+    def test_one_fetch(self):
+        inner = CountingCache(get_cache('locmem://tagged-one-fetch'))
+        cache = get_cache(self.URI, cache=inner)
+        data = dict(('key-%d' % i, i) for i in range(50))
+        for key, value in data.items():
+            cache.set(key, value, tags=['tag-%d' % (value % 7), 'all'])
+        inner.reset()
+        self.assertEqual(cache.get_many(data.keys()), data)
+        self.assertEqual(inner.calls, ['get_many', 'get_many'])
+        inner.reset()
+        cache.invalidate_tag('all')
+        self.assertEqual(inner.calls, ['incr'])
+        self.assertEqual(cache.get_many(data.keys()), {})
+
+    def test_batched_generations(self):
+        inner = CountingCache(get_cache('locmem://tagged-batched?segments=4'))
+        cache = get_cache(self.URI, cache=inner)
+        cache.set('a', 1, tags=['t1'])
+        inner.reset()
+        cache.set('b', 2, tags=['t1', 't2', 't3', 't4'])
+        self.assertEqual(inner.calls, ['get_many', 'add_many', 'set'])
+        self.assertEqual(cache.get('b'), 2)
+
+        class Racing(CountingCache):
+            "Another writer creates a generation just before add_many."
+            def call(self, name, method, args, kwargs):
+                if name == 'add_many':
+                    key = sorted(args[0])[0]
+                    self.cache.set(key, 42, version=kwargs['version'])
+                return CountingCache.call(self, name, method, args, kwargs)
+        inner = Racing(get_cache('locmem://tagged-racing'))
+        cache = get_cache(self.URI, cache=inner)
+        cache.set('a', 1, tags=['t1', 't2', 't3'])
+        self.assertEqual(inner.calls, ['get_many', 'add_many', 'get_many', 'set'])
+        self.assertEqual(cache.get('a'), 1)
+        cache.invalidate_tag('t1')
+        self.assertEqual(cache.get('a'), None)
+
+    def test_reserved_tag_keys(self):
+        cache = get_cache(self.URI, cache='locmem://tagged-reserved')
+        cache.set('a', 1, tags=['x'])
+        cache.set(cache.tag_key('x'), 'user value')
+        cache.delete(cache.tag_key('x'))
+        self.assertEqual(cache.get('a'), 1)
+        cache.invalidate_tag('x')
+        self.assertEqual(cache.get('a'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()